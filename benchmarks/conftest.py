@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+from __future__ import annotations
+from pathlib import Path
+import tracemalloc
+from typing import Callable, Iterator
+
+import pytest
+
+try:
+    import pytest_benchmark
+except ImportError:  # optional dependency: pip install ncbi-counts[dev]
+    pytest_benchmark = None
+
+from ncbi_counts import utils
+from ncbi_counts.types import PairRegex
+
+from .synthetic import SCALES, Scale, serve_directory, write_bench_series
+
+if pytest_benchmark is None:
+    collect_ignore_glob = ["test_*.py"]
+
+
+def pytest_addoption(parser: pytest.Parser):
+    # registered only when this directory is given on the command line
+    parser.addoption(
+        "--scale",
+        default="small",
+        help=f"Scale of the synthetic series ({', '.join(SCALES)}, or GENESxGSMSxPAIRS, default: small)",
+    )
+    parser.addoption(
+        "--rounds",
+        type=int,
+        default=3,
+        help="Number of timed rounds of each stage (default: 3)",
+    )
+
+
+@pytest.fixture(scope="session")
+def scale(request: pytest.FixtureRequest) -> Scale:
+    return Scale.parse(request.config.getoption("--scale", default="small"))
+
+
+@pytest.fixture(scope="session")
+def remote(
+    tmp_path_factory: pytest.TempPathFactory, scale: Scale
+) -> Iterator[tuple[str, list[PairRegex]]]:
+    """Serve a synthetic series from a local stand-in of NCBI, and point URLs to it."""
+    remote_dir = tmp_path_factory.mktemp("remote")
+    pair_regex_list = write_bench_series(remote_dir, scale)
+    with serve_directory(remote_dir) as url, pytest.MonkeyPatch.context() as mp:
+        mp.setattr(utils, "GEO_DOWNLOAD_BASE", url + "/geo/download/?")
+        mp.setattr(utils, "GEO_FTP_BASE", url + "/geo")
+        yield url, pair_regex_list
+
+
+@pytest.fixture
+def src_dir(tmp_path: Path) -> Path:
+    return tmp_path.joinpath("raw")
+
+
+@pytest.fixture
+def run_stage(benchmark, request: pytest.FixtureRequest, scale: Scale) -> Callable:
+    """Time a stage, and record its peak memory (traced by tracemalloc) in an untimed run.
+
+    The stage is run by `setup()` then `func()` in each round, and the result of the
+    last round is returned.
+    """
+    rounds = request.config.getoption("--rounds", default=3)
+
+    def run(func: Callable, setup: Callable[[], object] | None = None):
+        def _untimed():
+            # pedantic() would pass what setup() returns as arguments of func()
+            setup()
+
+        if setup is not None:
+            setup()
+        tracemalloc.start()
+        try:
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info["scale"] = str(scale)
+        benchmark.extra_info["peak_memory_mib"] = round(peak / 2**20, 2)
+        return benchmark.pedantic(
+            func, setup=setup and _untimed, rounds=rounds, iterations=1
+        )
+
+    return run
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+from __future__ import annotations
+from contextlib import contextmanager
+from dataclasses import dataclass
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import re
+import shutil
+import threading
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+from ncbi_counts.types import GseAcc, GsmAcc, PairRegex, StrPath
+from ncbi_counts.utils import get_annot_url, get_count_url, parse_filename_from_url
+from tests.synthetic import gene_ids, write_annot, write_soft
+
+BENCH_GSE = "GSE900001"
+# genes x GSMs x pairs of each preset scale
+SCALES: dict[str, tuple[int, int, int]] = {
+    "small": (2_000, 24, 4),
+    "medium": (40_000, 100, 10),
+    "large": (40_000, 1_000, 50),
+    "xlarge": (40_000, 10_000, 200),
+}
+SCALE_RE = re.compile(r"(\d+)x(\d+)x(\d+)")
+
+
+@dataclass(frozen=True)
+class Scale:
+    """Size of a synthetic series."""
+
+    n_genes: int
+    n_gsms: int
+    n_pairs: int
+
+    @classmethod
+    def parse(cls, text: str) -> Scale:
+        """Parse a preset name (e.g. "large") or GENESxGSMSxPAIRS (e.g. "40000x1000x200")."""
+        if text in SCALES:
+            return cls(*SCALES[text])
+        match = SCALE_RE.fullmatch(text)
+        if match is None:
+            raise ValueError(
+                f"Unknown scale: {text} (choices: {', '.join(SCALES)}, or GENESxGSMSxPAIRS)"
+            )
+        scale = cls(*map(int, match.groups()))
+        if scale.n_gsms < 2 * scale.n_pairs:
+            raise ValueError(f"Each pair needs at least two GSMs: {text}")
+        return scale
+
+    def __str__(self) -> str:
+        return f"{self.n_genes}x{self.n_gsms}x{self.n_pairs}"
+
+
+def pair_attributes(
+    gse_acc: GseAcc, scale: Scale
+) -> tuple[dict[GsmAcc, dict[str, list[str]]], list[PairRegex]]:
+    """Generate Sample attributes of GSMs spread over pairs, and the regex of the pairs."""
+    gse_num = int(gse_acc[3:])
+    attributes: dict[GsmAcc, dict[str, list[str]]] = {}
+    for i in range(scale.n_gsms):
+        pair, group = divmod(i % (2 * scale.n_pairs), 2)
+        gsm = f"GSM{gse_num * 100_000 + i}"
+        attributes[gsm] = {
+            "title": [f"P{pair}_{('ctrl', 'trt')[group]}_{i}"],
+            "geo_accession": [gsm],
+            "characteristics_ch1": [f"pair: {pair}", f"replicate: {i}"],
+        }
+    pair_regex_list = [
+        {
+            "control": {"title": f"^P{pair}_ctrl_"},
+            "treatment": {"title": f"^P{pair}_trt_"},
+        }
+        for pair in range(scale.n_pairs)
+    ]
+    return attributes, pair_regex_list
+
+
+def write_large_count(
+    count_path: StrPath,
+    gsms: list[GsmAcc],
+    genes: list[int],
+    seed: int = 0,
+    chunksize: int = 2**12,
+) -> Path:
+    """Write a raw count matrix (40% zeros) in chunks of rows, so any size fits in memory."""
+    rng = np.random.default_rng(seed)
+    with gzip.open(
+        count_path, "wt", encoding="utf-8", newline="\n", compresslevel=1
+    ) as f:
+        for start in range(0, len(genes), chunksize):
+            index = pd.Index(genes[start : start + chunksize], name="GeneID")
+            counts = rng.integers(1, 5000, size=(len(index), len(gsms)), dtype=np.int32)
+            counts[rng.random(counts.shape) < 0.4] = 0
+            pd.DataFrame(counts, index=index, columns=gsms).to_csv(
+                f, sep="\t", lineterminator="\n", header=start == 0
+            )
+    return Path(count_path)
+
+
+def write_bench_series(
+    src_dir: StrPath, scale: Scale, gse_acc: GseAcc = BENCH_GSE
+) -> list[PairRegex]:
+    """Write SOFT, count and annotation files of a series of the given scale.
+
+    Returns:
+        list[PairRegex]: regex matching the pairs of the series.
+    """
+    src_dir = Path(src_dir)
+    src_dir.mkdir(parents=True, exist_ok=True)
+    attributes, pair_regex_list = pair_attributes(gse_acc, scale)
+    genes = gene_ids(scale.n_genes)
+    write_soft(src_dir.joinpath(f"{gse_acc}_family.soft.gz"), gse_acc, attributes)
+    count_url = get_count_url(gse_acc)
+    write_large_count(
+        src_dir.joinpath(parse_filename_from_url(count_url)), list(attributes), genes
+    )
+    write_annot(src_dir.joinpath(parse_filename_from_url(get_annot_url())), genes)
+    return pair_regex_list
+
+
+class DirectoryHandler(BaseHTTPRequestHandler):
+    """Serve the files of `directory` at NCBI URLs resolving to their names."""
+
+    protocol_version = "HTTP/1.1"
+    directory: Path = Path()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        try:
+            path = self.directory.joinpath(parse_filename_from_url(self.path))
+        except ValueError:
+            path = None
+        if path is None or not path.is_file():
+            self.send_error(404)
+            return
+        stat = path.stat()
+        self.send_response(200)
+        self.send_header("ETag", f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"')
+        self.send_header("Content-Length", str(stat.st_size))
+        self.end_headers()
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile)
+
+
+@contextmanager
+def serve_directory(directory: StrPath) -> Iterator[str]:
+    """Run a local stand-in of NCBI serving the files of a directory."""
+    handler = type("Handler", (DirectoryHandler,), {"directory": Path(directory)})
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from ncbi_counts.core import Series
+from ncbi_counts.types import PairRegex
+from ncbi_counts.utils import (
+    PairCountIndex,
+    construct_pair_count,
+    get_count_dataframe,
+    remove_download,
+)
+
+from .synthetic import BENCH_GSE
+
+
+@pytest.fixture
+def series(
+    remote: tuple[str, list[PairRegex]], src_dir: Path, tmp_path: Path
+) -> Series:
+    _, pair_regex_list = remote
+    series = Series(
+        BENCH_GSE,
+        [pair_regex.copy() for pair_regex in pair_regex_list],
+        keep_annot=["Symbol"],
+        src_dir=src_dir,
+        save_to=tmp_path.joinpath("count"),
+    )
+    series.match()
+    return series
+
+
+def test_set_gse_info(run_stage, series: Series) -> None:
+    # download and parse the SOFT file in each round
+    run_stage(series._set_gse_info, setup=lambda: remove_download(series.soft_path))
+    assert len(series.gsm_metadata) > 0
+
+
+def test_match_pair_samples(run_stage, series: Series) -> None:
+    pair_regex_list = series.pair_regex_list
+
+    def setup():
+        series.pair_regex_list = pair_regex_list.copy()
+        series.pair_gsms_list = []
+
+    run_stage(series._match_pair_samples, setup=setup)
+    assert len(series.pair_gsms_list) == len(pair_regex_list)
+
+
+def test_get_count_dataframe(run_stage, series: Series) -> None:
+    # download and read the count file in each round
+    count = run_stage(
+        lambda: get_count_dataframe(
+            series.count_url, series.count_path, silent=True, gsms=series._pair_gsms()
+        ),
+        setup=lambda: remove_download(series.count_path),
+    )
+    assert count.shape[1] == len(series._pair_gsms())
+
+
+def test_construct_pair_count(run_stage, series: Series) -> None:
+    series.fetch_counts()
+
+    def construct_pair_counts() -> list[pd.DataFrame]:
+        # as `Series` does, the index of the count matrix is shared by its pairs
+        count_index = PairCountIndex.from_count(series.count, annot=series.annot)
+        return [
+            construct_pair_count(
+                pair_gsms,
+                series.count,
+                annot=series.annot,
+                sep=series.str_sep,
+                count_index=count_index,
+            )
+            for pair_gsms in series.pair_gsms_list
+        ]
+
+    pair_count_list = run_stage(construct_pair_counts)
+    assert len(pair_count_list) == len(series.pair_gsms_list)
+
+
+def test_save_pair_count(run_stage, series: Series) -> None:
+    series.write()
+    run_stage(series._save_pair_count)
+    assert all(path.is_file() for path in series.pair_count_path_list)
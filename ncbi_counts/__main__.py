@@ -1,13 +1,269 @@
 #!/usr/bin/env python
 
+from dataclasses import dataclass, field
 from pathlib import Path
+import sys
+from typing import Iterable, Iterator
 import warnings
 
+from yaml import safe_dump
+
+from .combine import combine_series
 from .core import Series
-from .load import load_input
+from .instrument import StageEvent, StageHook, open_hooks, stage
+from .load import iter_input
+from .manifest import RunManifest, get_source_paths, hash_inputs
+from .parallel import iter_series
 from .parser import parse_args
-from .types import AnnotColumns, CountNorm, GseAcc, PairGsms, StrPath
+from .scheduler import NCBI_RATE_LIMIT
+from .shard import Shard, iter_shard
+from .types import (
+    AnnotColumns,
+    Compression,
+    CountCache,
+    CountNorm,
+    GseAcc,
+    OutputFormat,
+    PairGsms,
+    PairRegex,
+    StrPath,
+)
 from .utils import save_yaml
+from .writer import check_output_format, get_pair_count_suffix, write_pair_counts
+
+
+def _read_input(
+    geo_regex_path: StrPath, emit: StageHook
+) -> Iterator[tuple[GseAcc, list[PairRegex]]]:
+    """Read series from an input file one at a time, reporting each as a "load_input" stage."""
+    entries = iter_input(geo_regex_path)
+    while True:
+        events: list[StageEvent] = []
+        entry = None
+        try:
+            with stage("load_input", emit=events.append) as event:
+                entry = next(entries, None)
+                if entry is not None:
+                    event.gse_acc, event.rows = entry[0], len(entry[1])
+        finally:
+            # reaching the end of the file is not a stage
+            if entry is not None or any(e.error for e in events):
+                for e in events:
+                    emit(e)
+        if entry is None:
+            return
+        yield entry
+
+
+# settings the outputs of a series depend on, hashed with its pair regex
+INPUT_SETTINGS = (
+    "count_norm_type",
+    "count_annot_ver",
+    "keep_annot",
+    "str_sep",
+    "compression",
+    "output_format",
+    "consolidate",
+    "local_norm",
+)
+# settings the source files of a series depend on
+SOURCE_SETTINGS = (
+    "src_dir",
+    "count_norm_type",
+    "count_annot_ver",
+    "keep_annot",
+    "local_norm",
+)
+
+
+@dataclass
+class _Run:
+    """Series of a run in input order, with the state shared by all modes of `main`."""
+
+    series_kwargs: dict
+    hooks: list[StageHook] = field(default_factory=list)
+    incremental: bool = False
+    manifest: RunManifest | None = None  # series of this run (or shard)
+    merged: RunManifest | None = None  # series of all shards
+    gse_accs: list[GseAcc] = field(default_factory=list)
+    series_dict: dict[GseAcc, Series] = field(default_factory=dict)
+    pair_gsms_dict: dict[GseAcc, list[PairGsms]] = field(default_factory=dict)
+    inputs_dict: dict[GseAcc, str] = field(default_factory=dict)
+    source_paths_dict: dict[GseAcc, list[Path]] = field(default_factory=dict)
+
+    def emit(self, event: StageEvent):
+        for hook in self.hooks:
+            hook(event)
+
+    def emit_series(self, series: Series):
+        # stages of a series are reported once it is processed, in input order
+        for event in series.stage_events:
+            self.emit(event)
+        self.series_dict[series.gse_acc] = series
+
+    def new_series(
+        self, gse: GseAcc, pair_regex_list: list[PairRegex], **kwargs
+    ) -> Series:
+        return Series(
+            gse_acc=gse,
+            pair_regex_list=pair_regex_list.copy(),
+            **{**self.series_kwargs, **kwargs},
+        )
+
+    def check_entries(
+        self, entries: Iterable[tuple[GseAcc, list[PairRegex]]]
+    ) -> Iterator[tuple[GseAcc, list[PairRegex], bool]]:
+        """Record each series of the input, yielding it with whether it is up to date."""
+        input_settings = {key: self.series_kwargs[key] for key in INPUT_SETTINGS}
+        source_settings = {key: self.series_kwargs[key] for key in SOURCE_SETTINGS}
+        for gse, pair_regex_list in entries:
+            self.gse_accs.append(gse)
+            self.inputs_dict[gse] = hash_inputs(pair_regex_list, **input_settings)
+            self.source_paths_dict[gse] = get_source_paths(gse, **source_settings)
+            manifest, merged = self.manifest, self.merged
+            if manifest is not merged and gse not in manifest.entries:
+                # recorded by a shard of an earlier run, merged since
+                if gse in merged.entries:
+                    manifest.entries[gse] = merged.entries[gse]
+            up_to_date = (
+                self.incremental
+                and manifest is not None
+                and manifest.is_up_to_date(
+                    gse, self.inputs_dict[gse], self.source_paths_dict[gse]
+                )
+            )
+            if up_to_date:
+                self.pair_gsms_dict[gse] = manifest.get_pair_gsms_list(gse)
+            yield gse, pair_regex_list, up_to_date
+
+    def save_samples(self, to_yaml: StrPath):
+        """Save GSMs of each series in input order, including those up to date."""
+        samples_dict = {
+            gse: self.pair_gsms_dict[gse]
+            for gse in self.gse_accs
+            if gse in self.pair_gsms_dict
+        }
+        save_yaml(samples_dict, Path(to_yaml))
+
+
+def _load_manifests(
+    save_to: StrPath | None, incremental: bool, shard: Shard | None
+) -> tuple[RunManifest | None, RunManifest | None]:
+    # with incremental, Series are recorded in a run manifest next to their pair count
+    # files, and each shard records its series apart until `merge_shards`
+    if save_to is None or not incremental:
+        return None, None
+    merged = RunManifest.load(save_to)
+    if shard is None:
+        return merged, merged
+    return RunManifest.load(save_to, name=shard.manifest_name), merged
+
+
+def _run_plan(run: _Run, entries: Iterable[tuple[GseAcc, list[PairRegex]]]):
+    # Series are only resolved, so nothing is downloaded or read
+    plans: dict[GseAcc, dict] = {}
+    downloads: dict[str, str] = {}
+    for gse, pair_regex_list, up_to_date in run.check_entries(entries):
+        series = run.new_series(gse, pair_regex_list)
+        plans[gse] = series.plan()
+        if run.incremental:
+            plans[gse]["up_to_date"] = up_to_date
+        if not up_to_date:
+            for source in plans[gse]["sources"].values():
+                if source["status"] == "download":
+                    downloads[source["url"]] = source["path"]
+        run.series_dict[gse] = series
+    safe_dump(
+        {"series": plans, "downloads": list(downloads)}, sys.stdout, sort_keys=False
+    )
+
+
+def _fetch_series(
+    run: _Run, entries: Iterable[tuple[GseAcc, list[PairRegex]]]
+) -> Iterator[Series]:
+    # series whose counts are fetched, one at a time
+    for gse, pair_regex_list, _ in run.check_entries(entries):
+        series = run.new_series(gse, pair_regex_list, save_to=None)
+        try:
+            series.fetch_counts()
+            error = None
+        except ValueError as e:
+            error = str(e)
+        run.emit_series(series)
+        if error is not None:
+            warnings.warn(f"Series {gse} skipped: {error}")
+            # not in the combined matrix, even if saved by an earlier run
+            run.pair_gsms_dict.pop(gse, None)
+            continue
+        run.pair_gsms_dict[gse] = series.pair_gsms_list
+        yield series
+        # its columns are gathered, so the count matrix can be released
+        series.count = None
+
+
+def _run_combine(
+    run: _Run,
+    entries: Iterable[tuple[GseAcc, list[PairRegex]]],
+    name: str,
+    save_to: StrPath | None,
+):
+    # all series are read, so the manifest and `incremental` do not apply
+    kwargs = run.series_kwargs
+    combined = combine_series(_fetch_series(run, entries), sep=kwargs["str_sep"])
+    if save_to is not None:
+        Path(save_to).mkdir(parents=True, exist_ok=True)
+        combined_path = Path(save_to).joinpath(
+            name + get_pair_count_suffix(kwargs["output_format"], kwargs["compression"])
+        )
+        write_pair_counts(
+            [combined],
+            [combined_path],
+            compression=kwargs["compression"],
+            output_format=kwargs["output_format"],
+            sep=kwargs["str_sep"],
+        )
+
+
+def _run_series(
+    run: _Run,
+    entries: Iterable[tuple[GseAcc, list[PairRegex]]],
+    max_workers: int | None,
+    rate_limit: float,
+):
+    manifest = run.manifest
+    stale_entries = (
+        (gse, pair_regex_list)
+        for gse, pair_regex_list, up_to_date in run.check_entries(entries)
+        if not up_to_date
+    )
+    for series, error in iter_series(
+        stale_entries,
+        max_workers=max_workers,
+        rate_limit=rate_limit,
+        **run.series_kwargs,
+    ):
+        gse = series.gse_acc
+        run.emit_series(series)
+        if error is None:
+            run.pair_gsms_dict[gse] = series.pair_gsms_list
+            if manifest is not None:
+                manifest.record(
+                    series, run.inputs_dict[gse], run.source_paths_dict[gse]
+                )
+        else:
+            warnings.warn(f"Series {gse} skipped: {error}")
+            if manifest is not None:
+                manifest.discard(gse)
+        if manifest is not None:
+            manifest.dump()
+    if manifest is not run.merged:
+        # only (and all) the series of the shard, for `merge_shards`
+        manifest.entries = {
+            gse: manifest.entries[gse]
+            for gse in run.gse_accs
+            if gse in manifest.entries
+        }
+        manifest.dump()
 
 
 def main(
@@ -21,6 +277,23 @@ def main(
     str_sep: str = "-",
     to_yaml: StrPath = None,
     cleanup: bool = False,
+    max_workers: int | None = None,
+    count_cache: CountCache | None = None,
+    metadata_cache: bool = False,
+    rate_limit: float = NCBI_RATE_LIMIT,
+    compression: Compression | None = None,
+    output_format: OutputFormat = "tsv",
+    sparse: bool = False,
+    consolidate: bool = False,
+    local_norm: bool = False,
+    incremental: bool = False,
+    hooks: list[StageHook] | None = None,
+    profile: StrPath | None = None,
+    trace: StrPath | None = None,
+    plan: bool = False,
+    shard: Shard | None = None,
+    weighted: bool = False,
+    combine: str | None = None,
 ) -> dict[GseAcc, Series]:
     """Generate count matrix for each series.
 
@@ -35,39 +308,76 @@ def main(
         str_sep (str, optional): separator between group and GSM in column. Defaults to "-".
         to_yaml (StrPath, optional): path to save YAML file. Defaults to None.
         cleanup (bool, optional): if True, remove source files. Defaults to False.
+        max_workers (int | None, optional): number of series processed concurrently. Defaults to None.
+        count_cache (CountCache | None, optional): format to cache count matrices in. Defaults to None.
+        metadata_cache (bool, optional): if True, cache Sample metadata of SOFT files. Defaults to False.
+        rate_limit (float, optional): requests per second to NCBI when max_workers > 1. Defaults to NCBI_RATE_LIMIT.
+        compression (Compression | None, optional): compression of pair count files. Defaults to None.
+        output_format (OutputFormat, optional): format of pair count files. Defaults to "tsv".
+        sparse (bool, optional): if True, hold count matrices as sparse columns. Defaults to False.
+        consolidate (bool, optional): if True, save one matrix per series with a manifest of pairs. Defaults to False.
+        local_norm (bool, optional): if True, compute normalized counts from raw counts and gene lengths instead of downloading them. Defaults to False.
+        incremental (bool, optional): if True, skip series whose inputs and source files are unchanged since they were saved, as recorded in a run manifest in `save_to`. Defaults to False.
+        hooks (list[StageHook] | None, optional): callbacks receiving the event of each stage, after its series is processed. Defaults to None.
+        profile (StrPath | None, optional): path to save the events as JSON lines. Defaults to None.
+        trace (StrPath | None, optional): path to save the events as a Chrome trace. Defaults to None.
+        plan (bool, optional): if True, print the sources of each series and the files to download (YAML) instead of running. Defaults to False.
+        shard (Shard | None, optional): if given, process only the series of this shard of the input file (see `merge_shards`). Defaults to None.
+        weighted (bool, optional): if True, balance shards by their number of pairs instead of hashing GSE accessions. Defaults to False.
+        combine (str | None, optional): if given, save the pairs of all series in one count matrix with this name (see `combine_series`) instead of a file per pair. Series are processed serially. Defaults to None.
 
     Returns:
-        dict[GseAcc, Series]: a dictionary of Series (value) for each series (key).
+        dict[GseAcc, Series]: a dictionary of Series (value) for each series (key) built in this run.
     """
-    regex_dict = load_input(geo_regex_path)
-    series_dict: dict[GseAcc, Series] = {}
-    if to_yaml is not None:
-        samples_dict: dict[GseAcc, list[PairGsms]] = {}
-    for gse, pair_regex_list in regex_dict.items():
-        series = Series(
-            gse_acc=gse,
-            pair_regex_list=pair_regex_list.copy(),
-            count_norm_type=count_norm_type,
-            count_annot_ver=count_annot_ver,
-            keep_annot=keep_annot,
-            src_dir=src_dir,
-            save_to=save_to,
-            silent=silent,
-            str_sep=str_sep,
-        )
-        try:
-            series.generate_pair_matrix()
-            if to_yaml is not None:
-                samples_dict[gse] = series.pair_gsms_list
-        except ValueError as e:
-            warnings.warn(f"Series {gse} skipped: {e}")
-        series_dict[gse] = series
-    if to_yaml is not None:
-        save_yaml(samples_dict, Path(to_yaml))
-    if cleanup:
-        for series in series_dict.values():
-            series.cleanup()
-    return series_dict
+    if save_to is not None and not plan:
+        # before any series is downloaded
+        check_output_format(output_format, compression)
+    if combine is not None and max_workers is not None and max_workers > 1:
+        raise ValueError("Series are combined serially, so max_workers must be 1")
+    writers = open_hooks(profile=profile, trace=trace)
+    series_kwargs = dict(
+        count_norm_type=count_norm_type,
+        count_annot_ver=count_annot_ver,
+        keep_annot=keep_annot,
+        src_dir=src_dir,
+        save_to=save_to,
+        silent=silent,
+        str_sep=str_sep,
+        compression=compression,
+        output_format=output_format,
+        sparse=sparse,
+        consolidate=consolidate,
+        local_norm=local_norm,
+        count_cache=count_cache,
+        metadata_cache=metadata_cache,
+    )
+    run = _Run(
+        series_kwargs,
+        (hooks or []) + writers,
+        incremental,
+        *_load_manifests(save_to, incremental, shard),
+    )
+    try:
+        # series are processed as they are read from the input file
+        entries = _read_input(geo_regex_path, run.emit)
+        if shard is not None:
+            entries = iter_shard(entries, shard, weighted=weighted)
+        if plan:
+            _run_plan(run, entries)
+            return run.series_dict
+        if combine is not None:
+            _run_combine(run, entries, combine, save_to)
+        else:
+            _run_series(run, entries, max_workers, rate_limit)
+        if to_yaml is not None:
+            run.save_samples(to_yaml)
+        if cleanup:
+            for series in run.series_dict.values():
+                series.cleanup()
+        return run.series_dict
+    finally:
+        for writer in writers:
+            writer.close()
 
 
 if __name__ == "__main__":
@@ -83,6 +393,22 @@ if __name__ == "__main__":
     str_sep: str = args.sep
     to_yaml: StrPath = args.yaml
     cleanup: bool = args.cleanup
+    max_workers: int = args.jobs
+    count_cache: CountCache | None = args.cache
+    metadata_cache: bool = args.metadata_cache
+    rate_limit: float = args.rate_limit
+    compression: Compression | None = args.compression
+    output_format: OutputFormat = args.output_format
+    sparse: bool = args.sparse
+    consolidate: bool = args.consolidate
+    local_norm: bool = args.local_norm
+    incremental: bool = args.incremental
+    profile: StrPath | None = args.profile
+    trace: StrPath | None = args.trace
+    plan: bool = args.plan
+    shard: Shard | None = args.shard
+    weighted: bool = args.weighted
+    combine: str | None = args.combine
 
     series_dict = main(
         geo_regex_path=geo_regex_path,
@@ -95,4 +421,20 @@ if __name__ == "__main__":
         str_sep=str_sep,
         to_yaml=to_yaml,
         cleanup=cleanup,
+        max_workers=max_workers,
+        count_cache=count_cache,
+        metadata_cache=metadata_cache,
+        rate_limit=rate_limit,
+        compression=compression,
+        output_format=output_format,
+        sparse=sparse,
+        consolidate=consolidate,
+        local_norm=local_norm,
+        incremental=incremental,
+        profile=profile,
+        trace=trace,
+        plan=plan,
+        shard=shard,
+        weighted=weighted,
+        combine=combine,
     )
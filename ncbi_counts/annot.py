@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+from __future__ import annotations
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+
+import pandas as pd
+
+from .types import AnnotColumns
+from .utils import COUNT_INDEX_DTYPE, download
+
+# Annotation columns holding integers (may be empty)
+INT_ANNOT_COLUMNS = ("ChrStart", "ChrStop", "Length")
+# Text columns with fewer unique values than this ratio are stored as category
+CATEGORY_RATIO = 0.5
+
+AnnotKey = tuple[str, str, str, int]
+
+
+def compact_annot(annot: pd.DataFrame) -> pd.DataFrame:
+    """Convert annotation columns read as str into compact dtypes.
+
+    Integer columns become nullable Int64, repetitive text columns become category and
+    the others become string. All of them are extension arrays, so a column projection
+    of the result does not copy data (see `project_annot`). GeneID index becomes int64
+    like the one of count DataFrame.
+
+    Args:
+        annot (pd.DataFrame): annotation DataFrame read with `dtype=str`.
+
+    Returns:
+        pd.DataFrame: annotation DataFrame with compact dtypes.
+    """
+    columns: dict[str, pd.Series] = {}
+    for col in annot.columns:
+        values = annot[col]
+        if col in INT_ANNOT_COLUMNS:
+            try:
+                columns[col] = pd.to_numeric(values).astype("Int64")
+                continue
+            except (TypeError, ValueError):
+                pass
+        if values.nunique() < len(values) * CATEGORY_RATIO:
+            columns[col] = values.astype("category")
+        else:
+            columns[col] = values.astype("string")
+    compact = pd.DataFrame(columns, index=annot.index, copy=False)
+    compact.index = annot.index.astype(COUNT_INDEX_DTYPE)
+    return compact
+
+
+def project_annot(annot: pd.DataFrame, columns: AnnotColumns) -> pd.DataFrame:
+    """Select annotation columns without copying the underlying arrays.
+
+    The result shares memory with `annot`, so it must be treated as read-only.
+
+    Args:
+        annot (pd.DataFrame): annotation DataFrame.
+        columns (AnnotColumns): annotation columns to select.
+
+    Returns:
+        pd.DataFrame: annotation DataFrame of the selected columns.
+    """
+    return pd.DataFrame({col: annot[col] for col in columns}, copy=False)
+
+
+class AnnotStore:
+    """Memoized annotation tables shared by all `Series` in a process.
+
+    Tables are keyed by (species, annotation version, resolved file path, file mtime),
+    so a re-downloaded file, or a file of another source directory, is parsed again.
+    The least recently used tables are evicted once the total size exceeds
+    `max_bytes`, except the one most recently loaded.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 2**20):
+        self.max_bytes = max_bytes
+        self._tables: OrderedDict[AnnotKey, pd.DataFrame] = OrderedDict()
+        self._sizes: dict[AnnotKey, int] = {}
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._tables)
+
+    @property
+    def nbytes(self) -> int:
+        """Total size of stored tables in bytes."""
+        return sum(self._sizes.values())
+
+    def clear(self):
+        """Remove all stored tables."""
+        with self._lock:
+            self._tables.clear()
+            self._sizes.clear()
+
+    def get(
+        self,
+        annot_url: str,
+        annot_path: Path,
+        columns: AnnotColumns | None = None,
+        species: str = "Human",
+        annot_ver: str = "GRCh38.p13",
+        force: bool = False,
+        silent: bool = False,
+    ) -> pd.DataFrame | None:
+        """Get annotation DataFrame, parsing the file only on first use.
+
+        Args:
+            annot_url (str): URL of annotation file.
+            annot_path (Path): file path to save.
+            columns (AnnotColumns | None, optional): columns to select. Defaults to None (all).
+            species (str, optional): Species. Defaults to "Human".
+            annot_ver (str, optional): Annotation version. Defaults to "GRCh38.p13".
+            force (bool, optional): Defaults to False.
+            silent (bool, optional): If True, suppress messages. Defaults to False.
+
+        Returns:
+            pd.DataFrame | None: annotation DataFrame (read-only).
+        """
+        annot_path = download(annot_url, annot_path, force=force, silent=silent)
+        if annot_path is None:
+            return None
+        key = (
+            species,
+            annot_ver,
+            str(annot_path.resolve()),
+            annot_path.stat().st_mtime_ns,
+        )
+        with self._lock:
+            annot = self._tables.get(key)
+            if annot is not None:
+                self._tables.move_to_end(key)
+        if annot is None:
+            annot = compact_annot(pd.read_table(annot_path, index_col=0, dtype=str))
+            self._put(key, annot)
+        if columns is None:
+            return annot
+        return project_annot(annot, columns)
+
+    def _put(self, key: AnnotKey, annot: pd.DataFrame):
+        with self._lock:
+            self._tables[key] = annot
+            self._sizes[key] = int(annot.memory_usage(deep=True).sum())
+            self._tables.move_to_end(key)
+            while len(self._tables) > 1 and self.nbytes > self.max_bytes:
+                old_key, _ = self._tables.popitem(last=False)
+                del self._sizes[old_key]
+
+
+ANNOT_STORE = AnnotStore()
+
+
+def get_annot_dataframe(
+    annot_url: str,
+    annot_path: Path,
+    columns: AnnotColumns | None = None,
+    species: str = "Human",
+    annot_ver: str = "GRCh38.p13",
+    force: bool = False,
+    silent: bool = False,
+) -> pd.DataFrame | None:
+    """Get annotation DataFrame from the process-wide `ANNOT_STORE`.
+
+    Args:
+        annot_url (str): URL of annotation file.
+        annot_path (Path): file path to save.
+        columns (AnnotColumns | None, optional): columns to select. Defaults to None (all).
+        species (str, optional): Species. Defaults to "Human".
+        annot_ver (str, optional): Annotation version. Defaults to "GRCh38.p13".
+        force (bool, optional): Defaults to False.
+        silent (bool, optional): If True, suppress messages. Defaults to False.
+
+    Returns:
+        pd.DataFrame | None: annotation DataFrame (read-only).
+    """
+    return ANNOT_STORE.get(
+        annot_url,
+        annot_path,
+        columns=columns,
+        species=species,
+        annot_ver=annot_ver,
+        force=force,
+        silent=silent,
+    )
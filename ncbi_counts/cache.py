@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+from __future__ import annotations
+import json
+import os
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Iterable
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    from pyarrow import feather
+except ImportError:  # optional dependency: pip install ncbi-counts[cache]
+    pa = None
+
+from .types import CountNorm, GsmAcc
+from .utils import CACHE_DIRNAME, download, read_count, select_gsm_columns
+
+CACHE_SUFFIX = ".feather"
+SOURCE_METADATA_KEY = b"ncbi_counts.source"
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError(
+            "pyarrow is required for the count cache: pip install 'ncbi-counts[cache]'"
+        )
+
+
+def get_cache_path(count_path: Path) -> Path:
+    """Get path of the cache of a count file.
+
+    Args:
+        count_path (Path): file path of count file (.tsv.gz).
+
+    Returns:
+        Path: file path of cache (.feather) in a hidden directory next to count file.
+    """
+    name = count_path.name.removesuffix(".gz").removesuffix(".tsv")
+    return count_path.parent.joinpath(CACHE_DIRNAME, name + CACHE_SUFFIX)
+
+
+def source_fingerprint(path: Path) -> dict[str, int]:
+    """Get size and modification time of a source file.
+
+    Args:
+        path (Path): file path of source file.
+
+    Returns:
+        dict[str, int]: size and modification time (ns) of source file.
+    """
+    stat = path.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def read_cache_schema(cache_path: Path) -> pa.Schema | None:
+    """Read the schema of a cache file without reading its columns.
+
+    Args:
+        cache_path (Path): file path of cache.
+
+    Returns:
+        pa.Schema | None: schema of cache, or None if it cannot be read.
+    """
+    _require_pyarrow()
+    try:
+        with pa.memory_map(str(cache_path)) as source:
+            return pa.ipc.open_file(source).schema
+    except (OSError, pa.ArrowInvalid):
+        return None
+
+
+def is_cache_valid(schema: pa.Schema | None, count_path: Path) -> bool:
+    """Check if a cache was made from the current count file.
+
+    Args:
+        schema (pa.Schema | None): schema of cache.
+        count_path (Path): file path of count file.
+
+    Returns:
+        bool: True if size and modification time of count file are unchanged.
+    """
+    if schema is None or schema.metadata is None:
+        return False
+    source = schema.metadata.get(SOURCE_METADATA_KEY)
+    return source is not None and json.loads(source) == source_fingerprint(count_path)
+
+
+def write_count_cache(count: pd.DataFrame, count_path: Path) -> Path:
+    """Write count DataFrame into the cache of a count file.
+
+    The cache is written to a temporary file and then renamed, so a reader never sees
+    a partial cache.
+
+    Args:
+        count (pd.DataFrame): count DataFrame read from `count_path`.
+        count_path (Path): file path of count file.
+
+    Returns:
+        Path: file path of cache.
+    """
+    _require_pyarrow()
+    cache_path = get_cache_path(count_path)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    table = pa.Table.from_pandas(count.reset_index(), preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[SOURCE_METADATA_KEY] = json.dumps(source_fingerprint(count_path)).encode()
+    table = table.replace_schema_metadata(metadata)
+    with NamedTemporaryFile(
+        dir=cache_path.parent, suffix=CACHE_SUFFIX, delete=False
+    ) as tmp:
+        tmp_path = Path(tmp.name)
+    try:
+        feather.write_feather(table, tmp_path)
+        os.replace(tmp_path, cache_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return cache_path
+
+
+def read_count_cache(
+    count_path: Path,
+    norm_type: CountNorm | None = None,
+    gsms: Iterable[GsmAcc] | None = None,
+) -> pd.DataFrame:
+    """Read count file through its binary columnar (Feather) cache.
+
+    The count file is parsed and cached on first use, or when it has changed since
+    the cache was written. Otherwise only the columns of `gsms` are loaded from cache.
+
+    Args:
+        count_path (Path): file path of count file.
+        norm_type (CountNorm | None, optional): Normalization type. Defaults to None.
+        gsms (Iterable[GsmAcc] | None, optional): GSMs to read. Defaults to None (all).
+
+    Returns:
+        pd.DataFrame: Count DataFrame.
+    """
+    cache_path = get_cache_path(count_path)
+    schema = read_cache_schema(cache_path)
+    if not is_cache_valid(schema, count_path):
+        count = read_count(count_path, norm_type=norm_type)
+        write_count_cache(count, count_path)
+        if gsms is None:
+            return count
+        return count[select_gsm_columns(count.columns.tolist(), gsms)]
+    index_col = schema.names[0]
+    columns = None
+    if gsms is not None:
+        columns = [index_col] + select_gsm_columns(schema.names[1:], gsms)
+    table = feather.read_table(cache_path, columns=columns, memory_map=True)
+    return table.to_pandas().set_index(index_col)
+
+
+def get_cached_count_dataframe(
+    count_url: str,
+    count_path: Path = Path(),
+    force: bool = False,
+    silent=False,
+    norm_type: CountNorm | None = None,
+    gsms: Iterable[GsmAcc] | None = None,
+) -> pd.DataFrame | None:
+    """Get count DataFrame from URL through the count cache.
+
+    Args:
+        count_url (str): URL of count file.
+        count_path (Path, optional): file path to save. Defaults to Path().
+        force (bool, optional): Defaults to False.
+        silent (bool, optional): If True, suppress messages. Defaults to False.
+        norm_type (CountNorm | None, optional): Normalization type. Defaults to None.
+        gsms (Iterable[GsmAcc] | None, optional): GSMs to read. Defaults to None (all).
+
+    Returns:
+        pd.DataFrame | None: Count DataFrame.
+    """
+    _require_pyarrow()
+    count_path = download(count_url, count_path, force=force, silent=silent)
+    if count_path is not None:
+        return read_count_cache(count_path, norm_type=norm_type, gsms=gsms)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+from .core import Series
+from .utils import COUNT_INDEX_DTYPE, select_group_gsms
+
+
+@dataclass
+class CountBlock:
+    """Columns of the pairs of a series, gathered from its count matrix."""
+
+    genes: np.ndarray  # GeneID of each row
+    values: np.ndarray  # genes x columns
+    columns: list[str]
+
+
+def gather_series_block(series: Series, sep: str = "-") -> CountBlock:
+    """Gather the count columns of all pairs of a series in one positional take.
+
+    Columns are named `{gse}{sep}{group}{sep}{gsm}`, in order of pairs and groups, with
+    GSMs sorted as in `construct_pair_count`. A GSM in the same group of several pairs
+    is gathered once, and GSMs not in the count matrix are dropped with the same
+    warnings as `construct_pair_count`.
+
+    Args:
+        series (Series): series whose counts are fetched (see `Series.fetch_counts`).
+        sep (str, optional): separator of column names. Defaults to "-".
+
+    Returns:
+        CountBlock: GeneIDs, values and names of the columns.
+    """
+    series.fetch_counts()
+    count = series.count
+    columns: dict[str, int] = {}
+    for pair_gsms in series.pair_gsms_list:
+        for group, gsms in pair_gsms.items():
+            gsms = select_group_gsms(group, gsms, count.columns)
+            for gsm, pos in zip(gsms, count.columns.get_indexer(gsms)):
+                columns.setdefault(f"{series.gse_acc}{sep}{group}{sep}{gsm}", pos)
+    block = count.iloc[:, list(columns.values())]
+    if len(block.columns) and all(
+        isinstance(dtype, pd.SparseDtype) for dtype in block.dtypes
+    ):
+        block = block.sparse.to_dense()
+    return CountBlock(
+        count.index.to_numpy(dtype=COUNT_INDEX_DTYPE), block.to_numpy(), list(columns)
+    )
+
+
+def combine_series(series_list: Iterable[Series], sep: str = "-") -> pd.DataFrame:
+    """Combine the pairs of many series into one count matrix aligned on GeneID.
+
+    Only the columns of the pairs of each series are kept while the others are read
+    (see `gather_series_block`), and they are copied once into a preallocated array of
+    all GeneIDs (sorted), instead of joining DataFrames. Counts keep their dtype if
+    all series have the same genes, and genes missing from a series are NaN otherwise.
+    Annotation columns of the first series that keeps them become index levels, as in
+    `construct_pair_count`. Series without columns (no matched pairs) are skipped, so
+    they do not change the dtype.
+
+    Args:
+        series_list (Iterable[Series]): series to combine.
+        sep (str, optional): separator of column names. Defaults to "-".
+
+    Returns:
+        pd.DataFrame: count DataFrame with a `{gse}{sep}{group}{sep}{gsm}` column for
+            each GSM of each group of each series.
+    """
+    blocks: list[CountBlock] = []
+    annot: pd.DataFrame | None = None
+    for series in series_list:
+        block = gather_series_block(series, sep=sep)
+        if block.columns:
+            blocks.append(block)
+        if annot is None:
+            annot = series.annot
+    if not blocks:
+        return pd.DataFrame(index=pd.Index([], dtype=COUNT_INDEX_DTYPE, name="GeneID"))
+    genes = np.unique(np.concatenate([block.genes for block in blocks]))
+    complete = all(len(block.genes) == len(genes) for block in blocks)
+    dtype = np.result_type(*[block.values.dtype for block in blocks])
+    if not complete:
+        dtype = np.result_type(dtype, np.float32)
+    combined = np.empty((len(genes), sum(len(b.columns) for b in blocks)), dtype)
+    if not complete:
+        combined.fill(np.nan)
+    start = 0
+    for block in blocks:
+        stop = start + len(block.columns)
+        rows = np.searchsorted(genes, block.genes)
+        combined[rows, start:stop] = block.values
+        start = stop
+    index = pd.Index(genes, name="GeneID")
+    if annot is not None:
+        index = pd.MultiIndex.from_arrays(
+            [genes] + [annot[col].reindex(genes).array for col in annot.columns],
+            names=["GeneID", *annot.columns],
+        )
+    return pd.DataFrame(
+        combined,
+        index=index,
+        columns=[col for block in blocks for col in block.columns],
+        copy=False,
+    )
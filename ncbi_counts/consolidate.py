@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+from __future__ import annotations
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from .types import GsmAcc, PairColumns, PairGsms
+from .utils import PairCountIndex, select_group_gsms
+
+MANIFEST_SUFFIX = ".pairs.yaml"
+
+
+def consolidate_pair_gsms(
+    pair_gsms_list: list[PairGsms], columns: Sequence[GsmAcc]
+) -> tuple[list[GsmAcc], list[PairColumns]]:
+    """Map GSMs of each pair to columns of one matrix, keeping each GSM only once.
+
+    GSMs not in the count matrix are dropped with the same warnings as
+    `construct_pair_count`.
+
+    Args:
+        pair_gsms_list (list[PairGsms]): a dictionary of GSMs (value) for each group (key), for each pair.
+        columns (Sequence[GsmAcc]): GSMs in count matrix.
+
+    Returns:
+        tuple[list[GsmAcc], list[PairColumns]]: distinct GSMs in order of first use, and
+            their positions (value) for each group (key), for each pair.
+    """
+    in_count = set(columns)
+    positions: dict[GsmAcc, int] = {}
+    pair_columns_list: list[PairColumns] = []
+    for pair_gsms in pair_gsms_list:
+        pair_columns: PairColumns = {}
+        for group, gsms in pair_gsms.items():
+            gsms_in_count = select_group_gsms(group, gsms, in_count)
+            if len(gsms_in_count) == 0:
+                continue
+            pair_columns[group] = [
+                positions.setdefault(gsm, len(positions)) for gsm in gsms_in_count
+            ]
+        pair_columns_list.append(pair_columns)
+    return list(positions), pair_columns_list
+
+
+def construct_series_count(
+    pair_gsms_list: list[PairGsms],
+    count: pd.DataFrame,
+    annot: pd.DataFrame | None = None,
+    count_index: PairCountIndex | None = None,
+) -> tuple[pd.DataFrame, list[PairColumns]]:
+    """Construct one count DataFrame holding the GSMs of all pairs once.
+
+    The columns are gathered by position in one take, as in `construct_pair_count`.
+
+    Args:
+        pair_gsms_list (list[PairGsms]): a dictionary of GSMs (value) for each group (key), for each pair.
+        count (pd.DataFrame): count DataFrame.
+        annot (pd.DataFrame | None, optional): annotation DataFrame. Defaults to None.
+        count_index (PairCountIndex | None, optional): index of `count` and `annot`.
+            Defaults to None (computed here).
+
+    Returns:
+        tuple[pd.DataFrame, list[PairColumns]]: count DataFrame with a column for each
+            distinct GSM, and positions of columns for each group, for each pair.
+    """
+    gsms, pair_columns_list = consolidate_pair_gsms(pair_gsms_list, count.columns)
+    if count_index is None:
+        count_index = PairCountIndex.from_count(count, annot)
+    series_count = count_index.take(count, [count_index.positions[gsm] for gsm in gsms])
+    return series_count, pair_columns_list
+
+
+@dataclass
+class PairCountViews(Sequence[pd.DataFrame]):
+    """Pair count DataFrames materialized on access from a consolidated matrix.
+
+    Each item is the same DataFrame as `construct_pair_count` returns for the pair.
+    """
+
+    series_count: pd.DataFrame = field(repr=False)
+    pair_columns_list: list[PairColumns]
+    sep: str = field(default="-")
+
+    def __len__(self) -> int:
+        return len(self.pair_columns_list)
+
+    def __getitem__(self, i: int | slice) -> pd.DataFrame | list[pd.DataFrame]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(len(self))[i]]
+        pair_columns = self.pair_columns_list[i]
+        positions = [pos for cols in pair_columns.values() for pos in cols]
+        pair_count = self.series_count.iloc[:, positions]
+        pair_count.columns = [
+            f"{group}{self.sep}{self.series_count.columns[pos]}"
+            for group, cols in pair_columns.items()
+            for pos in cols
+        ]
+        return pair_count
+
+    def to_manifest(self, matrix_name: str) -> dict:
+        """Get a manifest of the consolidated matrix and the columns of each pair.
+
+        Args:
+            matrix_name (str): file name of the consolidated matrix.
+
+        Returns:
+            dict: file name, columns (GSMs), and column positions of each group of each pair.
+        """
+        return {
+            "matrix": matrix_name,
+            "columns": self.series_count.columns.tolist(),
+            "pairs": self.pair_columns_list,
+        }
@@ -1,29 +1,69 @@
 #!/usr/bin/env python
 
 from __future__ import annotations
+from collections.abc import Iterable, Sequence
+from contextlib import AbstractContextManager
 from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Callable
 import warnings
 
 from GEOparse import get_GEO
 from GEOparse.GEOTypes import GSE
 import pandas as pd
 
-from .types import AnnotColumns, GseAcc, PairGsms, PairRegex, StrPath
+from .annot import get_annot_dataframe
+from .cache import get_cache_path, get_cached_count_dataframe
+from .consolidate import MANIFEST_SUFFIX, PairCountViews, construct_series_count
+from .instrument import StageEvent, StageHook, file_size, stage
+from .matcher import SampleTable
+from .norm import normalize_counts
+from .soft import (
+    get_metadata_cache_path,
+    parse_sample_metadata,
+    read_metadata_cache,
+    write_metadata_cache,
+)
+from .sparse import get_sidecar_paths, get_sparse_count_dataframe, to_sparse_count
+from .store import get_store_lock_path, get_store_path, get_stored_count_dataframe
+from .types import (
+    AnnotColumns,
+    Compression,
+    CountCache,
+    CountNorm,
+    GseAcc,
+    GsmAcc,
+    GsmMetadata,
+    OutputFormat,
+    PairGsms,
+    PairRegex,
+    SoftParser,
+    Stage,
+    StrPath,
+)
 from .utils import (
+    PairCountIndex,
     construct_pair_count,
     get_annot_url,
     get_count_dataframe,
     get_count_url,
-    match_pair_gsms,
+    get_download_state_dir,
+    get_soft_url,
+    lease,
     parse_filename_from_url,
+    remove_download,
+    save_yaml,
 )
+from .writer import get_pair_count_suffix, write_pair_counts
 
 
 @dataclass
 class Series:
     gse_acc: GseAcc
-    gse_info: GSE = field(init=False, repr=False)
+    gse_info: GSE | None = field(init=False, repr=False)
+    gsm_metadata: dict[GsmAcc, GsmMetadata] = field(init=False, repr=False)
+    soft_url: str = field(init=False)
+    soft_path: Path = field(init=False)
     pair_regex_list: list[PairRegex]
     pair_gsms_list: list[PairGsms] = field(default_factory=list, init=False)
     count_norm_type: str | None = field(default=None)
@@ -35,75 +75,307 @@ class Series:
     annot_url: str = field(init=False)
     annot_path: Path | None = field(init=False)
     annot: pd.DataFrame | None = field(init=False, repr=False)
-    pair_count_list: list[pd.DataFrame] = field(
+    pair_count_list: Sequence[pd.DataFrame] = field(
         default_factory=list, init=False, repr=False
     )
     pair_count_path_list: list[Path] = field(default_factory=list, init=False)
+    series_count: pd.DataFrame | None = field(default=None, init=False, repr=False)
+    series_count_path: Path | None = field(default=None, init=False)
+    manifest_path: Path | None = field(default=None, init=False)
     src_dir: StrPath = field(default="./")
+    count_cache: CountCache | None = field(default=None)
+    sparse: bool = field(default=False)
+    soft_parser: SoftParser = field(default="stream")
+    metadata_cache: bool = field(default=False)
     save_to: StrPath | None = field(default="./")
     silent: bool = field(default=True)
     str_sep: str = field(default="-")
+    compression: Compression | None = field(default=None)
+    output_format: OutputFormat = field(default="tsv")
+    consolidate: bool = field(default=False)
+    local_norm: bool = field(default=False)
+    hooks: list[StageHook] = field(default_factory=list, repr=False)
+    stage_events: list[StageEvent] = field(default_factory=list, init=False, repr=False)
+    completed_stages: list[Stage] = field(default_factory=list, init=False)
 
     def __post_init__(self):
         if not self.gse_acc.startswith("GSE"):
             raise ValueError("GSE accession must start with GSE")
-        self._prepare_dirs()
-        self._set_gse_info()
-        self._match_pair_samples()
-        self._set_count_url()
-        self._set_count_path()
-        self._set_annot_url()
-        self._set_annot_path()
+        # Only URLs and file paths are resolved here; the stages run on demand.
+        self._resolve()
 
-    def generate_pair_matrix(self):
-        """Generate pair count matrix for each pair regex."""
-        self._set_count()
-        self._set_annot()
-        self._set_pair_count()
+    def fetch_metadata(self):
+        """Download and parse the family SOFT file (or read its metadata cache)."""
+        self._run_stage("metadata", self._make_src_dir, self._set_gse_info)
+
+    def match(self):
+        """Match GSMs of each pair regex, fetching metadata first if needed."""
+        self.fetch_metadata()
+        self._run_stage("match", self._match_pair_samples)
+
+    def fetch_counts(self):
+        """Download and read the count matrix and annotation, matching first if needed."""
+        self.match()
+        self._run_stage("counts", self._set_count, self._set_annot)
+
+    def build(self):
+        """Construct pair count matrices, fetching counts first if needed."""
+        self.fetch_counts()
+        self._run_stage("build", self._set_pair_count)
+
+    def write(self):
+        """Save pair count matrices (if `save_to` is set), building them first if needed."""
+        self.build()
         if self.save_to is not None:
-            self._set_pair_count_path()
-            self._save_pair_count()
+            self._run_stage(
+                "write",
+                self._make_save_dir,
+                self._set_pair_count_path,
+                self._save_pair_count,
+            )
+
+    def generate_pair_matrix(self):
+        """Generate pair count matrix for each pair regex (runs all remaining stages)."""
+        self.write()
+
+    def normalize(
+        self, norm_types: Iterable[CountNorm] = CountNorm.__args__
+    ) -> dict[CountNorm, pd.DataFrame]:
+        """Normalize the raw counts of the matched GSMs, computing all types in one pass.
+
+        `count_norm_type` gives one normalization per Series; this gives several from
+        its one download of raw counts, matching GSMs first if needed.
+
+        Args:
+            norm_types (Iterable[CountNorm], optional): normalizations to compute.
+                Defaults to all ("fpkm", "tpm").
+
+        Raises:
+            ValueError: If the count matrix of this Series is normalized by NCBI (set
+                `local_norm`), or could not be loaded.
+
+        Returns:
+            dict[CountNorm, pd.DataFrame]: normalized count DataFrame (GeneID x GSM) for
+                each normalization type.
+        """
+        if self._source_norm_type() is not None:
+            raise ValueError("Counts normalized by NCBI cannot be normalized again")
+        self.match()
+        with lease(self.count_url, self.count_path, silent=self.silent) as path:
+            count = None
+            if path is not None:
+                count = get_count_dataframe(
+                    self.count_url,
+                    self.count_path,
+                    silent=self.silent,
+                    gsms=self._pair_gsms(),
+                )
+        if count is None:
+            raise ValueError("Could not load count matrix")
+        return normalize_counts(count, self._get_gene_length(), norm_types)
+
+    def plan(self) -> dict:
+        """Describe the sources of the stages without downloading or reading any file.
+
+        Only whether source files and caches exist is checked.
+
+        Returns:
+            dict: URL, file path and status of each source file ("present", "cached"
+                if not needed thanks to the Sample metadata cache, or "download"), the
+                count cache ("hit" or "miss"), and the number of pair regex.
+        """
+        sources = {
+            "soft": self._plan_source(
+                self.soft_url,
+                self.soft_path,
+                self.metadata_cache
+                and get_metadata_cache_path(self.soft_path).is_file(),
+            ),
+            "count": self._plan_source(self.count_url, self.count_path),
+        }
+        if self.count_cache is not None:
+            cache_path = {
+                "feather": get_cache_path(self.count_path),
+                "mmap": get_store_path(self.count_path),
+            }[self.count_cache]
+            sources["count"]["cache"] = "hit" if cache_path.exists() else "miss"
+        if self.annot_path is not None:
+            sources["annot"] = self._plan_source(self.annot_url, self.annot_path)
+        return {
+            "pairs": len(self.pair_regex_list),
+            "sources": sources,
+            "save_to": None if self.save_to is None else str(self.save_to),
+        }
 
     def cleanup(self):
-        """Remove downloaded source files."""
-        self.src_dir.joinpath(self.gse_acc + "_family.soft.gz").unlink(missing_ok=True)
-        self.count_path.unlink(missing_ok=True)
+        """Remove downloaded source files and count caches (Sample metadata cache is kept).
+
+        Source files leased by other processes (see `lease`) are kept.
+        """
+        # Files in use by other processes sharing src_dir are left for them
+        remove_download(self.soft_path)
+        # caches of all formats, as earlier runs may have used another one
+        count_caches = [
+            get_cache_path(self.count_path),
+            get_store_path(self.count_path),
+            get_store_lock_path(self.count_path),
+        ]
+        remove_download(self.count_path, count_caches)
         if self.annot_path is not None:
-            self.annot_path.unlink(missing_ok=True)
+            remove_download(self.annot_path)
+        try:
+            # Remove cache directory if it is empty
+            get_download_state_dir(self.count_path).rmdir()
+        except OSError:
+            pass
         try:
             # Remove src_dir if it is empty
             self.src_dir.rmdir()
         except (OSError, FileNotFoundError):
             pass
 
-    def _prepare_dirs(self):
+    def get_output_paths(self) -> list[Path]:
+        """Get file paths of the files saved by `generate_pair_matrix`.
+
+        Returns:
+            list[Path]: file paths of pair count files (or consolidated matrix and
+                manifest), and their row and column names for sparse formats.
+        """
+        if self.consolidate:
+            if self.series_count_path is None:
+                return []
+            matrix_paths = [self.series_count_path]
+            paths = [self.series_count_path, self.manifest_path]
+        else:
+            matrix_paths = self.pair_count_path_list
+            paths = list(self.pair_count_path_list)
+        if self.output_format in ("mtx", "npz"):
+            paths += [p for path in matrix_paths for p in get_sidecar_paths(path)]
+        return paths
+
+    def _emit(self, event: StageEvent):
+        if event.gse_acc is None:
+            event.gse_acc = self.gse_acc
+        self.stage_events.append(event)
+        for hook in self.hooks:
+            hook(event)
+
+    def _stage(self, name: str) -> AbstractContextManager[StageEvent]:
+        return stage(name, emit=self._emit, gse_acc=self.gse_acc)
+
+    def _run_stage(self, name: Stage, *steps: Callable[[], None]):
+        if name in self.completed_stages:
+            return
+        for step in steps:
+            step()
+        self.completed_stages.append(name)
+
+    def _plan_source(self, url: str, path: Path, cached: bool = False) -> dict:
+        if cached:
+            status = "cached"
+        elif path.is_file():
+            status = "present"
+        else:
+            status = "download"
+        return {"url": url, "path": str(path), "status": status}
+
+    def _resolve(self):
         self.src_dir = Path(self.src_dir)
-        self.src_dir.mkdir(parents=True, exist_ok=True)
         if self.save_to is not None:
             self.save_to = Path(self.save_to)
-            self.save_to.mkdir(parents=True, exist_ok=True)
+        self._set_soft_url()
+        self._set_soft_path()
+        self._set_count_url()
+        self._set_count_path()
+        self._set_annot_url()
+        self._set_annot_path()
+
+    def _make_src_dir(self):
+        self.src_dir.mkdir(parents=True, exist_ok=True)
+
+    def _make_save_dir(self):
+        self.save_to.mkdir(parents=True, exist_ok=True)
+
+    def _set_soft_url(self):
+        self.soft_url = get_soft_url(self.gse_acc)
+
+    def _set_soft_path(self):
+        soft_filename = parse_filename_from_url(self.soft_url)
+        self.soft_path = self.src_dir.joinpath(soft_filename)
 
     def _set_gse_info(self):
+        with self._stage("gse_info") as event:
+            self.gse_info = None
+            if self.metadata_cache:
+                self.gsm_metadata = read_metadata_cache(self.soft_path)
+            if not self.metadata_cache or self.gsm_metadata is None:
+                self._parse_soft()
+                event.bytes_read = file_size(self.soft_path)
+                if self.metadata_cache:
+                    write_metadata_cache(self.gsm_metadata, self.soft_path)
+            event.rows = len(self.gsm_metadata)
+
+    def _parse_soft(self):
+        if self.soft_parser == "stream":
+            with lease(self.soft_url, self.soft_path, silent=self.silent) as soft_path:
+                if soft_path is not None:
+                    try:
+                        self.gsm_metadata = parse_sample_metadata(soft_path)
+                        return
+                    except (OSError, ValueError, EOFError):
+                        # fall back to GEOparse below
+                        pass
+        elif self.soft_parser != "geoparse":
+            raise ValueError(f"Unsupported SOFT parser: {self.soft_parser}")
         self.gse_info = get_GEO(self.gse_acc, destdir=self.src_dir, silent=self.silent)
+        self.gsm_metadata = {
+            gsm.name: gsm.metadata for gsm in self.gse_info.gsms.values()
+        }
 
     def _match_pair_samples(self):
-        gsms = self.gse_info.gsms.values()
-        matched_regex: list[PairRegex] = []
-        for pair_regex in self.pair_regex_list:
-            pair_gsms = match_pair_gsms(pair_regex, gsms, silent=self.silent)
-            if pair_gsms:
-                self.pair_gsms_list.append(pair_gsms)
-                matched_regex.append(pair_regex)
-            else:
-                if not self.silent:
-                    warnings.warn(
-                        f"Could not find pair samples for {pair_regex}. Skipping..."
-                    )
-        self.pair_regex_list = matched_regex
+        with self._stage("match") as event:
+            sample_table = SampleTable.from_metadata(self.gsm_metadata)
+            matched_regex: list[PairRegex] = []
+            for pair_regex in self.pair_regex_list:
+                pair_gsms = sample_table.match_pair(pair_regex, silent=self.silent)
+                if pair_gsms:
+                    self.pair_gsms_list.append(pair_gsms)
+                    matched_regex.append(pair_regex)
+                else:
+                    if not self.silent:
+                        warnings.warn(
+                            f"Could not find pair samples for {pair_regex}. Skipping..."
+                        )
+            self.pair_regex_list = matched_regex
+            event.rows = len(self.gsm_metadata)
+            event.columns = len(self.pair_gsms_list)
+
+    def _pair_gsms(self) -> list[GsmAcc]:
+        # GSMs of all pairs without duplicates, in order of appearance
+        return list(
+            dict.fromkeys(
+                gsm
+                for pair_gsms in self.pair_gsms_list
+                for gsms in pair_gsms.values()
+                for gsm in gsms
+            )
+        )
+
+    def _source_norm_type(self) -> str | None:
+        # normalization type of the downloaded count matrix
+        return None if self.local_norm else self.count_norm_type
+
+    def _needs_annot(self) -> bool:
+        # the annotation table holds the gene lengths of local normalization
+        return bool(self.keep_annot) or (
+            self.local_norm and self.count_norm_type is not None
+        )
 
     def _set_count_url(self):
         self.count_url = get_count_url(
-            self.gse_acc, norm_type=self.count_norm_type, annot_ver=self.count_annot_ver
+            self.gse_acc,
+            norm_type=self._source_norm_type(),
+            annot_ver=self.count_annot_ver,
         )
 
     def _set_count_path(self):
@@ -111,20 +383,68 @@ class Series:
         self.count_path = self.src_dir.joinpath(count_filename)
 
     def _set_count(self):
-        self.count = get_count_dataframe(
-            self.count_url, self.count_path, silent=self.silent
-        )
-        if self.count is None:
-            raise ValueError("Could not load count matrix")
+        if self.count_cache is None:
+            count_getter = (
+                get_sparse_count_dataframe if self.sparse else get_count_dataframe
+            )
+        elif self.count_cache == "feather":
+            count_getter = get_cached_count_dataframe
+        elif self.count_cache == "mmap":
+            count_getter = get_stored_count_dataframe
+        else:
+            raise ValueError(f"Unsupported count cache: {self.count_cache}")
+        with self._stage("count") as event:
+            with lease(self.count_url, self.count_path, silent=self.silent) as path:
+                self.count = None
+                if path is not None:
+                    self.count = count_getter(
+                        self.count_url,
+                        self.count_path,
+                        silent=self.silent,
+                        norm_type=self._source_norm_type(),
+                        gsms=self._pair_gsms(),
+                    )
+            if self.count is None:
+                raise ValueError("Could not load count matrix")
+            if self._source_norm_type() != self.count_norm_type:
+                self.count = normalize_counts(
+                    self.count, self._get_gene_length(), [self.count_norm_type]
+                )[self.count_norm_type]
+            if self.sparse:
+                self.count = to_sparse_count(self.count)
+            read_path = {
+                None: self.count_path,
+                "feather": get_cache_path(self.count_path),
+            }.get(self.count_cache)
+            event.bytes_read = file_size(read_path)
+            event.rows, event.columns = self.count.shape
+
+    def _get_gene_length(self) -> pd.Series:
+        # the annotation table is not resolved for raw counts without kept columns
+        annot_url = get_annot_url(annot_ver=self.count_annot_ver)
+        annot_path = self.src_dir.joinpath(parse_filename_from_url(annot_url))
+        with lease(annot_url, annot_path, silent=self.silent) as path:
+            annot = None
+            if path is not None:
+                annot = get_annot_dataframe(
+                    annot_url,
+                    annot_path,
+                    columns=["Length"],
+                    annot_ver=self.count_annot_ver,
+                    silent=self.silent,
+                )
+        if annot is None:
+            raise ValueError("Could not load gene lengths from annotation table")
+        return annot["Length"]
 
     def _set_annot_url(self):
-        if self.keep_annot:
+        if self._needs_annot():
             self.annot_url = get_annot_url(annot_ver=self.count_annot_ver)
         else:
             self.annot_url = ""
 
     def _set_annot_path(self):
-        if self.keep_annot:
+        if self._needs_annot():
             annot_filename = parse_filename_from_url(self.annot_url)
             self.annot_path = self.src_dir.joinpath(annot_filename)
         else:
@@ -132,32 +452,92 @@ class Series:
 
     def _set_annot(self):
         if self.keep_annot:
-            self.annot = get_count_dataframe(
-                self.annot_url, self.annot_path, silent=self.silent
-            )[self.keep_annot]
+            with self._stage("annot") as event:
+                with lease(self.annot_url, self.annot_path, silent=self.silent) as path:
+                    self.annot = None
+                    if path is not None:
+                        self.annot = get_annot_dataframe(
+                            self.annot_url,
+                            self.annot_path,
+                            columns=self.keep_annot,
+                            annot_ver=self.count_annot_ver,
+                            silent=self.silent,
+                        )
+                if self.annot is None:
+                    raise ValueError("Could not load annotation table")
+                event.bytes_read = file_size(self.annot_path)
+                event.rows, event.columns = self.annot.shape
         else:
             self.annot = None
 
     def _set_pair_count(self):
-        for pair_gsms in self.pair_gsms_list:
-            pair_count = construct_pair_count(
-                pair_gsms, self.count, annot=self.annot, sep=self.str_sep
-            )
-            self.pair_count_list.append(pair_count)
+        with self._stage("pair_count") as event:
+            if self.consolidate:
+                self.series_count, pair_columns_list = construct_series_count(
+                    self.pair_gsms_list, self.count, annot=self.annot
+                )
+                self.pair_count_list = PairCountViews(
+                    self.series_count, pair_columns_list, sep=self.str_sep
+                )
+                event.rows, event.columns = self.series_count.shape
+                return
+            # GSM positions and sorted rows are shared by all pairs
+            count_index = PairCountIndex.from_count(self.count, annot=self.annot)
+            for pair_gsms in self.pair_gsms_list:
+                pair_count = construct_pair_count(
+                    pair_gsms,
+                    self.count,
+                    annot=self.annot,
+                    sep=self.str_sep,
+                    count_index=count_index,
+                )
+                self.pair_count_list.append(pair_count)
+            event.rows = sum(len(p.index) for p in self.pair_count_list)
+            event.columns = sum(len(p.columns) for p in self.pair_count_list)
 
     def _set_pair_count_path(self, start_index: int = 1):
+        if self.consolidate:
+            suffix = get_pair_count_suffix(self.output_format, self.compression)
+            self.series_count_path = self.save_to.joinpath(self.gse_acc + suffix)
+            self.manifest_path = self.save_to.joinpath(self.gse_acc + MANIFEST_SUFFIX)
+            return
         digit = len(self.pair_count_list) // 10 + 1
         for i in range(len(self.pair_count_list)):
             self.pair_count_path_list.append(
                 self.save_to.joinpath(
-                    f"{self.gse_acc}{self.str_sep}{i + start_index:0{digit}}.tsv"
+                    f"{self.gse_acc}{self.str_sep}{i + start_index:0{digit}}"
+                    + get_pair_count_suffix(self.output_format, self.compression)
                 )
             )
 
     def _save_pair_count(self):
-        for pair_count, pair_count_path in zip(
-            self.pair_count_list, self.pair_count_path_list
-        ):
-            pair_count.to_csv(
-                pair_count_path, sep="\t", encoding="utf-8", lineterminator="\n"
+        with self._stage("save") as event:
+            self._write_pair_count()
+            event.bytes_written = sum(map(file_size, self.get_output_paths()))
+            if self.consolidate:
+                event.rows, event.columns = self.series_count.shape
+            else:
+                event.rows = sum(len(p.index) for p in self.pair_count_list)
+                event.columns = sum(len(p.columns) for p in self.pair_count_list)
+
+    def _write_pair_count(self):
+        if self.consolidate:
+            write_pair_counts(
+                [self.series_count],
+                [self.series_count_path],
+                compression=self.compression,
+                output_format=self.output_format,
+                sep=self.str_sep,
             )
+            save_yaml(
+                self.pair_count_list.to_manifest(self.series_count_path.name),
+                self.manifest_path,
+            )
+            return
+        write_pair_counts(
+            self.pair_count_list,
+            self.pair_count_path_list,
+            compression=self.compression,
+            output_format=self.output_format,
+            sep=self.str_sep,
+        )
@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+
+from __future__ import annotations
+from contextlib import nullcontext
+from dataclasses import asdict, dataclass
+import gzip
+import json
+import os
+from pathlib import Path
+import random
+import re
+import time
+from typing import Callable
+import zlib
+
+import requests
+from tqdm import tqdm
+
+from .lock import file_lock, get_lock_path
+
+PART_SUFFIX = ".part"
+STATE_SUFFIX = ".http.json"
+# bytes read at once; at most this much is lost when a connection drops
+CHUNK_SIZE = 2**16
+# HTTP status codes worth retrying
+RETRY_STATUS = frozenset({408, 425, 429, 500, 502, 503, 504})
+CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+class DownloadError(OSError):
+    """Raised if a file cannot be downloaded."""
+
+
+class IncompleteDownload(OSError):
+    """Raised if a download ended early or was rejected (retried)."""
+
+
+@dataclass
+class Validators:
+    """Validators of a remote file, kept to resume or revalidate its download."""
+
+    etag: str | None = None
+    last_modified: str | None = None
+    size: int | None = None
+
+    @classmethod
+    def from_response(cls, response: requests.Response) -> Validators:
+        """Get validators from the headers of a response.
+
+        Args:
+            response (requests.Response): response to a GET request.
+
+        Returns:
+            Validators: validators and full size (if known) of remote file.
+        """
+        size = None
+        content_range = CONTENT_RANGE_RE.fullmatch(
+            response.headers.get("Content-Range", "")
+        )
+        if response.status_code == 206 and content_range is not None:
+            if content_range.group(3) != "*":
+                size = int(content_range.group(3))
+        elif "Content-Length" in response.headers:
+            size = int(response.headers["Content-Length"])
+        return cls(
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+            size=size,
+        )
+
+    @classmethod
+    def load(cls, state_path: Path) -> Validators | None:
+        """Load validators saved by `dump`.
+
+        Args:
+            state_path (Path): file path of validators.
+
+        Returns:
+            Validators | None: validators, or None if they cannot be read.
+        """
+        try:
+            with open(state_path, encoding="utf-8") as f:
+                return cls(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def dump(self, state_path: Path):
+        """Save validators.
+
+        Args:
+            state_path (Path): file path of validators.
+        """
+        with open(state_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f)
+
+    def if_range(self) -> str | None:
+        """Get the validator for an If-Range header (weak ETags are not allowed)."""
+        if self.etag is not None and not self.etag.startswith("W/"):
+            return self.etag
+        return self.last_modified
+
+    def conditions(self) -> dict[str, str]:
+        """Get headers of a conditional request for an unchanged file."""
+        headers = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+def is_gzip_intact(path: Path) -> bool:
+    """Check if a gzip file decompresses to the end without errors.
+
+    Args:
+        path (Path): file path of gzip file.
+
+    Returns:
+        bool: True if all members are complete and their CRC match.
+    """
+    try:
+        with gzip.open(path, "rb") as f:
+            while f.read(CHUNK_SIZE):
+                pass
+        return True
+    except (OSError, EOFError, zlib.error):
+        return False
+
+
+def get_state_paths(path: Path, state_dir: Path) -> tuple[Path, Path]:
+    """Get paths of the partial file and the validators of a download.
+
+    Args:
+        path (Path): file path to save.
+        state_dir (Path): directory of download state (same file system as `path`).
+
+    Returns:
+        tuple[Path, Path]: file paths of partial file and validators.
+    """
+    return (
+        state_dir.joinpath(path.name + PART_SUFFIX),
+        state_dir.joinpath(path.name + STATE_SUFFIX),
+    )
+
+
+def remove_state(path: Path, state_dir: Path):
+    """Remove the partial file, the validators and the lock file of a download.
+
+    The lock file is only removed safely while its exclusive lock is held.
+
+    Args:
+        path (Path): file path to save.
+        state_dir (Path): directory of download state.
+    """
+    for state_path in get_state_paths(path, state_dir):
+        state_path.unlink(missing_ok=True)
+    get_lock_path(path, state_dir).unlink(missing_ok=True)
+
+
+def _is_retriable(e: Exception) -> bool:
+    if isinstance(e, requests.HTTPError):
+        return e.response is not None and e.response.status_code in RETRY_STATUS
+    return isinstance(
+        e,
+        (
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+            IncompleteDownload,
+        ),
+    )
+
+
+def _fetch_once(
+    session: requests.Session,
+    url: str,
+    path: Path,
+    state_dir: Path,
+    silent: bool,
+    timeout: float,
+):
+    part_path, state_path = get_state_paths(path, state_dir)
+    validators = Validators.load(state_path)
+    headers = {"Accept-Encoding": "identity"}
+    offset = part_path.stat().st_size if part_path.is_file() else 0
+    if offset and validators is not None and validators.if_range() is not None:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validators.if_range()
+    elif path.is_file() and validators is not None:
+        headers.update(validators.conditions())
+
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as r:
+        if r.status_code == 304:
+            return
+        if r.status_code == 416:
+            part_path.unlink(missing_ok=True)
+            raise IncompleteDownload(f"Cannot resume download: {url}")
+        r.raise_for_status()
+        if r.status_code != 206 or "Range" not in headers:
+            offset = 0
+        validators = Validators.from_response(r)
+        validators.dump(state_path)
+        with open(part_path, "ab" if offset else "wb") as f, tqdm(
+            total=validators.size,
+            initial=offset,
+            unit="B",
+            unit_scale=True,
+            unit_divisor=1024,
+            disable=silent,
+        ) as pbar:
+            for chunk in r.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+                pbar.update(len(chunk))
+
+    size = part_path.stat().st_size
+    if validators.size is not None and size != validators.size:
+        if size > validators.size:
+            part_path.unlink()
+        raise IncompleteDownload(f"Got {size} of {validators.size} bytes: {url}")
+    if path.suffix == ".gz" and not is_gzip_intact(part_path):
+        part_path.unlink()
+        raise IncompleteDownload(f"Corrupted gzip file: {url}")
+    os.replace(part_path, path)
+
+
+def fetch(
+    url: str,
+    path: Path,
+    state_dir: Path | None = None,
+    force: bool = False,
+    silent: bool = False,
+    retries: int = 5,
+    backoff: float = 1.0,
+    max_backoff: float = 60.0,
+    timeout: float = 60.0,
+    session: requests.Session | None = None,
+    limiter: Callable[[], None] | None = None,
+) -> Path:
+    """Download a file over HTTP(S), resuming and retrying until it is complete.
+
+    The file is written to a partial file in `state_dir` and renamed to `path` only
+    after its size (and gzip stream, for .gz files) is verified, so `path` is never
+    partial. An interrupted download is resumed with a range request if the remote
+    file is unchanged (If-Range). With `force`, an existing file is revalidated with
+    a conditional request and downloaded again only if it has changed.
+    Connection errors and 408/425/429/5xx responses are retried with exponential
+    backoff and full jitter.
+    A file is downloaded by one process at a time (see `file_lock`), and the others
+    asking for it wait and use the downloaded file.
+
+    Args:
+        url (str): URL of file.
+        path (Path): file path to save.
+        state_dir (Path | None, optional): directory of download state. Defaults to None (parent of `path`).
+        force (bool, optional): if True, revalidate an existing file. Defaults to False.
+        silent (bool, optional): if True, suppress progress bar. Defaults to False.
+        retries (int, optional): number of retries. Defaults to 5.
+        backoff (float, optional): base of backoff in seconds. Defaults to 1.0.
+        max_backoff (float, optional): maximum backoff in seconds. Defaults to 60.0.
+        timeout (float, optional): timeout of connection and each read in seconds. Defaults to 60.0.
+        session (requests.Session | None, optional): session to reuse connections of. Defaults to None (new session).
+        limiter (Callable[[], None] | None, optional): called before each request, e.g. to block for rate limiting. Defaults to None.
+
+    Raises:
+        DownloadError: If the file cannot be downloaded.
+
+    Returns:
+        Path: file path of downloaded file.
+    """
+    if path.is_file() and not force:
+        return path
+    if state_dir is None:
+        state_dir = path.parent
+    state_dir.mkdir(parents=True, exist_ok=True)
+    with file_lock(get_lock_path(path, state_dir)):
+        if path.is_file() and not force:
+            # downloaded by another process while waiting
+            return path
+        return _fetch_retrying(
+            url,
+            path,
+            state_dir,
+            silent,
+            retries,
+            backoff,
+            max_backoff,
+            timeout,
+            session,
+            limiter,
+        )
+
+
+def _fetch_retrying(
+    url: str,
+    path: Path,
+    state_dir: Path,
+    silent: bool,
+    retries: int,
+    backoff: float,
+    max_backoff: float,
+    timeout: float,
+    session: requests.Session | None,
+    limiter: Callable[[], None] | None,
+) -> Path:
+    with nullcontext(session) if session is not None else requests.Session() as session:
+        for attempt in range(retries + 1):
+            if limiter is not None:
+                limiter()
+            try:
+                _fetch_once(session, url, path, state_dir, silent, timeout)
+                return path
+            except Exception as e:
+                if not _is_retriable(e):
+                    raise DownloadError(f"Cannot download {url}: {e}") from e
+                error = e
+            if attempt < retries:
+                time.sleep(random.uniform(0, min(max_backoff, backoff * 2**attempt)))
+    raise DownloadError(f"Cannot download {url} in {retries + 1} attempts: {error}")
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+from __future__ import annotations
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+import json
+import os
+from pathlib import Path
+import sys
+import threading
+import time
+from typing import Callable, Iterator
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+from .types import GseAcc, StrPath
+
+
+@dataclass
+class StageEvent:
+    """Wall time, I/O, size and memory of a stage of a run.
+
+    Stages nest, e.g. a "download" stage is reported inside "gse_info", and the
+    outer stage includes the inner one.
+    """
+
+    stage: str
+    gse_acc: GseAcc | None = None
+    start: float = 0.0  # Unix time (s)
+    duration: float = 0.0  # wall time (s)
+    bytes_downloaded: int = 0
+    bytes_read: int = 0
+    bytes_written: int = 0
+    rows: int | None = None
+    columns: int | None = None
+    peak_rss_delta: int = 0  # growth of the peak resident set size (bytes)
+    pid: int = field(default_factory=os.getpid)
+    thread: int = field(default_factory=threading.get_ident)
+    error: str | None = None
+
+
+StageHook = Callable[[StageEvent], None]
+
+# where the stages of the current context are reported
+_emitter: ContextVar[StageHook | None] = ContextVar("emitter", default=None)
+
+
+def get_peak_rss() -> int:
+    """Get the peak resident set size of this process so far.
+
+    Returns:
+        int: peak RSS (bytes), or 0 if it is unknown on this platform.
+    """
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def file_size(path: Path | None) -> int:
+    """Get the size of a file, or 0 if it does not exist."""
+    try:
+        return path.stat().st_size
+    except (AttributeError, OSError):
+        return 0
+
+
+@contextmanager
+def stage(
+    name: str, emit: StageHook | None = None, gse_acc: GseAcc | None = None
+) -> Iterator[StageEvent]:
+    """Measure a stage, and report it when it ends (even by an exception).
+
+    The stage fills in the sizes of the yielded event. Stages started inside it are
+    reported to the same `emit`.
+
+    Args:
+        name (str): name of stage.
+        emit (StageHook | None, optional): callback to report the event to. Defaults
+            to None (the one of the enclosing stage, or nothing outside of stages).
+        gse_acc (GseAcc | None, optional): series of stage. Defaults to None.
+
+    Yields:
+        StageEvent: event of stage.
+    """
+    if emit is None:
+        emit = _emitter.get()
+    event = StageEvent(stage=name, gse_acc=gse_acc, start=time.time())
+    peak_rss = get_peak_rss()
+    started = time.perf_counter()
+    token = _emitter.set(emit)
+    try:
+        yield event
+    except BaseException as e:
+        event.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _emitter.reset(token)
+        event.duration = time.perf_counter() - started
+        event.peak_rss_delta = get_peak_rss() - peak_rss
+        if emit is not None:
+            emit(event)
+
+
+@dataclass
+class ProfileWriter:
+    """Hook writing each event as a line of JSON."""
+
+    path: Path
+
+    def __post_init__(self):
+        self.path = Path(self.path)
+        self._file = open(self.path, "w", encoding="utf-8")
+
+    def __call__(self, event: StageEvent):
+        self._file.write(json.dumps(asdict(event), ensure_ascii=False) + "\n")
+
+    def close(self):
+        self._file.close()
+
+
+@dataclass
+class TraceWriter:
+    """Hook collecting events into a Chrome trace (chrome://tracing, Perfetto)."""
+
+    path: Path
+    trace_events: list[dict] = field(default_factory=list, init=False, repr=False)
+
+    def __post_init__(self):
+        self.path = Path(self.path)
+
+    def __call__(self, event: StageEvent):
+        args = {
+            k: v
+            for k, v in asdict(event).items()
+            if k not in ("stage", "start", "duration", "pid", "thread")
+            and v is not None
+        }
+        self.trace_events.append(
+            {
+                "name": event.stage,
+                "cat": "ncbi_counts",
+                "ph": "X",
+                "ts": event.start * 1e6,
+                "dur": event.duration * 1e6,
+                "pid": event.pid,
+                "tid": event.thread,
+                "args": args,
+            }
+        )
+
+    def close(self):
+        # outer stages are reported after inner ones, but are drawn first
+        self.trace_events.sort(key=lambda e: (e["ts"], -e["dur"]))
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"traceEvents": self.trace_events, "displayTimeUnit": "ms"},
+                f,
+                ensure_ascii=False,
+            )
+
+
+def open_hooks(
+    profile: StrPath | None = None, trace: StrPath | None = None
+) -> list[ProfileWriter | TraceWriter]:
+    """Open the hooks writing events into files.
+
+    Args:
+        profile (StrPath | None, optional): path of JSON lines. Defaults to None.
+        trace (StrPath | None, optional): path of Chrome trace (.json). Defaults to None.
+
+    Returns:
+        list[ProfileWriter | TraceWriter]: hooks, to be closed after the run.
+    """
+    hooks: list[ProfileWriter | TraceWriter] = []
+    if profile is not None:
+        hooks.append(ProfileWriter(Path(profile)))
+    if trace is not None:
+        hooks.append(TraceWriter(Path(trace)))
+    return hooks
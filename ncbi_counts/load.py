@@ -1,61 +1,239 @@
 #!/usr/bin/env python
 
+from __future__ import annotations
+import csv
 from pathlib import Path
+from typing import Iterator
+
+import yaml
+
+from .types import GeoRegex, GseAcc, PairRegex, StrPath
+
+# libyaml is much faster, if PyYAML is built with it
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YAML_STR_TAG = "tag:yaml.org,2002:str"
+CSV_COLUMNS = ["gse", "pair", "group", "attrib", "pattern"]
+
+
+class InputError(ValueError):
+    """Raised if an input file is invalid, with the line (and row) of the error."""
+
+
+def _check_yaml(condition: bool, node: yaml.Node, message: str, path: StrPath):
+    if not condition:
+        raise InputError(f"{path}:{node.start_mark.line + 1}: {message}")
+
+
+def _check_yaml_str(node: yaml.Node, what: str, path: StrPath):
+    _check_yaml(
+        isinstance(node, yaml.ScalarNode) and node.tag == YAML_STR_TAG and node.value,
+        node,
+        f"{what} must be a non-empty string (quote it if it is a number)",
+        path,
+    )
+
+
+def _validate_yaml_document(
+    document: yaml.Node, path: StrPath, gse_lines: dict[GseAcc, int]
+):
+    """Check that a YAML document maps GSE accessions to lists of pair regex."""
+    _check_yaml(
+        isinstance(document, yaml.MappingNode),
+        document,
+        "Expected a mapping of GSE accessions to lists of pairs",
+        path,
+    )
+    for gse_node, pairs_node in document.value:
+        _check_yaml_str(gse_node, "GSE accession", path)
+        gse_acc = gse_node.value
+        _check_yaml(
+            gse_acc.startswith("GSE"), gse_node, "Keys must start with 'GSE'", path
+        )
+        _check_yaml(
+            gse_acc not in gse_lines,
+            gse_node,
+            f"Duplicate {gse_acc} (first at line {gse_lines.get(gse_acc)})",
+            path,
+        )
+        gse_lines[gse_acc] = gse_node.start_mark.line + 1
+        _check_yaml(
+            isinstance(pairs_node, yaml.SequenceNode) and pairs_node.value,
+            pairs_node,
+            f"{gse_acc} must be a non-empty list of pairs",
+            path,
+        )
+        for pair_node in pairs_node.value:
+            _check_yaml(
+                isinstance(pair_node, yaml.MappingNode) and pair_node.value,
+                pair_node,
+                "Pair must be a mapping of groups (e.g. 'control', 'treatment') to Sample attributes",
+                path,
+            )
+            groups = set()
+            for group_node, attribs_node in pair_node.value:
+                _check_yaml_str(group_node, "Group", path)
+                _check_yaml(
+                    group_node.value not in groups,
+                    group_node,
+                    f"Duplicate group {group_node.value}",
+                    path,
+                )
+                groups.add(group_node.value)
+                _check_yaml(
+                    isinstance(attribs_node, yaml.MappingNode) and attribs_node.value,
+                    attribs_node,
+                    f"Group {group_node.value} must be a mapping of Sample attributes to regular expressions",
+                    path,
+                )
+                attribs = set()
+                for attrib_node, pattern_node in attribs_node.value:
+                    _check_yaml_str(attrib_node, "Sample attribute", path)
+                    _check_yaml(
+                        attrib_node.value not in attribs,
+                        attrib_node,
+                        f"Duplicate attribute {attrib_node.value}",
+                        path,
+                    )
+                    attribs.add(attrib_node.value)
+                    _check_yaml_str(pattern_node, "Regular expression", path)
+
+
+def iter_yaml(path: StrPath) -> Iterator[tuple[GseAcc, list[PairRegex]]]:
+    """Read series from a YAML file, one document at a time.
+
+    A file of many documents (separated by "---") is read one document at a time,
+    so that the first series are available before the rest of the file is parsed.
 
-import pandas as pd
-from yaml import safe_load
+    Args:
+        path (StrPath): Path to YAML file.
+
+    Raises:
+        InputError: If the file is not valid YAML, or not a mapping of GSE accessions to
+            lists of pair regex.
 
-from .types import GeoRegex, PairRegex, StrPath
+    Yields:
+        tuple[GseAcc, list[PairRegex]]: GSE accession and its list of pair regex.
+    """
+    gse_lines: dict[GseAcc, int] = {}
+    with open(path, encoding="utf-8") as f:
+        loader = YamlLoader(f)
+        try:
+            while True:
+                try:
+                    if not loader.check_node():
+                        return
+                    document = loader.get_node()
+                except yaml.YAMLError as e:
+                    raise InputError(f"{path}: {e}") from e
+                if document.tag == "tag:yaml.org,2002:null":
+                    continue  # empty document
+                _validate_yaml_document(document, path, gse_lines)
+                yield from loader.construct_document(document).items()
+        finally:
+            loader.dispose()
+
+
+def iter_csv(path: StrPath, sep: str = ",") -> Iterator[tuple[GseAcc, list[PairRegex]]]:
+    """Read series from a CSV file, one series at a time.
+
+    The file has the columns `CSV_COLUMNS`, with a row for each regular expression of
+    each group of each pair. The rows of a series must be contiguous.
 
+    Args:
+        path (StrPath): Path to CSV file.
+        sep (str, optional): field delimiter. Defaults to ",".
 
-def load_yaml(path: StrPath) -> GeoRegex:
-    """Load YAML file
+    Raises:
+        InputError: If the columns or a row are invalid.
+
+    Yields:
+        tuple[GseAcc, list[PairRegex]]: GSE accession and its list of pair regex.
+    """
+    with open(path, encoding="utf-8", newline="") as f:
+        reader = csv.reader(f, delimiter=sep)
+        header = next(reader, None)
+        if header != CSV_COLUMNS:
+            raise InputError(f"{path}:1: Columns must be {CSV_COLUMNS}: {header}")
+        gse_acc: GseAcc | None = None
+        pairs: dict[str, PairRegex] = {}
+        gse_rows: dict[GseAcc, int] = {}
+        for i, row in enumerate(reader, start=1):
+            if not row:
+                continue  # blank line
+            where = f"{path}:{reader.line_num}: row {i}"
+            if len(row) != len(CSV_COLUMNS) or not all(row):
+                raise InputError(
+                    f"{where}: Expected {len(CSV_COLUMNS)} non-empty fields: {row}"
+                )
+            gse, pair, group, attrib, pattern = row
+            if gse != gse_acc:
+                if not gse.startswith("GSE"):
+                    raise InputError(f"{where}: gse must start with 'GSE': {gse}")
+                if gse in gse_rows:
+                    raise InputError(
+                        f"{where}: Rows of {gse} must be contiguous (first at row {gse_rows[gse]})"
+                    )
+                if gse_acc is not None:
+                    yield gse_acc, list(pairs.values())
+                gse_acc, pairs = gse, {}
+                gse_rows[gse] = i
+            attrib_regex = pairs.setdefault(pair, {}).setdefault(group, {})
+            if attrib in attrib_regex:
+                raise InputError(
+                    f"{where}: Duplicate attribute {attrib} of {group} of pair {pair}"
+                )
+            attrib_regex[attrib] = pattern
+        if gse_acc is not None:
+            yield gse_acc, list(pairs.values())
+
+
+def iter_input(input_path: StrPath) -> Iterator[tuple[GseAcc, list[PairRegex]]]:
+    """Read series from an input file, one at a time, validating it as it is read.
 
     Args:
-        path (StrPath): Path to YAML file.
+        input_path (StrPath): Path to input file.
+
+    Raises:
+        ValueError: If input file type is not supported.
 
     Returns:
-        GeoRegex: Dictionary of regular expressions.
+        Iterator[tuple[GseAcc, list[PairRegex]]]: GSE accession and its list of pair
+            regex, in input order. Raises `InputError` where the file is invalid.
     """
-    with open(path) as f:
-        # TODO: validate YAML
-        return safe_load(f)
+    suf = Path(input_path).suffix
+    if suf in (".yaml", ".yml"):
+        return iter_yaml(input_path)
+    elif suf == ".csv":
+        return iter_csv(input_path)
+    elif suf == ".tsv":
+        return iter_csv(input_path, sep="\t")
+    else:
+        raise ValueError("Supported file types are .yaml, .yml, .csv, .tsv.")
 
 
-def dataframe_to_dict(regex_df: pd.DataFrame) -> GeoRegex:
-    """Convert DataFrame to dictionary of regular expressions.
+def load_yaml(path: StrPath) -> GeoRegex:
+    """Load YAML file
 
     Args:
-        regex_df (pd.DataFrame): DataFrame of regular expressions.
+        path (StrPath): Path to YAML file.
 
     Returns:
         GeoRegex: Dictionary of regular expressions.
     """
-    use_cols = ["gse", "pair", "group", "attrib", "pattern"]
-    assert (
-        regex_df.columns.tolist() == use_cols
-    ), f"DataFrame columns are invalid: {regex_df.columns.tolist()}"
-    regex_dict: GeoRegex = {}
-    for (gse_acc, _), gse_pair in regex_df.groupby(["gse", "pair"], sort=False):
-        assert gse_acc.startswith("GSE"), "gse column must start with 'GSE'."
-        regex_dict.setdefault(gse_acc, [])
-        pair: PairRegex = {}
-        for group, regex_df in gse_pair.groupby("group", sort=False):
-            pair[group] = regex_df.set_index("attrib")["pattern"].to_dict()
-        regex_dict[gse_acc].append(pair)
-    return regex_dict
-
-
-def load_csv(csv_path: StrPath, **kwargs) -> GeoRegex:
+    return dict(iter_yaml(path))
+
+
+def load_csv(csv_path: StrPath, sep: str = ",") -> GeoRegex:
     """Load CSV file
 
     Args:
         csv_path (StrPath): Path to CSV file.
+        sep (str, optional): field delimiter. Defaults to ",".
 
     Returns:
         GeoRegex: Dictionary of regular expressions.
     """
-    return dataframe_to_dict(pd.read_csv(csv_path, **kwargs))
+    return dict(iter_csv(csv_path, sep=sep))
 
 
 def load_input(input_path: StrPath) -> GeoRegex:
@@ -70,12 +248,4 @@ def load_input(input_path: StrPath) -> GeoRegex:
     Returns:
         GeoRegex: Dictionary of regular expressions.
     """
-    suf = Path(input_path).suffix
-    if suf in (".yaml" | ".yml"):
-        return load_yaml(input_path)
-    elif suf == ".csv":
-        return load_csv(input_path)
-    elif suf == ".tsv":
-        return load_csv(input_path, sep="\t")
-    else:
-        raise ValueError("Supported file types are .yaml, .yml, .csv, .tsv.")
+    return dict(iter_input(input_path))
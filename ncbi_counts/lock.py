@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+from __future__ import annotations
+from contextlib import contextmanager
+import os
+from pathlib import Path
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, where files are not locked
+    fcntl = None
+
+LOCK_SUFFIX = ".lock"
+
+
+def get_lock_path(path: Path, state_dir: Path) -> Path:
+    """Get path of the lock file of a source file.
+
+    Args:
+        path (Path): file path of source file.
+        state_dir (Path): directory of download state.
+
+    Returns:
+        Path: file path of lock file.
+    """
+    return state_dir.joinpath(path.name + LOCK_SUFFIX)
+
+
+def _open_locked(lock_path: Path, operation: int) -> int:
+    # A lock file removed (with the source file) while waiting for it no longer locks
+    # anything, so lock the file at the path again.
+    while True:
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.flock(fd, operation)
+            if os.fstat(fd).st_ino == os.stat(lock_path).st_ino:
+                return fd
+        except FileNotFoundError:
+            pass
+        except BaseException:
+            os.close(fd)
+            raise
+        os.close(fd)
+
+
+@contextmanager
+def file_lock(
+    lock_path: Path, shared: bool = False, blocking: bool = True
+) -> Iterator[None]:
+    """Hold a lock shared with other processes (and threads) on a lock file.
+
+    Any number of shared locks, or a single exclusive lock, are held at once. Locks are
+    released when the process ends, even if it crashes.
+
+    Args:
+        lock_path (Path): file path of lock file (created if it does not exist).
+        shared (bool, optional): If True, hold a shared lock. Defaults to False (exclusive).
+        blocking (bool, optional): If False, fail instead of waiting. Defaults to True.
+
+    Raises:
+        BlockingIOError: If the lock is held by others and `blocking` is False.
+
+    Yields:
+        None: while the lock is held.
+    """
+    if fcntl is None:
+        yield
+        return
+    operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    if not blocking:
+        operation |= fcntl.LOCK_NB
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    fd = _open_locked(lock_path, operation)
+    try:
+        yield
+    finally:
+        os.close(fd)
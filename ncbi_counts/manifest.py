@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+import hashlib
+import json
+import os
+from pathlib import Path
+import secrets
+
+from .cache import source_fingerprint
+from .core import Series
+from .fetch import Validators, get_state_paths
+from .types import AnnotColumns, GseAcc, PairGsms, PairRegex, StrPath
+from .utils import (
+    get_annot_url,
+    get_count_url,
+    get_download_state_dir,
+    get_soft_url,
+    parse_filename_from_url,
+)
+
+# hidden file next to pair count files
+RUN_MANIFEST_NAME = ".ncbi_counts.run.json"
+# bump when the entries change, so that old manifests are ignored
+RUN_MANIFEST_VERSION = 1
+
+
+def hash_inputs(pair_regex_list: list[PairRegex], **settings) -> str:
+    """Hash the pair regex of a series and the settings its outputs depend on.
+
+    Args:
+        pair_regex_list (list[PairRegex]): pair regex of series.
+        **settings: other inputs (e.g. normalization and annotation, separator).
+
+    Returns:
+        str: SHA-256 hex digest.
+    """
+    inputs = {"pair_regex_list": pair_regex_list, **settings}
+    text = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def get_source_paths(
+    gse_acc: GseAcc,
+    src_dir: StrPath = "./",
+    count_norm_type: str | None = None,
+    count_annot_ver: str = "GRCh38.p13",
+    keep_annot: AnnotColumns = [],
+    local_norm: bool = False,
+) -> list[Path]:
+    """Get file paths of the source files of a series (as `Series` sets them).
+
+    Args:
+        gse_acc (GseAcc): GSE accession.
+        src_dir (StrPath, optional): source directory. Defaults to "./".
+        count_norm_type (str | None, optional): normalization type. Defaults to None.
+        count_annot_ver (str, optional): annotation version. Defaults to "GRCh38.p13".
+        keep_annot (AnnotColumns, optional): annotation columns to keep. Defaults to [].
+        local_norm (bool, optional): if True, counts are normalized from raw counts. Defaults to False.
+
+    Returns:
+        list[Path]: file paths of SOFT, count, and annotation (if used) files.
+    """
+    norm_type = None if local_norm else count_norm_type
+    urls = [
+        get_soft_url(gse_acc),
+        get_count_url(gse_acc, norm_type=norm_type, annot_ver=count_annot_ver),
+    ]
+    if keep_annot or norm_type != count_norm_type:
+        urls.append(get_annot_url(annot_ver=count_annot_ver))
+    return [Path(src_dir).joinpath(parse_filename_from_url(url)) for url in urls]
+
+
+def get_source_fingerprint(path: Path) -> dict | None:
+    """Get the ETag and size of a downloaded source file.
+
+    Files without an ETag (e.g. placed by hand) are identified by size and
+    modification time instead.
+
+    Args:
+        path (Path): file path of source file.
+
+    Returns:
+        dict | None: fingerprint of source file, or None if it does not exist.
+    """
+    if not path.is_file():
+        return None
+    _, state_path = get_state_paths(path, get_download_state_dir(path))
+    validators = Validators.load(state_path)
+    if validators is not None and validators.etag is not None:
+        return {"etag": validators.etag, "size": path.stat().st_size}
+    return source_fingerprint(path)
+
+
+@dataclass
+class RunManifest:
+    """Inputs, sources and outputs of each series built into a directory.
+
+    A series is up to date, and is not built again, if its inputs are unchanged, all of
+    its outputs exist, and none of its source files changed. As intermediate files in
+    make, source files removed since (e.g. by `cleanup`) do not make it stale.
+    """
+
+    path: Path
+    entries: dict[GseAcc, dict] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, save_to: StrPath, name: str = RUN_MANIFEST_NAME) -> RunManifest:
+        """Load the manifest of a directory of pair count files.
+
+        Args:
+            save_to (StrPath): save directory.
+            name (str, optional): file name of manifest. Defaults to RUN_MANIFEST_NAME.
+
+        Returns:
+            RunManifest: manifest, empty if it does not exist or cannot be read.
+        """
+        path = Path(save_to).joinpath(name)
+        try:
+            with open(path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return cls(path)
+        if manifest.get("version") != RUN_MANIFEST_VERSION:
+            return cls(path)
+        return cls(path, manifest.get("series", {}))
+
+    def dump(self):
+        """Save the manifest atomically."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f".{self.path.name}.{secrets.token_hex(4)}.tmp")
+        try:
+            with open(tmp_path, "x", encoding="utf-8") as f:
+                json.dump(
+                    {"version": RUN_MANIFEST_VERSION, "series": self.entries},
+                    f,
+                    ensure_ascii=False,
+                    indent=1,
+                )
+            os.replace(tmp_path, self.path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    def is_up_to_date(
+        self, gse_acc: GseAcc, inputs: str, source_paths: list[Path]
+    ) -> bool:
+        """Check if a series is built from the same inputs and sources.
+
+        Args:
+            gse_acc (GseAcc): GSE accession.
+            inputs (str): hash of inputs (`hash_inputs`).
+            source_paths (list[Path]): file paths of source files.
+
+        Returns:
+            bool: True if the series does not need to be built again.
+        """
+        entry = self.entries.get(gse_acc)
+        if entry is None or entry["inputs"] != inputs:
+            return False
+        if not all(self.path.with_name(name).is_file() for name in entry["outputs"]):
+            return False
+        for path in source_paths:
+            fingerprint = get_source_fingerprint(path)
+            if fingerprint is not None and fingerprint != entry["sources"].get(
+                path.name
+            ):
+                return False
+        return True
+
+    def get_pair_gsms_list(self, gse_acc: GseAcc) -> list[PairGsms]:
+        """Get the matched GSMs recorded for a series.
+
+        Args:
+            gse_acc (GseAcc): GSE accession.
+
+        Returns:
+            list[PairGsms]: a dictionary of GSMs (value) for each group (key), for each pair.
+        """
+        return self.entries[gse_acc]["pair_gsms_list"]
+
+    def record(self, series: Series, inputs: str, source_paths: list[Path]):
+        """Record a series built into the directory.
+
+        Args:
+            series (Series): built series.
+            inputs (str): hash of inputs (`hash_inputs`).
+            source_paths (list[Path]): file paths of source files.
+        """
+        self.entries[series.gse_acc] = {
+            "inputs": inputs,
+            "sources": {
+                path.name: get_source_fingerprint(path) for path in source_paths
+            },
+            "outputs": [path.name for path in series.get_output_paths()],
+            "pair_gsms_list": series.pair_gsms_list,
+        }
+
+    def discard(self, gse_acc: GseAcc):
+        """Forget a series, so that it is built again.
+
+        Args:
+            gse_acc (GseAcc): GSE accession.
+        """
+        self.entries.pop(gse_acc, None)
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+import re
+from typing import Iterable, Mapping
+import warnings
+
+from GEOparse.GEOTypes import GSM
+import numpy as np
+
+from .types import GsmAcc, GsmMetadata, PairGsms, PairRegex
+
+
+@dataclass
+class AttribColumn:
+    """Values of one Sample attribute for all GSMs, factorized.
+
+    Each non-empty value of each GSM is an entry: `owners` holds the GSM index and
+    `codes` the index into `uniques` of every entry.
+    """
+
+    present: np.ndarray
+    owners: np.ndarray
+    codes: np.ndarray
+    uniques: list[str]
+
+
+@dataclass
+class SampleTable:
+    """GSM x attribute table of Sample metadata, built once per series.
+
+    A predicate (attribute, pattern) is compiled once and evaluated once per unique
+    value of the attribute, then spread to all GSMs with array operations. Results
+    are memoized, so predicates shared by several pairs or groups cost nothing.
+    """
+
+    gsms: list[GsmAcc]
+    accessions: list[str] = field(repr=False)
+    columns: dict[str, AttribColumn] = field(repr=False)
+    _predicates: dict[tuple[str, str], np.ndarray] = field(
+        default_factory=dict, init=False, repr=False
+    )
+
+    @classmethod
+    def from_metadata(cls, metadata: Mapping[GsmAcc, GsmMetadata]) -> SampleTable:
+        """Build a table from metadata of each GSM.
+
+        Args:
+            metadata (Mapping[GsmAcc, GsmMetadata]): metadata (value) of each GSM (key).
+
+        Returns:
+            SampleTable: GSM x attribute table.
+        """
+        gsms = list(metadata)
+        accessions = [(metadata[gsm].get("geo_accession") or [gsm])[0] for gsm in gsms]
+        present: dict[str, list[int]] = {}
+        entries: dict[str, tuple[list[int], list[str]]] = {}
+        for i, gsm in enumerate(gsms):
+            for attrib, values in metadata[gsm].items():
+                if values is None:
+                    continue
+                present.setdefault(attrib, []).append(i)
+                owners, attrib_values = entries.setdefault(attrib, ([], []))
+                for v in values:
+                    if v != "":
+                        owners.append(i)
+                        attrib_values.append(v)
+        columns: dict[str, AttribColumn] = {}
+        for attrib, rows in present.items():
+            owners, attrib_values = entries[attrib]
+            present_mask = np.zeros(len(gsms), dtype=bool)
+            present_mask[rows] = True
+            uniques: dict[str, int] = {}
+            codes = [uniques.setdefault(v, len(uniques)) for v in attrib_values]
+            columns[attrib] = AttribColumn(
+                present=present_mask,
+                owners=np.array(owners, dtype=np.intp),
+                codes=np.array(codes, dtype=np.intp),
+                uniques=list(uniques),
+            )
+        return cls(gsms=gsms, accessions=accessions, columns=columns)
+
+    @classmethod
+    def from_gsms(cls, gsms: Iterable[GSM]) -> SampleTable:
+        """Build a table from GEOparse GSMs.
+
+        Args:
+            gsms (Iterable[GSM]): GSMs of a series.
+
+        Returns:
+            SampleTable: GSM x attribute table.
+        """
+        return cls.from_metadata({gsm.name: gsm.metadata for gsm in gsms})
+
+    def present(self, attrib: str) -> np.ndarray:
+        """Get which GSMs have an attribute.
+
+        Args:
+            attrib (str): attribute.
+
+        Returns:
+            np.ndarray: boolean array for each GSM.
+        """
+        column = self.columns.get(attrib)
+        if column is None:
+            return np.zeros(len(self.gsms), dtype=bool)
+        return column.present
+
+    def search(self, attrib: str, pattern: str) -> np.ndarray:
+        """Get which GSMs have a value of an attribute matching a regex.
+
+        Args:
+            attrib (str): attribute.
+            pattern (str): regex searched in each value.
+
+        Returns:
+            np.ndarray: boolean array for each GSM.
+        """
+        key = (attrib, pattern)
+        if key not in self._predicates:
+            column = self.columns.get(attrib)
+            if column is None:
+                matched = np.zeros(len(self.gsms), dtype=bool)
+            else:
+                regex = re.compile(pattern)
+                hits = np.fromiter(
+                    (regex.search(v) is not None for v in column.uniques),
+                    dtype=bool,
+                    count=len(column.uniques),
+                )
+                matched = (
+                    np.bincount(
+                        column.owners,
+                        weights=hits[column.codes],
+                        minlength=len(self.gsms),
+                    )
+                    > 0
+                )
+            self._predicates[key] = matched
+        return self._predicates[key]
+
+    def match(self, attrib_regex: dict[str, str], silent: bool = False) -> np.ndarray:
+        """Get which GSMs match all regex of attributes (same as `is_matched`).
+
+        Args:
+            attrib_regex (dict[str, str]): a dictionary of regex (value) for each attribute (key).
+            silent (bool, optional): if True, suppress warnings. Defaults to False.
+
+        Returns:
+            np.ndarray: boolean array for each GSM.
+        """
+        matched = np.ones(len(self.gsms), dtype=bool)
+        for attrib, pattern in attrib_regex.items():
+            matched &= self.search(attrib, pattern)
+        if not silent:
+            missing = [~self.present(attrib) for attrib in attrib_regex]
+            if missing:
+                for i in np.flatnonzero(np.logical_or.reduce(missing)):
+                    for attrib, attrib_missing in zip(attrib_regex, missing):
+                        if attrib_missing[i]:
+                            warnings.warn(
+                                f"Attribute '{attrib}' not found in {self.accessions[i]}"
+                            )
+        return matched
+
+    def match_pair(self, pair_regex: PairRegex, silent: bool = False) -> PairGsms:
+        """Match GSMs to regex (same as `match_pair_gsms`).
+
+        Args:
+            pair_regex (PairRegex): a dictionary of regex dictionary (value) for each group (key).
+            silent (bool, optional): if True, suppress warnings. Defaults to False.
+
+        Returns:
+            PairGsms: a dictionary of GSMs (value) for each group (key).
+        """
+        pair_gsms: PairGsms = {}
+        for group, group_regex_dict in pair_regex.items():
+            matched = self.match(group_regex_dict, silent=silent)
+            if matched.any():
+                pair_gsms[group] = [self.gsms[i] for i in np.flatnonzero(matched)]
+            else:
+                if not silent:
+                    warnings.warn(f"No GSMs matched for {group}")
+        return pair_gsms
@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+
+from pathlib import Path
+
+from .parser import parse_merge_args
+from .shard import merge_shards
+from .types import StrPath
+
+if __name__ == "__main__":
+    args = parse_merge_args()
+
+    geo_regex_path: StrPath = args.input
+    yaml_paths: list[Path] = args.shard_yaml
+    to_yaml: StrPath | None = args.yaml
+    save_to: StrPath = args.output
+
+    merge_shards(
+        geo_regex_path=geo_regex_path,
+        yaml_paths=yaml_paths,
+        to_yaml=to_yaml,
+        save_to=save_to,
+    )
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+from __future__ import annotations
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+from .types import CountNorm
+from .utils import COUNT_DTYPES
+
+# NCBI's normalized count files round values to 2 decimals, so values computed here
+# (as float32) match them within half of that, plus float32 precision:
+# abs(local - ncbi) <= NORM_ATOL + NORM_RTOL * abs(ncbi)
+NORM_ATOL = 0.005
+NORM_RTOL = 1e-6
+
+
+def _normalize(
+    values: np.ndarray, lengths: np.ndarray, norm_types: Iterable[CountNorm]
+) -> dict[CountNorm, np.ndarray]:
+    # values: genes x GSMs (or non-zero counts of one GSM), and lengths of the genes
+    # broadcastable to it
+    values = values.astype("float64", copy=False)
+    totals = values.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # counts per base, zero where there are no counts (even without a length)
+        rates = np.where(values != 0, values / lengths, 0.0)
+        rate_totals = np.nansum(rates, axis=0)
+        scales = {
+            "fpkm": np.where(totals > 0, 1e9 / totals, 0.0),
+            "tpm": np.where(rate_totals > 0, 1e6 / rate_totals, 0.0),
+        }
+    return {
+        norm_type: (rates * scales[norm_type]).astype(COUNT_DTYPES[norm_type])
+        for norm_type in norm_types
+    }
+
+
+def normalize_counts(
+    count: pd.DataFrame,
+    length: pd.Series,
+    norm_types: Iterable[CountNorm] = CountNorm.__args__,
+) -> dict[CountNorm, pd.DataFrame]:
+    """Normalize raw counts as NCBI does, computing all normalizations in one pass.
+
+    For a gene of length L (bases) with count c in a GSM whose counts sum to N:
+
+    - FPKM = c * 10^9 / (L * N)
+    - TPM = (c / L) * 10^6 / sum(c / L), where the sum is over all genes of the GSM
+
+    Sums are over the rows of `count`, so it must hold all genes (but may hold only
+    some GSMs). Counts of genes without a length become NaN, and zero counts stay zero,
+    so sparse columns stay sparse. Values match NCBI's files within `NORM_ATOL` and
+    `NORM_RTOL`.
+
+    Args:
+        count (pd.DataFrame): raw count DataFrame (genes x GSMs, dense or sparse columns).
+        length (pd.Series): gene length (bases) indexed by GeneID, e.g. the Length
+            column of the annotation table.
+        norm_types (Iterable[CountNorm], optional): normalizations to compute.
+            Defaults to all ("fpkm", "tpm").
+
+    Returns:
+        dict[CountNorm, pd.DataFrame]: normalized count DataFrame (float32) for each
+            normalization type.
+    """
+    norm_types = list(norm_types)
+    lengths = length.reindex(count.index).to_numpy(dtype="float64", na_value=np.nan)
+    columns: dict[CountNorm, dict] = {norm_type: {} for norm_type in norm_types}
+    sparse = [
+        col for col, dtype in count.dtypes.items() if isinstance(dtype, pd.SparseDtype)
+    ]
+    dense = [col for col in count.columns if col not in set(sparse)]
+    if dense:
+        normalized = _normalize(
+            count[dense].to_numpy(), lengths[:, np.newaxis], norm_types
+        )
+        for norm_type, values in normalized.items():
+            columns[norm_type].update(zip(dense, values.T))
+    for col in sparse:
+        array: pd.arrays.SparseArray = count[col].array
+        indices = array.sp_index.indices
+        normalized = _normalize(array.sp_values, lengths[indices], norm_types)
+        for norm_type, values in normalized.items():
+            columns[norm_type][col] = pd.arrays.SparseArray(
+                values,
+                sparse_index=array.sp_index,
+                fill_value=0,
+                dtype=pd.SparseDtype(values.dtype, 0),
+            )
+    return {
+        norm_type: pd.DataFrame(
+            {col: columns[norm_type][col] for col in count.columns},
+            index=count.index,
+        )
+        for norm_type in norm_types
+    }
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+from __future__ import annotations
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator, Mapping
+import warnings
+
+from .core import Series
+from .scheduler import NCBI_RATE_LIMIT, FetchScheduler
+from .soft import get_metadata_cache_path
+from .types import AnnotColumns, CountNorm, GeoRegex, GseAcc, PairRegex, StrPath
+from .utils import (
+    get_annot_url,
+    get_count_url,
+    get_soft_url,
+    parse_filename_from_url,
+)
+
+# (message, category, filename, lineno) of a warning, picklable across processes
+CaughtWarning = tuple[str, type[Warning], str, int]
+
+
+def _record(caught: list[warnings.WarningMessage]) -> list[CaughtWarning]:
+    return [(str(w.message), w.category, w.filename, w.lineno) for w in caught]
+
+
+def _replay(caught: list[CaughtWarning], registry: dict):
+    for message, category, filename, lineno in caught:
+        warnings.warn_explicit(message, category, filename, lineno, registry=registry)
+
+
+def _release(series: Series):
+    # matrices are saved by the worker, so they are not sent back to the parent
+    series.count = None
+    series.annot = None
+    series.series_count = None
+    series.pair_count_list = []
+
+
+def _generate_pair_matrix(
+    series: Series,
+) -> tuple[Series, str | None, list[CaughtWarning]]:
+    # Runs in a worker process, so recording warnings here is not racy.
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        try:
+            series.generate_pair_matrix()
+            error = None
+        except ValueError as e:
+            error = str(e)
+    _release(series)
+    return series, error, _record(caught)
+
+
+def _iter_series_serial(
+    entries: Iterable[tuple[GseAcc, list[PairRegex]]], **series_kwargs
+) -> Iterator[tuple[Series, str | None]]:
+    for gse, pair_regex_list in entries:
+        series = Series(
+            gse_acc=gse, pair_regex_list=pair_regex_list.copy(), **series_kwargs
+        )
+        try:
+            series.generate_pair_matrix()
+            error = None
+        except ValueError as e:
+            error = str(e)
+        yield series, error
+
+
+def iter_series(
+    regex_dict: GeoRegex | Iterable[tuple[GseAcc, list[PairRegex]]],
+    count_norm_type: CountNorm | None = None,
+    count_annot_ver: str = "GRCh38.p13",
+    keep_annot: AnnotColumns = [],
+    src_dir: StrPath = "./",
+    local_norm: bool = False,
+    max_workers: int | None = None,
+    rate_limit: float = NCBI_RATE_LIMIT,
+    **series_kwargs,
+) -> Iterator[tuple[Series, str | None]]:
+    """Generate pair count matrices of each series in input order.
+
+    With `max_workers` > 1, source files of all series are downloaded ahead of time by
+    a rate-limited `FetchScheduler`, and the rest (parsing SOFT files, matching GSMs,
+    and building and writing the pair count matrices) runs on a process pool, so a
+    series is processed while the sources of the next ones are downloaded. Matrices
+    are saved by the workers and not sent back, so the yielded series hold their GSMs,
+    output paths and stage events, but not their count or pair count matrices.
+    Warnings are replayed in the same order as in a serial run.
+
+    Series can also be given as they are read from an input file (`iter_input`). They
+    are processed as they come when serial, and all read first otherwise.
+
+    Args:
+        regex_dict (GeoRegex | Iterable[tuple[GseAcc, list[PairRegex]]]): a list of
+            pair regex (value) for each series (key), or pairs of both.
+        count_norm_type (CountNorm | None, optional): normalization type. Defaults to None.
+        count_annot_ver (str, optional): annotation version. Defaults to "GRCh38.p13".
+        keep_annot (AnnotColumns, optional): annotation columns to keep. Defaults to [].
+        src_dir (StrPath, optional): source directory. Defaults to "./".
+        local_norm (bool, optional): if True, normalize raw counts instead of downloading normalized ones. Defaults to False.
+        max_workers (int | None, optional): number of workers. Defaults to None (serial).
+        rate_limit (float, optional): requests per second to NCBI. Defaults to NCBI_RATE_LIMIT.
+        **series_kwargs: other arguments passed to `Series`.
+
+    Yields:
+        tuple[Series, str | None]: series and the reason why it was skipped (if any).
+    """
+    series_kwargs.update(
+        count_norm_type=count_norm_type,
+        count_annot_ver=count_annot_ver,
+        keep_annot=keep_annot,
+        src_dir=src_dir,
+        local_norm=local_norm,
+    )
+    entries = regex_dict.items() if isinstance(regex_dict, Mapping) else regex_dict
+    if max_workers is None or max_workers <= 1:
+        yield from _iter_series_serial(entries, **series_kwargs)
+        return
+    # prefetching downloads the sources of all series ahead
+    regex_dict = dict(entries)
+
+    src_dir = Path(src_dir)
+    src_dir.mkdir(parents=True, exist_ok=True)
+    registry: dict = {}
+    with FetchScheduler(rate=rate_limit) as scheduler, ProcessPoolExecutor(
+        max_workers
+    ) as cpu_pool:
+
+        def submit_prefetch(url: str) -> Future:
+            return scheduler.submit(url, src_dir.joinpath(parse_filename_from_url(url)))
+
+        # the count matrix downloaded, and whether the annotation table is used
+        norm_type = None if local_norm else count_norm_type
+        annot_future = None
+        if keep_annot or norm_type != count_norm_type:
+            annot_future = submit_prefetch(get_annot_url(annot_ver=count_annot_ver))
+        fetch_futures: dict[str, tuple[Future | None, Future]] = {}
+        for gse in regex_dict:
+            soft_url = get_soft_url(gse)
+            soft_path = src_dir.joinpath(parse_filename_from_url(soft_url))
+            has_metadata = (
+                series_kwargs.get("metadata_cache")
+                and get_metadata_cache_path(soft_path).is_file()
+            )
+            fetch_futures[gse] = (
+                None if has_metadata else submit_prefetch(soft_url),
+                submit_prefetch(
+                    get_count_url(gse, norm_type=norm_type, annot_ver=count_annot_ver)
+                ),
+            )
+
+        pending: list[Future] = []
+        for gse, pair_regex_list in regex_dict.items():
+            # downloads complete about in input order, as they are submitted
+            for future in fetch_futures[gse] + (annot_future,):
+                if future is not None:
+                    future.result()
+            series = Series(
+                gse_acc=gse, pair_regex_list=pair_regex_list.copy(), **series_kwargs
+            )
+            pending.append(cpu_pool.submit(_generate_pair_matrix, series))
+
+        for future in pending:
+            series, error, caught = future.result()
+            _replay(caught, registry)
+            yield series, error
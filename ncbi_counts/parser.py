@@ -3,18 +3,83 @@
 import argparse
 from pathlib import Path
 
-from ncbi_counts.types import AnnotColumn, CountNorm
+from ncbi_counts.scheduler import NCBI_RATE_LIMIT
+from ncbi_counts.shard import Shard
+from ncbi_counts.types import (
+    AnnotColumn,
+    Compression,
+    CountCache,
+    CountNorm,
+    OutputFormat,
+)
+from ncbi_counts.writer import check_output_format
 
 
-def parse_args() -> argparse.Namespace:
+def parse_shard(text: str) -> Shard:
+    """Parse a shard as I/N, reporting errors as argparse does."""
+    try:
+        return Shard.parse(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def parse_merge_args(args: list[str] | None = None) -> argparse.Namespace:
+    """Parse command-line arguments of `python -m ncbi_counts.merge`.
+
+    Args:
+        args (list[str] | None, optional): arguments. Defaults to None (sys.argv[1:]).
+
+    Returns:
+        argparse.Namespace: parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        prog="ncbi_counts.merge",
+        description="Merge the outputs of the shards of an input file (see --shard), as if it was run in one process.",
+    )
+    parser.add_argument(
+        "input",
+        metavar="FILE",
+        type=Path,
+        help="Path to input file (.yaml, .yml, .csv, .tsv) run in shards",
+    )
+    parser.add_argument(
+        "shard_yaml",
+        metavar="SHARD_YAML",
+        nargs="+",
+        type=Path,
+        help="Path to YAML file which contains GSMs, saved by each shard",
+    )
+    parser.add_argument(
+        "-y",
+        "--yaml",
+        metavar="GSM_YAML",
+        type=Path,
+        default=None,
+        help="Path to save YAML file which contains GSMs of all shards (default: None)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        default=Path(),
+        help="A directory whose run manifests of shards are merged into one (default: ./)",
+    )
+    return parser.parse_args(args)
+
+
+def parse_args(args: list[str] | None = None) -> argparse.Namespace:
     """Parse command-line arguments.
 
+    Args:
+        args (list[str] | None, optional): arguments. Defaults to None (sys.argv[1:]).
+
     Returns:
         argparse.Namespace: parsed arguments.
     """
     parser = argparse.ArgumentParser(
         prog="ncbi_counts",
         description="Download the NCBI-generated RNA-seq count data by specifying the Series accession number(s), and the regular expression of the Sample attributes.",
+        epilog="Run 'python -m ncbi_counts.merge -h' for merging the outputs of shards.",
     )
     parser.add_argument(
         "input",
@@ -30,10 +95,17 @@ def parse_args() -> argparse.Namespace:
         "-n",
         "--norm-type",
         metavar="NORM",
-        type=CountNorm,
-        choices=[None] + [a for a in CountNorm.__args__],
+        type=str,
+        choices=CountNorm.__args__,
         default=None,
-        help=f'Normalization type of counts (choices: None, {", ".join(CountNorm.__args__)}, default: None)',
+        help=f'Normalization type of counts (choices: {", ".join(CountNorm.__args__)}, default: None)',
+    )
+    parser.add_argument(
+        "-l",
+        "--local-norm",
+        default=False,
+        action="store_true",
+        help="If True, compute NORM from raw counts and the gene lengths of the annotation table, instead of downloading the normalized counts of NCBI (default: False)",
     )
     parser.add_argument(
         "-a",
@@ -58,7 +130,7 @@ def parse_args() -> argparse.Namespace:
         "--src-dir",
         type=Path,
         default=Path(),
-        help="A directory to save the source obtained from NCBI (default: ./)",
+        help="A directory to save the source obtained from NCBI, which can be shared by concurrent runs (default: ./)",
     )
     parser.add_argument(
         "-o",
@@ -94,6 +166,138 @@ def parse_args() -> argparse.Namespace:
         "--cleanup",
         default=False,
         action="store_true",
-        help="If True, remove source files (default: False)",
+        help="If True, remove source files not in use by other runs (default: False)",
+    )
+    parser.add_argument(
+        "-i",
+        "--incremental",
+        default=False,
+        action="store_true",
+        help="If True, skip series whose inputs and source files are unchanged since their count matrices were saved to OUTPUT, as recorded in a run manifest there (default: False)",
+    )
+    parser.add_argument(
+        "-d",
+        "--plan",
+        "--dry-run",
+        dest="plan",
+        default=False,
+        action="store_true",
+        help="If True, print the URL and status of the sources of each series, and the files to download, without downloading or reading them (default: False)",
+    )
+    parser.add_argument(
+        "-x",
+        "--shard",
+        metavar="I/N",
+        type=parse_shard,
+        default=None,
+        help="Process only the I-th of N shards of the series in FILE, assigned by a hash of their GSE accession, and merge their outputs by 'python -m ncbi_counts.merge' (default: None)",
+    )
+    parser.add_argument(
+        "-w",
+        "--weighted",
+        default=False,
+        action="store_true",
+        help="If True, assign series to shards balancing their number of pairs instead (default: False)",
+    )
+    parser.add_argument(
+        "-O",
+        "--output-format",
+        metavar="FORMAT",
+        type=str,
+        choices=OutputFormat.__args__,
+        default="tsv",
+        help=f'Format of output files (choices: {", ".join(OutputFormat.__args__)}, default: tsv)',
+    )
+    parser.add_argument(
+        "-D",
+        "--consolidate",
+        default=False,
+        action="store_true",
+        help="If True, save one matrix per series, with each GSM once, and a manifest of the columns of each pair (default: False)",
+    )
+    parser.add_argument(
+        "-A",
+        "--combine",
+        metavar="NAME",
+        type=str,
+        default=None,
+        help="Save the pairs of all series in one matrix NAME under OUTPUT, aligned on GeneID, with columns GSE, GROUP and GSM joined by SEP, instead of a file per pair (default: None)",
+    )
+    parser.add_argument(
+        "-P",
+        "--sparse",
+        default=False,
+        action="store_true",
+        help="If True, hold count matrices as sparse columns, which keep only non-zero counts (default: False)",
+    )
+    parser.add_argument(
+        "-z",
+        "--compression",
+        metavar="FORMAT",
+        nargs="?",
+        type=str,
+        choices=Compression.__args__,
+        const="gzip",
+        default=None,
+        help=f'Compress output files in FORMAT (choices: {", ".join(Compression.__args__)}, default: None, or gzip if FORMAT is omitted)',
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="N",
+        type=int,
+        default=1,
+        help="Number of series processed concurrently (default: 1)",
+    )
+    parser.add_argument(
+        "-r",
+        "--rate-limit",
+        metavar="R",
+        type=float,
+        default=NCBI_RATE_LIMIT,
+        help=f"Requests per second to NCBI when N > 1 (default: {NCBI_RATE_LIMIT:g})",
+    )
+    parser.add_argument(
+        "-p",
+        "--profile",
+        metavar="JSONL",
+        type=Path,
+        default=None,
+        help="Path to save wall time, bytes, rows, columns and peak RSS growth of each stage as JSON lines (default: None)",
+    )
+    parser.add_argument(
+        "-t",
+        "--trace",
+        metavar="TRACE_JSON",
+        type=Path,
+        default=None,
+        help="Path to save the stages as a Chrome trace, for chrome://tracing or Perfetto (default: None)",
+    )
+    parser.add_argument(
+        "-C",
+        "--cache",
+        metavar="FORMAT",
+        nargs="?",
+        type=str,
+        choices=CountCache.__args__,
+        const="feather",
+        default=None,
+        help=f'Cache count matrices under SRC_DIR in FORMAT (choices: {", ".join(CountCache.__args__)}, default: None, or feather if FORMAT is omitted)',
+    )
+    parser.add_argument(
+        "-M",
+        "--metadata-cache",
+        default=False,
+        action="store_true",
+        help="If True, cache Sample metadata of SOFT files under SRC_DIR, which is kept by --cleanup (default: False)",
     )
-    return parser.parse_args()
+    parsed = parser.parse_args(args)
+    if parsed.combine is not None and parsed.jobs > 1:
+        parser.error(
+            "argument -A/--combine: series are combined serially, not with -j/--jobs"
+        )
+    try:
+        check_output_format(parsed.output_format, parsed.compression)
+    except (ValueError, ImportError) as e:
+        parser.error(str(e))
+    return parsed
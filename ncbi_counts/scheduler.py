@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+from __future__ import annotations
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .fetch import fetch
+from .utils import get_download_state_dir
+
+# NCBI E-utilities limit without an API key (10 requests/s with a key)
+NCBI_RATE_LIMIT = 3.0
+
+
+@dataclass
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` requests per second on average.
+
+    Up to `burst` requests are allowed at once after an idle period.
+    """
+
+    rate: float = NCBI_RATE_LIMIT
+    burst: float = 1.0
+    _tokens: float = field(init=False, repr=False)
+    _updated: float = field(init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def __post_init__(self):
+        if self.rate <= 0:
+            raise ValueError(f"rate must be positive: {self.rate}")
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+
+    def acquire(self):
+        """Take a token, blocking until one is available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+@dataclass
+class FetchScheduler:
+    """Download source files in the background on an asyncio event loop.
+
+    Downloads (`fetch`) run on worker threads sharing one keep-alive connection
+    pool. Every request, including retries, waits for the token bucket, and at most
+    `max_per_host` downloads run at once for each host. Downloads start in the order
+    they are submitted, and a URL is downloaded only once.
+    """
+
+    rate: float = NCBI_RATE_LIMIT
+    max_per_host: int = 2
+    max_connections: int = 8
+    _bucket: TokenBucket = field(init=False, repr=False)
+    _session: requests.Session = field(init=False, repr=False)
+    _executor: ThreadPoolExecutor = field(init=False, repr=False)
+    _loop: asyncio.AbstractEventLoop = field(init=False, repr=False)
+    _thread: threading.Thread = field(init=False, repr=False)
+    _host_limits: dict[str, asyncio.Semaphore] = field(
+        default_factory=dict, init=False, repr=False
+    )
+    _futures: dict[str, Future] = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self):
+        self._bucket = TokenBucket(rate=self.rate)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.max_connections, pool_maxsize=self.max_per_host
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(self.max_connections)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> FetchScheduler:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def submit(self, url: str, path: Path) -> Future:
+        """Schedule download of a source file quietly.
+
+        A failure is not reported here: `Series` tries again and warns in input order.
+
+        Args:
+            url (str): URL of source file.
+            path (Path): file path to save.
+
+        Returns:
+            Future: resolves to file path of source file if downloaded, or None.
+        """
+        if url not in self._futures:
+            self._futures[url] = asyncio.run_coroutine_threadsafe(
+                self._fetch(url, path), self._loop
+            )
+        return self._futures[url]
+
+    async def _fetch(self, url: str, path: Path) -> Path | None:
+        host = urlsplit(url).netloc
+        host_limit = self._host_limits.setdefault(
+            host, asyncio.Semaphore(self.max_per_host)
+        )
+        async with host_limit:
+            try:
+                return await self._loop.run_in_executor(
+                    self._executor,
+                    partial(
+                        fetch,
+                        url,
+                        path,
+                        state_dir=get_download_state_dir(path),
+                        silent=True,
+                        session=self._session,
+                        limiter=self._bucket.acquire,
+                    ),
+                )
+            except Exception:
+                return None
+
+    def close(self):
+        """Wait for scheduled downloads, then release the event loop and connections."""
+        for future in self._futures.values():
+            future.exception()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._executor.shutdown()
+        self._session.close()
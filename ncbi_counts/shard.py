@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+
+from __future__ import annotations
+from dataclasses import dataclass
+import hashlib
+from pathlib import Path
+import re
+from typing import Iterable, Iterator
+
+from yaml import safe_load
+
+from .load import iter_input
+from .manifest import RUN_MANIFEST_NAME, RunManifest
+from .types import GeoRegex, GseAcc, PairGsms, PairRegex, StrPath
+from .utils import save_yaml
+
+SHARD_RE = re.compile(r"(\d+)/(\d+)")
+# e.g. ".ncbi_counts.run.2-of-4.json" next to ".ncbi_counts.run.json"
+SHARD_MANIFEST_GLOB = Path(RUN_MANIFEST_NAME).stem + ".*-of-*.json"
+
+
+@dataclass(frozen=True)
+class Shard:
+    """One of `count` parts of an input file (`index` from 1)."""
+
+    index: int
+    count: int
+
+    @classmethod
+    def parse(cls, text: str) -> Shard:
+        """Parse a shard as I/N (e.g. "2/4").
+
+        Raises:
+            ValueError: If the text is not I/N with 1 <= I <= N.
+        """
+        match = SHARD_RE.fullmatch(text)
+        if match is None:
+            raise ValueError(f"Shard must be I/N (e.g. 1/4): {text}")
+        shard = cls(*map(int, match.groups()))
+        if not 1 <= shard.index <= shard.count:
+            raise ValueError(f"Shard index must be between 1 and {shard.count}: {text}")
+        return shard
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+    @property
+    def manifest_name(self) -> str:
+        """File name of the run manifest of the shard."""
+        path = Path(RUN_MANIFEST_NAME)
+        return f"{path.stem}.{self.index}-of-{self.count}{path.suffix}"
+
+
+def get_shard_index(gse_acc: GseAcc, count: int) -> int:
+    """Get the shard of a series from a hash of its accession.
+
+    The shard of a series does not depend on the other series of the input file.
+
+    Args:
+        gse_acc (GseAcc): GSE accession.
+        count (int): number of shards.
+
+    Returns:
+        int: index of shard (from 1).
+    """
+    digest = hashlib.sha256(gse_acc.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count + 1
+
+
+def assign_shards(
+    regex_dict: GeoRegex, count: int, weighted: bool = False
+) -> dict[GseAcc, int]:
+    """Assign each series of an input file to a shard.
+
+    If weighted, series are assigned from the largest to the shard with the least total
+    weight so far, where the weight of a series is its number of pairs (each pair is
+    saved as a count matrix). Either way, the assignment depends only on the input file,
+    so every process computes the same one.
+
+    Args:
+        regex_dict (GeoRegex): regex of the pairs (value) of each series (key).
+        count (int): number of shards.
+        weighted (bool, optional): if True, balance the expected size of shards. Defaults to False.
+
+    Returns:
+        dict[GseAcc, int]: index of shard (value, from 1) of each series (key), in input order.
+    """
+    if not weighted:
+        return {gse: get_shard_index(gse, count) for gse in regex_dict}
+    loads = [0] * count
+    assigned: dict[GseAcc, int] = {}
+    for gse in sorted(regex_dict, key=lambda gse: (-len(regex_dict[gse]), gse)):
+        i = min(range(count), key=lambda i: (loads[i], i))
+        loads[i] += len(regex_dict[gse])
+        assigned[gse] = i + 1
+    return {gse: assigned[gse] for gse in regex_dict}
+
+
+def iter_shard(
+    entries: Iterable[tuple[GseAcc, list[PairRegex]]],
+    shard: Shard,
+    weighted: bool = False,
+) -> Iterator[tuple[GseAcc, list[PairRegex]]]:
+    """Select the series of a shard, in input order.
+
+    Series are selected as they are read, unless weighted, which needs all of them.
+
+    Args:
+        entries (Iterable[tuple[GseAcc, list[PairRegex]]]): series and their regex of
+            the pairs, as read from an input file (`iter_input`).
+        shard (Shard): shard to select.
+        weighted (bool, optional): if True, balance the expected size of shards. Defaults to False.
+
+    Yields:
+        tuple[GseAcc, list[PairRegex]]: series of the shard and their regex of the pairs.
+    """
+    if weighted:
+        regex_dict = dict(entries)
+        assigned = assign_shards(regex_dict, shard.count, weighted=True)
+        entries = regex_dict.items()
+    for gse, pair_regex_list in entries:
+        if weighted:
+            index = assigned[gse]
+        else:
+            index = get_shard_index(gse, shard.count)
+        if index == shard.index:
+            yield gse, pair_regex_list
+
+
+def merge_shards(
+    geo_regex_path: StrPath,
+    yaml_paths: list[StrPath],
+    to_yaml: StrPath | None = None,
+    save_to: StrPath | None = None,
+) -> dict[GseAcc, list[PairGsms]]:
+    """Merge the outputs of the shards of an input file, as if it was run in one process.
+
+    Args:
+        geo_regex_path (StrPath): path to input file (.yaml, .yml, .csv, .tsv).
+        yaml_paths (list[StrPath]): paths to YAML files of GSMs saved by the shards.
+        to_yaml (StrPath | None, optional): path to save YAML file. Defaults to None.
+        save_to (StrPath | None, optional): save directory, whose run manifests of
+            shards are merged into one. Defaults to None.
+
+    Raises:
+        ValueError: If a series is not in the input file, or differs between shards.
+
+    Returns:
+        dict[GseAcc, list[PairGsms]]: matched GSMs of each series, in input order.
+    """
+    # in input order, with fast lookups
+    gse_accs = dict.fromkeys(gse for gse, _ in iter_input(geo_regex_path))
+    pair_gsms_dict: dict[GseAcc, list[PairGsms]] = {}
+    for yaml_path in yaml_paths:
+        with open(yaml_path, encoding="utf-8") as f:
+            shard_gsms_dict: dict[GseAcc, list[PairGsms]] = safe_load(f) or {}
+        for gse, pair_gsms_list in shard_gsms_dict.items():
+            if gse not in gse_accs:
+                raise ValueError(
+                    f"Series {gse} of {yaml_path} is not in {geo_regex_path}"
+                )
+            if pair_gsms_dict.setdefault(gse, pair_gsms_list) != pair_gsms_list:
+                raise ValueError(f"Series {gse} differs between shards")
+    samples_dict = {
+        gse: pair_gsms_dict[gse] for gse in gse_accs if gse in pair_gsms_dict
+    }
+    if to_yaml is not None:
+        save_yaml(samples_dict, Path(to_yaml))
+    shard_paths = sorted(Path(save_to).glob(SHARD_MANIFEST_GLOB)) if save_to else []
+    if shard_paths:
+        # shards record all of their series, including those up to date
+        manifest = RunManifest.load(save_to)
+        entries: dict[GseAcc, dict] = {}
+        for path in shard_paths:
+            entries.update(RunManifest.load(save_to, name=path.name).entries)
+        # in input order, then series of other input files
+        manifest.entries = {
+            **{gse: entries[gse] for gse in gse_accs if gse in entries},
+            **{
+                gse: entry
+                for gse, entry in manifest.entries.items()
+                if gse not in gse_accs
+            },
+        }
+        manifest.dump()
+        for path in shard_paths:
+            path.unlink()
+    return samples_dict
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+
+from __future__ import annotations
+import gzip
+import json
+import os
+from pathlib import Path
+import re
+import sys
+from tempfile import NamedTemporaryFile
+from typing import IO, Iterable, Iterator
+
+from .cache import CACHE_DIRNAME, source_fingerprint
+from .types import GsmAcc, GsmMetadata
+from .utils import download
+
+SAMPLE_ENTRY = "SAMPLE"
+TABLE_BEGIN = "_table_begin"
+TABLE_END = "_table_end"
+# same as GEOparse: strip prefix like "!Sample_" from attribute
+ATTRIB_PREFIX_RE = re.compile(r"!\w*?_")
+METADATA_CACHE_SUFFIX = ".metadata.json.gz"
+
+
+def parse_entry(line: str) -> tuple[str, str]:
+    """Parse a SOFT line starting with '^' or '!' into (key, value).
+
+    Args:
+        line (str): SOFT line without trailing whitespace.
+
+    Returns:
+        tuple[str, str]: key and value (empty if the line has no value).
+    """
+    if line.startswith("!"):
+        line = ATTRIB_PREFIX_RE.sub("", line)
+    else:
+        line = line.strip()[1:]
+    key, _, value = line.partition("=")
+    return key.strip(), value.strip()
+
+
+def iter_sample_metadata(lines: Iterable[str]) -> Iterator[tuple[GsmAcc, GsmMetadata]]:
+    """Stream metadata of each Sample in a family SOFT file.
+
+    Only '!' lines of SAMPLE entries are parsed. Data tables and the other entries
+    (DATABASE, SERIES, PLATFORM) are skipped line by line without being kept.
+    Repeated values (e.g. protocols shared by all Samples) are stored once.
+
+    Args:
+        lines (Iterable[str]): lines of family SOFT file.
+
+    Yields:
+        tuple[GsmAcc, GsmMetadata]: GSM and its metadata, the same as `GSM.metadata` of GEOparse.
+    """
+    pool: dict[str, str] = {}
+    gsm: GsmAcc | None = None
+    metadata: GsmMetadata = {}
+    in_table = False
+    for line in lines:
+        if in_table:
+            if TABLE_END in line and line.startswith("!"):
+                in_table = False
+            continue
+        if line.startswith("^"):
+            if gsm is not None:
+                yield gsm, metadata
+            entry_type, entry_name = parse_entry(line.rstrip())
+            if entry_type == SAMPLE_ENTRY:
+                gsm, metadata = entry_name, {}
+            else:
+                gsm = None
+        elif line.startswith("!"):
+            if TABLE_BEGIN in line:
+                in_table = True
+            elif gsm is not None and TABLE_END not in line:
+                key, value = parse_entry(line.rstrip())
+                key = sys.intern(key)
+                metadata.setdefault(key, []).append(pool.setdefault(value, value))
+    if gsm is not None:
+        yield gsm, metadata
+
+
+def _open_soft(soft_path: Path) -> IO[str]:
+    if soft_path.suffix == ".gz":
+        return gzip.open(soft_path, "rt", encoding="utf-8", errors="ignore")
+    return open(soft_path, encoding="utf-8", errors="ignore")
+
+
+def parse_sample_metadata(soft_path: Path) -> dict[GsmAcc, GsmMetadata]:
+    """Parse metadata of all Samples in a family SOFT file.
+
+    Args:
+        soft_path (Path): file path of family SOFT file (.soft or .soft.gz).
+
+    Raises:
+        ValueError: If no SAMPLE entry is found.
+
+    Returns:
+        dict[GsmAcc, GsmMetadata]: metadata (value) of each GSM (key).
+    """
+    with _open_soft(soft_path) as f:
+        gsm_metadata = dict(iter_sample_metadata(f))
+    if not gsm_metadata:
+        raise ValueError(f"No SAMPLE entries found in {soft_path}")
+    return gsm_metadata
+
+
+def get_sample_metadata(
+    soft_url: str, soft_path: Path, force: bool = False, silent: bool = False
+) -> dict[GsmAcc, GsmMetadata] | None:
+    """Get metadata of all Samples from URL of family SOFT file.
+
+    Args:
+        soft_url (str): URL of family SOFT file.
+        soft_path (Path): file path to save.
+        force (bool, optional): Defaults to False.
+        silent (bool, optional): If True, suppress messages. Defaults to False.
+
+    Returns:
+        dict[GsmAcc, GsmMetadata] | None: metadata (value) of each GSM (key).
+    """
+    soft_path = download(soft_url, soft_path, force=force, silent=silent)
+    if soft_path is not None:
+        return parse_sample_metadata(soft_path)
+
+
+def get_metadata_cache_path(soft_path: Path) -> Path:
+    """Get path of the Sample metadata cache of a family SOFT file.
+
+    Args:
+        soft_path (Path): file path of family SOFT file.
+
+    Returns:
+        Path: file path of cache (.json.gz) in a hidden directory next to SOFT file.
+    """
+    name = soft_path.name.removesuffix(".gz").removesuffix(".soft")
+    return soft_path.parent.joinpath(CACHE_DIRNAME, name + METADATA_CACHE_SUFFIX)
+
+
+def read_metadata_cache(soft_path: Path) -> dict[GsmAcc, GsmMetadata] | None:
+    """Read Sample metadata cached for a family SOFT file.
+
+    The cache is used even if the SOFT file does not exist (e.g. after cleanup), but
+    not if the SOFT file exists and has changed since the cache was written.
+
+    Args:
+        soft_path (Path): file path of family SOFT file.
+
+    Returns:
+        dict[GsmAcc, GsmMetadata] | None: metadata (value) of each GSM (key), or None
+            if there is no valid cache.
+    """
+    cache_path = get_metadata_cache_path(soft_path)
+    try:
+        with gzip.open(cache_path, "rt", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, EOFError, ValueError):
+        return None
+    if soft_path.is_file() and cache.get("source") != source_fingerprint(soft_path):
+        return None
+    return cache.get("gsms")
+
+
+def write_metadata_cache(
+    gsm_metadata: dict[GsmAcc, GsmMetadata], soft_path: Path
+) -> Path:
+    """Write Sample metadata parsed from a family SOFT file into its cache.
+
+    Args:
+        gsm_metadata (dict[GsmAcc, GsmMetadata]): metadata (value) of each GSM (key).
+        soft_path (Path): file path of family SOFT file.
+
+    Returns:
+        Path: file path of cache.
+    """
+    cache_path = get_metadata_cache_path(soft_path)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    cache = {"source": source_fingerprint(soft_path), "gsms": gsm_metadata}
+    with NamedTemporaryFile(
+        dir=cache_path.parent, suffix=METADATA_CACHE_SUFFIX, delete=False
+    ) as tmp:
+        tmp_path = Path(tmp.name)
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, cache_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return cache_path
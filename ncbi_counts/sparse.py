@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+from .types import CountNorm, GsmAcc
+from .utils import (
+    COUNT_DTYPES,
+    COUNT_INDEX_DTYPE,
+    download,
+    read_count_header,
+    select_gsm_columns,
+)
+
+GENES_SUFFIX = ".genes.tsv"
+SAMPLES_SUFFIX = ".samples.tsv"
+MTX_FIELDS = {"i": "integer", "u": "integer", "f": "real"}
+
+
+def to_sparse_count(count: pd.DataFrame) -> pd.DataFrame:
+    """Convert count DataFrame to sparse columns, which keep only non-zero counts.
+
+    Each column holds the positions and values of the non-zero counts of a GSM, i.e.
+    the count matrix is stored in compressed sparse column (CSC) form.
+
+    Args:
+        count (pd.DataFrame): count DataFrame.
+
+    Returns:
+        pd.DataFrame: count DataFrame with `pd.SparseDtype` columns (fill value 0).
+    """
+    return count.astype(
+        {
+            col: pd.SparseDtype(dtype, 0)
+            for col, dtype in count.dtypes.items()
+            if not isinstance(dtype, pd.SparseDtype)
+        }
+    )
+
+
+def read_sparse_count(
+    count_path: Path,
+    norm_type: CountNorm | None = None,
+    gsms: Iterable[GsmAcc] | None = None,
+    chunksize: int = 2**14,
+) -> pd.DataFrame:
+    """Read count file into sparse columns, parsing it in chunks of rows.
+
+    The dense count matrix is never held in memory, only one chunk of it.
+
+    Args:
+        count_path (Path): file path of count file.
+        norm_type (CountNorm | None, optional): Normalization type. Defaults to None.
+        gsms (Iterable[GsmAcc] | None, optional): GSMs to read. Defaults to None (all).
+        chunksize (int, optional): number of rows parsed at once. Defaults to 2**14.
+
+    Returns:
+        pd.DataFrame: Count DataFrame with sparse columns.
+    """
+    header = read_count_header(count_path)
+    index_col = header[0]
+    columns = header[1:]
+    if gsms is not None:
+        columns = select_gsm_columns(columns, gsms)
+    dtype = {col: COUNT_DTYPES[norm_type] for col in columns}
+    dtype[index_col] = COUNT_INDEX_DTYPE
+    chunks = pd.read_table(
+        count_path,
+        index_col=0,
+        usecols=[index_col] + columns,
+        dtype=dtype,
+        chunksize=chunksize,
+    )
+    return pd.concat([to_sparse_count(chunk) for chunk in chunks])
+
+
+def get_sparse_count_dataframe(
+    count_url: str,
+    count_path: Path = Path(),
+    force: bool = False,
+    silent=False,
+    norm_type: CountNorm | None = None,
+    gsms: Iterable[GsmAcc] | None = None,
+) -> pd.DataFrame | None:
+    """Get count DataFrame with sparse columns from URL.
+
+    Args:
+        count_url (str): URL of count file.
+        count_path (Path, optional): file path to save. Defaults to Path().
+        force (bool, optional): Defaults to False.
+        silent (bool, optional): If True, suppress messages. Defaults to False.
+        norm_type (CountNorm | None, optional): Normalization type. Defaults to None.
+        gsms (Iterable[GsmAcc] | None, optional): GSMs to read. Defaults to None (all).
+
+    Returns:
+        pd.DataFrame | None: Count DataFrame with sparse columns.
+    """
+    count_path = download(count_url, count_path, force=force, silent=silent)
+    if count_path is not None:
+        return read_sparse_count(count_path, norm_type=norm_type, gsms=gsms)
+
+
+def to_csc(pair_count: pd.DataFrame) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Get the CSC arrays (data, indices, indptr) of a genes x GSMs count DataFrame.
+
+    Sparse columns are used as they are, and dense columns are scanned for non-zero
+    counts. Missing counts (NaN, e.g. genes only in annotation) are not stored.
+
+    Args:
+        pair_count (pd.DataFrame): count DataFrame.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: non-zero counts, their row
+            positions, and the start of each column in them.
+    """
+    data_list: list[np.ndarray] = []
+    indices_list: list[np.ndarray] = []
+    for _, column in pair_count.items():
+        array = column.array
+        if isinstance(array, pd.arrays.SparseArray):
+            indices, values = array.sp_index.indices, array.sp_values
+        else:
+            values = column.to_numpy()
+            indices = np.flatnonzero(values != 0)
+            values = values[indices]
+        keep = ~pd.isna(values) & (values != 0)
+        data_list.append(values[keep])
+        indices_list.append(indices[keep].astype(np.int32))
+    indptr = np.zeros(len(data_list) + 1, dtype=np.int64)
+    np.cumsum([len(data) for data in data_list], out=indptr[1:])
+    if not data_list:
+        return np.array([], np.int32), np.array([], np.int32), indptr
+    subtypes = [
+        dtype.subtype if isinstance(dtype, pd.SparseDtype) else dtype
+        for dtype in pair_count.dtypes
+    ]
+    data = np.concatenate(data_list).astype(np.result_type(*subtypes))
+    return data, np.concatenate(indices_list), indptr
+
+
+def get_sidecar_paths(path: Path) -> tuple[Path, Path]:
+    """Get paths of the row (gene) and column (GSM) names of a sparse matrix file.
+
+    Args:
+        path (Path): file path of sparse matrix (.mtx, .npz).
+
+    Returns:
+        tuple[Path, Path]: file paths of genes and samples (.tsv).
+    """
+    stem = path.name.removesuffix(path.suffix)
+    return (
+        path.with_name(stem + GENES_SUFFIX),
+        path.with_name(stem + SAMPLES_SUFFIX),
+    )
+
+
+def write_sparse_names(pair_count: pd.DataFrame, genes_path: Path, samples_path: Path):
+    """Write row names (GeneID and annotation) and column names of a sparse matrix.
+
+    Args:
+        pair_count (pd.DataFrame): count DataFrame.
+        genes_path (Path): file path to save row names.
+        samples_path (Path): file path to save column names.
+    """
+    pair_count.index.to_frame(index=False).to_csv(
+        genes_path, sep="\t", encoding="utf-8", lineterminator="\n", index=False
+    )
+    pd.Series(pair_count.columns, name="column").to_csv(
+        samples_path, sep="\t", encoding="utf-8", lineterminator="\n", index=False
+    )
+
+
+def write_mtx(pair_count: pd.DataFrame, path: Path):
+    """Write count DataFrame into a Matrix Market (coordinate) file.
+
+    Args:
+        pair_count (pd.DataFrame): genes x GSMs count DataFrame.
+        path (Path): file path to save.
+    """
+    data, indices, indptr = to_csc(pair_count)
+    cols = np.repeat(np.arange(1, len(indptr)), np.diff(indptr))
+    field = MTX_FIELDS.get(data.dtype.kind, "real")
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        f.write(f"%%MatrixMarket matrix coordinate {field} general\n")
+        f.write(f"{len(pair_count.index)} {len(pair_count.columns)} {len(data)}\n")
+        pd.DataFrame({"row": indices + 1, "col": cols, "value": data}).to_csv(
+            f,
+            sep=" ",
+            lineterminator="\n",
+            header=False,
+            index=False,
+            float_format=None if field == "integer" else "%.9g",
+        )
+
+
+def write_npz(pair_count: pd.DataFrame, path: Path):
+    """Write count DataFrame into a compressed npz file (`scipy.sparse.load_npz`).
+
+    Args:
+        pair_count (pd.DataFrame): genes x GSMs count DataFrame.
+        path (Path): file path to save.
+    """
+    data, indices, indptr = to_csc(pair_count)
+    with open(path, "wb") as f:
+        np.savez_compressed(
+            f,
+            format=np.array(b"csc"),
+            shape=np.array(pair_count.shape),
+            data=data,
+            indices=indices,
+            indptr=indptr,
+        )
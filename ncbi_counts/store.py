@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+import json
+import os
+from pathlib import Path
+import shutil
+from tempfile import mkdtemp
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+from .cache import CACHE_DIRNAME, source_fingerprint
+from .lock import file_lock, get_lock_path
+from .types import CountNorm, GsmAcc
+from .utils import (
+    COUNT_DTYPES,
+    COUNT_INDEX_DTYPE,
+    download,
+    read_count_header,
+    select_gsm_columns,
+)
+
+STORE_SUFFIX = ".counts"
+VALUES_FILENAME = "values.npy"
+GENE_IDS_FILENAME = "gene_ids.npy"
+META_FILENAME = "meta.json"
+
+
+def get_store_path(count_path: Path) -> Path:
+    """Get path of the memory-mapped store of a count file.
+
+    Args:
+        count_path (Path): file path of count file (.tsv.gz).
+
+    Returns:
+        Path: directory of store in a hidden directory next to count file.
+    """
+    name = count_path.name.removesuffix(".gz").removesuffix(".tsv")
+    return count_path.parent.joinpath(CACHE_DIRNAME, name + STORE_SUFFIX)
+
+
+def get_store_lock_path(count_path: Path) -> Path:
+    """Get path of the lock file of the store of a count file.
+
+    Args:
+        count_path (Path): file path of count file (.tsv.gz).
+
+    Returns:
+        Path: file path of lock file, next to store.
+    """
+    store_path = get_store_path(count_path)
+    return get_lock_path(store_path, store_path.parent)
+
+
+@dataclass
+class CountStore:
+    """Count matrix stored as a memory-mapped genes x GSMs array.
+
+    The array is column-major, so the counts of a GSM are contiguous on disk. GeneIDs
+    and GSM columns are kept in sidecar files. Only the pages actually read are loaded,
+    and processes opening the same store share one page-cached copy.
+    """
+
+    path: Path
+    values: np.ndarray = field(repr=False)
+    gene_ids: np.ndarray = field(repr=False)
+    gsms: list[GsmAcc] = field(repr=False)
+    index_name: str = field(default="GeneID")
+    source: dict[str, int] = field(default_factory=dict)
+    positions: dict[GsmAcc, int] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.positions = {gsm: i for i, gsm in enumerate(self.gsms)}
+
+    @classmethod
+    def open(cls, store_path: Path) -> CountStore:
+        """Open a store read-only.
+
+        Args:
+            store_path (Path): directory of store.
+
+        Returns:
+            CountStore: opened store.
+        """
+        with open(store_path.joinpath(META_FILENAME), encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(
+            path=store_path,
+            values=np.load(store_path.joinpath(VALUES_FILENAME), mmap_mode="r"),
+            gene_ids=np.load(store_path.joinpath(GENE_IDS_FILENAME)),
+            gsms=meta["gsms"],
+            index_name=meta["index_name"],
+            source=meta["source"],
+        )
+
+    @classmethod
+    def build(
+        cls,
+        count_path: Path,
+        norm_type: CountNorm | None = None,
+        store_path: Path | None = None,
+        chunksize: int = 2**14,
+    ) -> CountStore:
+        """Build a store from a count file, parsing it in chunks of rows.
+
+        The whole count matrix is never held in memory. The store is written to a
+        temporary directory and then renamed, replacing the store at `store_path`, so
+        processes sharing it build it under its lock (see `open_count_store`).
+
+        Args:
+            count_path (Path): file path of count file.
+            norm_type (CountNorm | None, optional): Normalization type. Defaults to None.
+            store_path (Path | None, optional): directory of store. Defaults to None.
+            chunksize (int, optional): number of rows parsed at once. Defaults to 2**14.
+
+        Returns:
+            CountStore: opened store.
+        """
+        if store_path is None:
+            store_path = get_store_path(count_path)
+        store_path.parent.mkdir(parents=True, exist_ok=True)
+        header = read_count_header(count_path)
+        index_col = header[0]
+        gene_ids = pd.read_table(
+            count_path, usecols=[index_col], dtype={index_col: COUNT_INDEX_DTYPE}
+        )[index_col].to_numpy()
+        tmp_path = Path(mkdtemp(dir=store_path.parent, suffix=STORE_SUFFIX))
+        try:
+            values = np.lib.format.open_memmap(
+                tmp_path.joinpath(VALUES_FILENAME),
+                mode="w+",
+                dtype=COUNT_DTYPES[norm_type],
+                shape=(len(gene_ids), len(header) - 1),
+                fortran_order=True,
+            )
+            dtype = {col: COUNT_DTYPES[norm_type] for col in header[1:]}
+            dtype[index_col] = COUNT_INDEX_DTYPE
+            start = 0
+            for chunk in pd.read_table(
+                count_path, index_col=0, dtype=dtype, chunksize=chunksize
+            ):
+                values[start : start + len(chunk)] = chunk.to_numpy()
+                start += len(chunk)
+            values.flush()
+            del values
+            np.save(tmp_path.joinpath(GENE_IDS_FILENAME), gene_ids)
+            meta = {
+                "gsms": header[1:],
+                "index_name": index_col,
+                "source": source_fingerprint(count_path),
+            }
+            with open(tmp_path.joinpath(META_FILENAME), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            shutil.rmtree(store_path, ignore_errors=True)
+            os.replace(tmp_path, store_path)
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        return cls.open(store_path)
+
+    def take(self, gsms: Iterable[GsmAcc]) -> pd.DataFrame:
+        """Get counts of GSMs as a DataFrame.
+
+        If the GSMs are contiguous in the store, the DataFrame is a read-only view of
+        the memory-mapped array. Otherwise only their columns are gathered.
+
+        Args:
+            gsms (Iterable[GsmAcc]): GSMs in the store.
+
+        Returns:
+            pd.DataFrame: Count DataFrame indexed by GeneID.
+        """
+        gsms = list(gsms)
+        pos = np.array([self.positions[gsm] for gsm in gsms], dtype=np.intp)
+        if len(pos) and np.array_equal(pos, np.arange(pos[0], pos[0] + len(pos))):
+            values = self.values[:, pos[0] : pos[0] + len(pos)]
+        else:
+            values = self.values[:, pos]
+        return pd.DataFrame(
+            values,
+            index=pd.Index(self.gene_ids, name=self.index_name),
+            columns=gsms,
+            copy=False,
+        )
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Get all counts as a read-only DataFrame view of the memory-mapped array.
+
+        Returns:
+            pd.DataFrame: Count DataFrame indexed by GeneID.
+        """
+        return self.take(self.gsms)
+
+
+def _open_current_store(store_path: Path, count_path: Path) -> CountStore | None:
+    # None if the store is missing, invalid, or built from another count file
+    try:
+        store = CountStore.open(store_path)
+    except (OSError, ValueError, KeyError):
+        return None
+    return store if store.source == source_fingerprint(count_path) else None
+
+
+def open_count_store(
+    count_path: Path, norm_type: CountNorm | None = None
+) -> CountStore:
+    """Open the store of a count file, building it if missing or outdated.
+
+    Processes sharing the store open it under a shared lock, and build it under an
+    exclusive lock, so it is built once and never opened while it is replaced.
+
+    Args:
+        count_path (Path): file path of count file.
+        norm_type (CountNorm | None, optional): Normalization type. Defaults to None.
+
+    Returns:
+        CountStore: opened store.
+    """
+    store_path = get_store_path(count_path)
+    lock_path = get_store_lock_path(count_path)
+    with file_lock(lock_path, shared=True):
+        store = _open_current_store(store_path, count_path)
+    if store is not None:
+        return store
+    with file_lock(lock_path):
+        # built by another process while waiting for the lock
+        store = _open_current_store(store_path, count_path)
+        if store is not None:
+            return store
+        return CountStore.build(count_path, norm_type=norm_type, store_path=store_path)
+
+
+def read_count_store(
+    count_path: Path,
+    norm_type: CountNorm | None = None,
+    gsms: Iterable[GsmAcc] | None = None,
+) -> pd.DataFrame:
+    """Read count file through its memory-mapped store.
+
+    Args:
+        count_path (Path): file path of count file.
+        norm_type (CountNorm | None, optional): Normalization type. Defaults to None.
+        gsms (Iterable[GsmAcc] | None, optional): GSMs to read. Defaults to None (all).
+
+    Returns:
+        pd.DataFrame: Count DataFrame backed by the store where possible.
+    """
+    store = open_count_store(count_path, norm_type=norm_type)
+    if gsms is None:
+        return store.to_dataframe()
+    return store.take(select_gsm_columns(store.gsms, gsms))
+
+
+def get_stored_count_dataframe(
+    count_url: str,
+    count_path: Path = Path(),
+    force: bool = False,
+    silent=False,
+    norm_type: CountNorm | None = None,
+    gsms: Iterable[GsmAcc] | None = None,
+) -> pd.DataFrame | None:
+    """Get count DataFrame from URL through the memory-mapped store.
+
+    Args:
+        count_url (str): URL of count file.
+        count_path (Path, optional): file path to save. Defaults to Path().
+        force (bool, optional): Defaults to False.
+        silent (bool, optional): If True, suppress messages. Defaults to False.
+        norm_type (CountNorm | None, optional): Normalization type. Defaults to None.
+        gsms (Iterable[GsmAcc] | None, optional): GSMs to read. Defaults to None (all).
+
+    Returns:
+        pd.DataFrame | None: Count DataFrame.
+    """
+    count_path = download(count_url, count_path, force=force, silent=silent)
+    if count_path is not None:
+        return read_count_store(count_path, norm_type=norm_type, gsms=gsms)
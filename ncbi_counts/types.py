@@ -3,7 +3,6 @@
 from pathlib import Path
 from typing import Literal, Union
 
-
 StrPath = Union[str, Path]
 GseAcc = str
 GsmAcc = str
@@ -11,7 +10,15 @@ Groups = Union[Literal["treatment", "control"], str]
 PairRegex = dict[Groups, dict[str, str]]
 GeoRegex = dict[GseAcc, list[PairRegex]]
 PairGsms = dict[Groups, list[GsmAcc]]
+PairColumns = dict[Groups, list[int]]
+GsmMetadata = dict[str, list[str]]
 CountNorm = Literal["fpkm", "tpm"]
+CountCache = Literal["feather", "mmap"]
+SoftParser = Literal["stream", "geoparse"]
+# stages of a series, in order
+Stage = Literal["metadata", "match", "counts", "build", "write"]
+Compression = Literal["gzip", "zstd"]
+OutputFormat = Literal["tsv", "parquet", "feather", "h5ad", "hdf5", "mtx", "npz"]
 AnnotColumn = Literal[
     "Symbol",
     "Description",
@@ -1,20 +1,38 @@
 #!/usr/bin/env python
 
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
 import re
-from requests.exceptions import HTTPError
-from typing import Iterable
+import shutil
+from typing import Container, Iterable, Iterator
 import warnings
 
-from GEOparse.downloader import Downloader
 from GEOparse.GEOTypes import GSM
+import numpy as np
 import pandas as pd
 from yaml import safe_dump
 
+from .fetch import DownloadError, fetch, remove_state
+from .instrument import stage
+from .lock import file_lock, get_lock_path
+from .matcher import SampleTable
 from .types import CountNorm, GseAcc, GsmAcc, PairGsms, PairRegex, StrPath
 
 GEO_BASE_URL = "https://www.ncbi.nlm.nih.gov"
 GEO_DOWNLOAD_BASE = GEO_BASE_URL + "/geo/download/?"
+# GEO FTP site, served over HTTPS for range requests
+GEO_FTP_BASE = "https://ftp.ncbi.nlm.nih.gov/geo"
+# hidden directory of caches and download state, next to source files
+CACHE_DIRNAME = ".ncbi_counts_cache"
+# dtype of GeneID index, and of count columns for each normalization type
+COUNT_INDEX_DTYPE = "int64"
+COUNT_DTYPES: dict[CountNorm | None, str] = {
+    None: "int32",
+    "fpkm": "float32",
+    "tpm": "float32",
+}
 
 
 def is_matched(
@@ -61,18 +79,7 @@ def match_pair_gsms(
     Returns:
         PairGsms: a dictionary of GSMs (value) for each group (key).
     """
-    pair_gsms: PairGsms = {}
-    for group, group_regex_dict in pair_regex.items():
-        matched_gsms: list[GsmAcc] = []
-        for gsm_info in gsms:
-            if is_matched(group_regex_dict, gsm_info.metadata, silent=silent):
-                matched_gsms.append(gsm_info.name)
-        if len(matched_gsms):
-            pair_gsms[group] = matched_gsms
-        else:
-            if not silent:
-                warnings.warn(f"No GSMs matched for {group}")
-    return pair_gsms
+    return SampleTable.from_gsms(gsms).match_pair(pair_regex, silent=silent)
 
 
 def get_count_url(
@@ -118,6 +125,21 @@ def get_annot_url(spieces: str = "Human", annot_ver: str = "GRCh38.p13") -> str:
     )
 
 
+def get_soft_url(gse_acc: GseAcc) -> str:
+    """Get URL of family SOFT file (the same one GEOparse downloads).
+
+    Args:
+        gse_acc (GseAcc): GSE accession number.
+
+    Returns:
+        str: URL of family SOFT file.
+    """
+    range_subdir = re.sub(r"\d{1,3}$", "nnn", gse_acc)
+    return (
+        GEO_FTP_BASE + f"/series/{range_subdir}/{gse_acc}/soft/{gse_acc}_family.soft.gz"
+    )
+
+
 def parse_filename_from_url(url: str, filename_key: str = "file") -> str:
     """Parse filename from URL.
 
@@ -131,6 +153,9 @@ def parse_filename_from_url(url: str, filename_key: str = "file") -> str:
     Returns:
         str: Filename.
     """
+    if "?" not in url:
+        # e.g. FTP URL of family SOFT file
+        return url.rstrip("/").split("/")[-1]
     for param in url.split("?")[-1].split("&"):
         key, value = param.split("=")
         if key == filename_key:
@@ -138,11 +163,26 @@ def parse_filename_from_url(url: str, filename_key: str = "file") -> str:
     raise ValueError(f"Cannot parse filename from: {url}")
 
 
+def get_download_state_dir(path: Path) -> Path:
+    """Get directory of the download state (partial file and validators) of a file.
+
+    Args:
+        path (Path): file path of source file.
+
+    Returns:
+        Path: hidden directory next to source file.
+    """
+    return path.parent.joinpath(CACHE_DIRNAME)
+
+
 def download(
     count_url: str, count_path: Path = Path(), force: bool = False, silent: bool = False
-) -> Path:
+) -> Path | None:
     """Save count file from URL.
 
+    Interrupted downloads are resumed and failed requests are retried (see `fetch`).
+    Each download is reported as a "download" stage.
+
     Args:
         count_url (str): URL of count file.
         count_path (Path, optional): file path to save. Defaults to Path().
@@ -153,21 +193,155 @@ def download(
         ValueError: If count_path is a directory.
 
     Returns:
-        Path: file path of count file.
+        Path | None: file path of count file.
     """
     if count_path.is_dir():
         raise ValueError(f"count_path must be a file path: {count_path}")
-    try:
-        Downloader(
-            count_url, outdir=count_path.parent, filename=count_path.name
-        ).download(force=force, silent=silent)
+    if count_path.is_file() and not force:
         return count_path
-    except HTTPError:
-        warnings.warn(f"Cannot download: {count_url}")
+    with stage("download") as event:
+        try:
+            path = fetch(
+                count_url,
+                count_path,
+                state_dir=get_download_state_dir(count_path),
+                force=force,
+                silent=silent,
+            )
+        except DownloadError:
+            warnings.warn(f"Cannot download: {count_url}")
+            return None
+        event.bytes_downloaded = path.stat().st_size
+        return path
+
+
+@contextmanager
+def lease(
+    url: str, path: Path, force: bool = False, silent: bool = False
+) -> Iterator[Path | None]:
+    """Download a source file if needed, and keep it while in use.
+
+    While the lease is held, `remove_download` of other processes sharing the source
+    directory leaves the file in place (it holds a shared lock on the file). Any number
+    of processes hold leases at once.
+
+    Args:
+        url (str): URL of source file.
+        path (Path): file path of source file.
+        force (bool, optional): Defaults to False.
+        silent (bool, optional): If True, suppress messages. Defaults to False.
+
+    Yields:
+        Path | None: file path of source file, or None if it cannot be downloaded
+            (then no lease is held).
+    """
+    lock_path = get_lock_path(path, get_download_state_dir(path))
+    while True:
+        if force or not path.is_file():
+            if download(url, path, force=force, silent=silent) is None:
+                yield None
+                return
+            force = False
+        with file_lock(lock_path, shared=True):
+            # unless removed by another process before the lease
+            if path.is_file():
+                yield path
+                return
+
+
+def remove_download(path: Path, derived: Iterable[Path] = ()) -> bool:
+    """Remove a downloaded source file, its download state, and files derived from it.
+
+    Nothing is removed while another process holds a lease on the source file.
+
+    Args:
+        path (Path): file path of source file.
+        derived (Iterable[Path], optional): caches of source file (files or
+            directories). Defaults to ().
+
+    Returns:
+        bool: True if removed, or False if the file is in use.
+    """
+    state_dir = get_download_state_dir(path)
+    try:
+        with file_lock(get_lock_path(path, state_dir), blocking=False):
+            path.unlink(missing_ok=True)
+            for derived_path in derived:
+                if derived_path.is_dir():
+                    shutil.rmtree(derived_path, ignore_errors=True)
+                else:
+                    derived_path.unlink(missing_ok=True)
+            remove_state(path, state_dir)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def read_count_header(count_path: Path) -> list[str]:
+    """Read column names of count file without parsing its rows.
+
+    Args:
+        count_path (Path): file path of count file.
+
+    Returns:
+        list[str]: column names (the first one is GeneID).
+    """
+    return pd.read_table(count_path, nrows=0).columns.tolist()
+
+
+def select_gsm_columns(columns: list[str], gsms: Iterable[GsmAcc]) -> list[str]:
+    """Select columns of GSMs, skipping GSMs not in the columns.
+
+    GSMs of pairs missing from the count matrix are reported by the warnings of
+    `construct_pair_count`, for each group.
+
+    Args:
+        columns (list[str]): GSM columns of count matrix.
+        gsms (Iterable[GsmAcc]): GSMs to select.
+
+    Returns:
+        list[str]: selected columns in the order of `columns`.
+    """
+    gsms_in_count = set(columns) & set(gsms)
+    return [c for c in columns if c in gsms_in_count]
+
+
+def read_count(
+    count_path: Path,
+    norm_type: CountNorm | None = None,
+    gsms: Iterable[GsmAcc] | None = None,
+) -> pd.DataFrame:
+    """Read count file with numeric dtypes.
+
+    Raw counts are read as int32 and normalized counts as float32, indexed by int64
+    GeneID. If `gsms` is given, only the header is read first and then only the
+    columns of those GSMs are parsed.
+
+    Args:
+        count_path (Path): file path of count file.
+        norm_type (CountNorm | None, optional): Normalization type. Defaults to None.
+        gsms (Iterable[GsmAcc] | None, optional): GSMs to read (those not in the file
+            are skipped). Defaults to None (all).
+
+    Returns:
+        pd.DataFrame: Count DataFrame.
+    """
+    header = read_count_header(count_path)
+    index_col = header[0]
+    usecols = None
+    if gsms is not None:
+        usecols = [index_col] + select_gsm_columns(header[1:], gsms)
+    dtype = defaultdict(lambda: COUNT_DTYPES[norm_type], {index_col: COUNT_INDEX_DTYPE})
+    return pd.read_table(count_path, index_col=0, usecols=usecols, dtype=dtype)
 
 
 def get_count_dataframe(
-    count_url: str, count_path: Path = Path(), force: bool = False, silent=False
+    count_url: str,
+    count_path: Path = Path(),
+    force: bool = False,
+    silent=False,
+    norm_type: CountNorm | None = None,
+    gsms: Iterable[GsmAcc] | None = None,
 ) -> pd.DataFrame | None:
     """Get count DataFrame from URL.
 
@@ -176,51 +350,147 @@ def get_count_dataframe(
         count_path (Path, optional): file path to save. Defaults to Path().
         force (bool, optional): Defaults to False.
         silent (bool, optional): If True, suppress messages. Defaults to False.
+        norm_type (CountNorm | None, optional): Normalization type. Defaults to None.
+        gsms (Iterable[GsmAcc] | None, optional): GSMs to read. Defaults to None (all).
 
     Returns:
         pd.DataFrame | None: Count DataFrame.
     """
     count_path = download(count_url, count_path, force=force, silent=silent)
     if count_path is not None:
-        return pd.read_table(count_path, index_col=0, dtype=str)
+        return read_count(count_path, norm_type=norm_type, gsms=gsms)
+
+
+@dataclass
+class PairCountIndex:
+    """Column positions and sorted rows of a count matrix, shared by all its pairs.
+
+    The rows of pair count DataFrames are the sorted GeneIDs of the count and
+    annotation DataFrames, with the annotation columns as index levels, so they are
+    computed once per series (see `from_count`) instead of once per pair.
+    """
+
+    positions: dict[GsmAcc, int]  # column position of each GSM in count matrix
+    rows: np.ndarray | None  # row positions in sorted order, None if already sorted
+    index: pd.Index  # index of pair count DataFrames
+    complete: bool = True  # False if some rows are not in count matrix (NaN)
+
+    @classmethod
+    def from_count(
+        cls, count: pd.DataFrame, annot: pd.DataFrame | None = None
+    ) -> "PairCountIndex":
+        """Index a count DataFrame (and annotation DataFrame) for `construct_pair_count`.
+
+        Args:
+            count (pd.DataFrame): count DataFrame.
+            annot (pd.DataFrame | None, optional): annotation DataFrame. Defaults to None.
+
+        Returns:
+            PairCountIndex: positions of GSMs, and sorted rows and index.
+        """
+        positions = {gsm: pos for pos, gsm in enumerate(count.columns)}
+        genes = count.index if annot is None else count.index.union(annot.index)
+        genes = genes.sort_values()
+        rows = count.index.get_indexer(genes)
+        complete = bool((rows >= 0).all())
+        if complete and (rows == np.arange(len(rows))).all():
+            rows = None
+        index = genes
+        if annot is not None:
+            # annotation columns are aligned once, and their values are factorized
+            # into the codes of each level (categorical) of the MultiIndex
+            annot = annot.reindex(genes)
+            index = pd.MultiIndex.from_arrays(
+                [genes] + [annot[col] for col in annot.columns],
+                names=[genes.name, *annot.columns],
+            )
+        return cls(positions, rows, index, complete)
+
+    def take(self, count: pd.DataFrame, positions: list[int]) -> pd.DataFrame:
+        """Gather columns of the indexed count DataFrame by position, in sorted rows.
+
+        Args:
+            count (pd.DataFrame): count DataFrame indexed by `from_count`.
+            positions (list[int]): column positions in count DataFrame.
+
+        Returns:
+            pd.DataFrame: count DataFrame of the columns, with `index`.
+        """
+        taken = count.iloc[:, positions]
+        if not self.complete:
+            # rows only in annotation are NaN
+            taken = taken.reindex(self.index.get_level_values(0))
+        elif self.rows is not None:
+            taken = taken.take(self.rows)
+        taken.index = self.index
+        return taken
+
+
+def select_group_gsms(
+    group: str, gsms: Iterable[GsmAcc], in_count: Container[GsmAcc]
+) -> list[GsmAcc]:
+    """Select GSMs of a group which are in count matrix, warning about the others.
+
+    Args:
+        group (str): group of GSMs (e.g., "control").
+        gsms (Iterable[GsmAcc]): GSMs of group.
+        in_count (Container[GsmAcc]): GSMs in count matrix.
+
+    Returns:
+        list[GsmAcc]: sorted GSMs of group in count matrix (empty if none).
+    """
+    gsms = list(gsms)
+    gsms_in_count = sorted({gsm for gsm in gsms if gsm in in_count})
+    if len(gsms_in_count) == 0:
+        warnings.warn(f"No GSMs matched for {group}")
+    elif len(gsms_in_count) < len(gsms):
+        warnings.warn(
+            f"Only {len(gsms_in_count)} GSMs matched for {group} out of {len(gsms)}"
+            f" (dropped: {sorted(set(gsms) - set(gsms_in_count))})"
+        )
+    return gsms_in_count
 
 
 def construct_pair_count(
-    pair_gsms: PairGsms, count: pd.DataFrame, annot: pd.DataFrame | None = None, sep="-"
+    pair_gsms: PairGsms,
+    count: pd.DataFrame,
+    annot: pd.DataFrame | None = None,
+    sep="-",
+    count_index: PairCountIndex | None = None,
 ) -> pd.DataFrame:
     """Construct count DataFrame for paired GSMs.
 
+    The columns of all groups are gathered by position in one take, and rows are put in
+    the order of GeneIDs of `count_index`.
+
     Args:
         pair_gsms (PairGsms): a dictionary of GSMs (value) for each group (key).
         count (pd.DataFrame): count DataFrame.
         annot (pd.DataFrame | None, optional): annotation DataFrame. Defaults to None.
         sep (str, optional): separator between group and GSM in column. Defaults to "-".
+        count_index (PairCountIndex | None, optional): index of `count` and `annot`,
+            shared by the pairs of a series. Defaults to None (computed for this pair).
+
+    Raises:
+        ValueError: If no GSMs of any group are in count matrix, and no annotation.
 
     Returns:
         pd.DataFrame: count DataFrame for paired GSMs.
     """
-    group_df_list: list[pd.DataFrame] = []
-    if annot is not None:
-        group_df_list.append(annot)
+    if count_index is None:
+        count_index = PairCountIndex.from_count(count, annot)
+    positions: list[int] = []
+    columns: list[str] = []
     for group, gsms in pair_gsms.items():
-        # check if GSMs are in count matrix
-        gsms_in_count = set(count.columns) & set(gsms)
+        gsms_in_count = select_group_gsms(group, gsms, count_index.positions)
         if len(gsms_in_count) == 0:
-            warnings.warn(f"No GSMs matched for {group}")
-        else:
-            if len(gsms_in_count) < len(gsms):
-                # warn if some GSMs are not in count matrix
-                warnings.warn(
-                    f"Only {len(gsms_in_count)} GSMs matched for {group} out of {len(gsms)}"
-                    f" (dropped: {sorted(list(set(gsms) - gsms_in_count))}))"
-                )
-            # append count matrix for GSMs of this group in count matrix
-            group_df_list.append(
-                count[sorted(list(gsms_in_count))].add_prefix(group + sep)
-            )
-    pair_count = pd.concat(group_df_list, axis=1).sort_index()
-    if annot is not None:
-        pair_count.set_index(annot.columns.tolist(), append=True, inplace=True)
+            continue
+        positions.extend(count_index.positions[gsm] for gsm in gsms_in_count)
+        columns.extend(group + sep + gsm for gsm in gsms_in_count)
+    if not columns and annot is None:
+        raise ValueError("No GSMs matched for any group")
+    pair_count = count_index.take(count, positions)
+    pair_count.columns = columns
     return pair_count
 
 
@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+import gzip
+import io
+import os
+from pathlib import Path
+import secrets
+from typing import IO, Iterator
+
+import numpy as np
+import pandas as pd
+
+try:
+    import zstandard as zstd
+except ImportError:  # optional dependency: pip install ncbi-counts[zstd]
+    zstd = None
+try:
+    import pyarrow as pa
+    from pyarrow import feather, parquet
+except ImportError:  # optional dependency: pip install ncbi-counts[cache]
+    pa = None
+try:
+    import anndata
+except ImportError:  # optional dependency: pip install ncbi-counts[anndata]
+    anndata = None
+try:
+    import tables
+except ImportError:  # optional dependency: pip install ncbi-counts[hdf5]
+    tables = None
+
+from .sparse import get_sidecar_paths, write_mtx, write_npz, write_sparse_names
+from .types import Compression, OutputFormat
+
+COMPRESSION_SUFFIXES: dict[Compression | None, str] = {
+    None: "",
+    "gzip": ".gz",
+    "zstd": ".zst",
+}
+FORMAT_SUFFIXES: dict[OutputFormat, str] = {
+    "tsv": ".tsv",
+    "parquet": ".parquet",
+    "feather": ".feather",
+    "h5ad": ".h5ad",
+    "hdf5": ".h5",
+    "mtx": ".mtx",
+    "npz": ".npz",
+}
+# compressions supported by each binary format (None: its default)
+FORMAT_COMPRESSIONS: dict[OutputFormat, tuple[Compression, ...]] = {
+    "parquet": ("gzip", "zstd"),
+    "feather": ("zstd",),
+    "h5ad": ("gzip",),
+    "hdf5": (),
+    "mtx": (),
+    "npz": (),
+}
+HDF5_KEY = "pair_count"
+GZIP_LEVEL = 6
+TSV_OPTIONS = {"sep": "\t", "encoding": "utf-8", "lineterminator": "\n"}
+
+
+def _require(module, name: str, extra: str):
+    if module is None:
+        raise ImportError(
+            f"{name} is required for this output: pip install 'ncbi-counts[{extra}]'"
+        )
+
+
+def get_pair_count_suffix(
+    output_format: OutputFormat = "tsv", compression: Compression | None = None
+) -> str:
+    """Get suffix of pair count files.
+
+    Args:
+        output_format (OutputFormat, optional): format of files. Defaults to "tsv".
+        compression (Compression | None, optional): compression of files. Defaults to None.
+
+    Raises:
+        ValueError: If the format is unknown, or the compression is not supported for it.
+
+    Returns:
+        str: suffix (e.g. ".tsv.gz", ".parquet").
+    """
+    if output_format not in FORMAT_SUFFIXES:
+        raise ValueError(f"Unknown output format: {output_format}")
+    if output_format == "tsv":
+        return FORMAT_SUFFIXES[output_format] + COMPRESSION_SUFFIXES[compression]
+    if compression is not None and compression not in FORMAT_COMPRESSIONS.get(
+        output_format, ()
+    ):
+        raise ValueError(
+            f"Compression {compression} is not supported for {output_format} output"
+        )
+    return FORMAT_SUFFIXES[output_format]
+
+
+def check_output_format(
+    output_format: OutputFormat = "tsv", compression: Compression | None = None
+):
+    """Check that pair count files can be written in a format and compression.
+
+    Args:
+        output_format (OutputFormat, optional): format of files. Defaults to "tsv".
+        compression (Compression | None, optional): compression of files. Defaults to None.
+
+    Raises:
+        ValueError: If the format is unknown, or the compression is not supported for it.
+        ImportError: If the optional dependency of the format or compression is missing.
+    """
+    get_pair_count_suffix(output_format, compression)
+    if output_format in ("parquet", "feather"):
+        _require(pa, "pyarrow", "cache")
+    elif output_format == "h5ad":
+        _require(anndata, "anndata", "anndata")
+    elif output_format == "hdf5":
+        _require(tables, "tables", "hdf5")
+    elif output_format == "tsv" and compression == "zstd":
+        _require(zstd, "zstandard", "zstd")
+
+
+def _densify(pair_count: pd.DataFrame) -> pd.DataFrame:
+    return pair_count.astype(
+        {
+            col: dtype.subtype
+            for col, dtype in pair_count.dtypes.items()
+            if isinstance(dtype, pd.SparseDtype)
+        }
+    )
+
+
+@contextmanager
+def _atomic_path(path: Path) -> Iterator[Path]:
+    # not NamedTemporaryFile, which is created with mode 0600
+    tmp_path = path.with_name(f".{path.name}.{secrets.token_hex(4)}.tmp")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def _open_sink(raw: IO[bytes], compression: Compression | None) -> IO[bytes]:
+    if compression is None:
+        return raw
+    if compression == "gzip":
+        # no file name and mtime in header, so the same table gives the same bytes
+        return gzip.GzipFile(
+            filename="", mode="wb", compresslevel=GZIP_LEVEL, fileobj=raw, mtime=0
+        )
+    if compression == "zstd":
+        _require(zstd, "zstandard", "zstd")
+        return zstd.ZstdCompressor(threads=-1).stream_writer(raw)
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+def _has_line_breaks(index: pd.Index) -> bool:
+    levels = index.levels if isinstance(index, pd.MultiIndex) else [index]
+    return any(
+        not pd.api.types.is_numeric_dtype(level)
+        and pd.Series(level, dtype=object).astype(str).str.contains("[\r\n]").any()
+        for level in levels
+    )
+
+
+def _format_index(index: pd.Index, header: bool) -> list[str]:
+    text = pd.DataFrame(index=index).to_csv(header=header, **TSV_OPTIONS)
+    return text.split("\n")[:-1]
+
+
+def _format_values(frame: pd.DataFrame, header: bool) -> list[str]:
+    # A constant dummy index keeps pandas from quoting a lone empty field ('""').
+    text = frame.set_axis(np.zeros(len(frame), dtype=np.int8)).to_csv(
+        header=header, **TSV_OPTIONS
+    )
+    lines = text.split("\n")[:-1]
+    if header:
+        lines[0] = lines[0][1:]
+    lines[header:] = [line[2:] for line in lines[header:]]
+    return lines
+
+
+def _write_chunks(
+    pair_count_list: list[pd.DataFrame], sinks: list[IO[bytes]], chunksize: int
+):
+    index = pair_count_list[0].index
+    with ThreadPoolExecutor(len(sinks)) as pool:
+        for start in range(0, max(len(index), 1), chunksize):
+            stop = start + chunksize
+            header = start == 0
+            prefix = _format_index(index[start:stop], header)
+            chunks = []
+            for pair_count in pair_count_list:
+                values = _format_values(pair_count.iloc[start:stop], header)
+                lines = [p + "\t" + v for p, v in zip(prefix, values)]
+                chunks.append(("\n".join(lines) + "\n").encode("utf-8"))
+            # compressors release the GIL, so files are compressed in parallel
+            list(pool.map(lambda args: args[0].write(args[1]), zip(sinks, chunks)))
+
+
+def write_pair_count_table(
+    pair_count: pd.DataFrame,
+    path: Path,
+    output_format: OutputFormat,
+    compression: Compression | None = None,
+    sep: str = "-",
+):
+    """Write a pair count DataFrame into a binary columnar or sparse file.
+
+    GeneID and annotation columns (index levels) are kept with their types, so the
+    file is read without parsing, and its columns can be read selectively.
+
+    - parquet / feather: `pd.read_parquet` / `pd.read_feather` restore the index.
+    - h5ad: AnnData of GSM (obs, with group and GSM, or GSM only for a consolidated
+      matrix) x gene (var, with annotation).
+    - hdf5: `pd.read_hdf(path, "pair_count")`, GeneID and annotation as columns that
+      can be queried (nullable integers are stored as float).
+    - mtx / npz: sparse genes x GSMs matrix (`scipy.io.mmread` /
+      `scipy.sparse.load_npz`), with GeneID and annotation in `.genes.tsv` and
+      columns in `.samples.tsv` next to it.
+
+    Args:
+        pair_count (pd.DataFrame): pair count DataFrame.
+        path (Path): file path to save.
+        output_format (OutputFormat): format of file.
+        compression (Compression | None, optional): compression of file. Defaults to None.
+        sep (str, optional): separator between group and GSM in column. Defaults to "-".
+    """
+    get_pair_count_suffix(output_format, compression)
+    if output_format in ("mtx", "npz"):
+        with ExitStack() as stack:
+            # the matrix file is renamed last, after its names
+            tmp_path, tmp_genes_path, tmp_samples_path = (
+                stack.enter_context(_atomic_path(p))
+                for p in (path, *get_sidecar_paths(path))
+            )
+            write_sparse_names(pair_count, tmp_genes_path, tmp_samples_path)
+            if output_format == "mtx":
+                write_mtx(pair_count, tmp_path)
+            else:
+                write_npz(pair_count, tmp_path)
+        return
+    pair_count = _densify(pair_count)
+    with _atomic_path(path) as tmp_path:
+        if output_format in ("parquet", "feather"):
+            _require(pa, "pyarrow", "cache")
+            table = pa.Table.from_pandas(pair_count, preserve_index=True)
+            if output_format == "parquet":
+                parquet.write_table(
+                    table, tmp_path, compression=compression or "snappy"
+                )
+            else:
+                feather.write_feather(
+                    table, tmp_path, compression=compression or "uncompressed"
+                )
+        elif output_format == "h5ad":
+            _require(anndata, "anndata", "anndata")
+            var = pair_count.index.to_frame(index=False)
+            var.index = var.pop(pair_count.index.names[0]).astype(str)
+            columns = pair_count.columns.astype(str)
+            obs = pd.DataFrame(index=columns)
+            parts = [col.rpartition(sep) for col in columns]
+            if all(found for _, found, _ in parts):
+                # columns of pairs are GROUP{sep}GSM (a pair may have none)
+                obs["group"] = pd.Categorical([group for group, _, _ in parts])
+                obs["gsm"] = [gsm for _, _, gsm in parts]
+            else:
+                # columns of consolidated matrices are GSMs, in several groups
+                obs["gsm"] = list(columns)
+            adata = anndata.AnnData(X=pair_count.to_numpy().T, obs=obs, var=var)
+            adata.write_h5ad(tmp_path, compression=compression)
+        elif output_format == "hdf5":
+            _require(tables, "tables", "hdf5")
+            table = pair_count.reset_index()
+            # PyTables cannot store nullable integers
+            nullable = table.select_dtypes("Int64").columns
+            table[nullable] = table[nullable].astype("float64")
+            table.to_hdf(
+                tmp_path,
+                key=HDF5_KEY,
+                format="table",
+                data_columns=pair_count.index.names,
+                index=False,
+            )
+        else:
+            raise ValueError(f"Unknown output format: {output_format}")
+
+
+def write_pair_counts(
+    pair_count_list: list[pd.DataFrame],
+    pair_count_path_list: list[Path],
+    compression: Compression | None = None,
+    chunksize: int = 2**14,
+    output_format: OutputFormat = "tsv",
+    sep: str = "-",
+):
+    """Write pair count DataFrames into TSV files in one pass over their rows.
+
+    Other formats are written by `write_pair_count_table`, one file at a time.
+    The pair count DataFrames of a series share their index (GeneID and annotation
+    columns), so each chunk of the index is formatted once for all files. The output is
+    the same as `DataFrame.to_csv`. Each file is written to a temporary file and then
+    renamed, so an interrupted run never leaves a truncated file.
+
+    Args:
+        pair_count_list (list[pd.DataFrame]): pair count DataFrames.
+        pair_count_path_list (list[Path]): file paths to save.
+        compression (Compression | None, optional): compression of files. Defaults to None.
+        chunksize (int, optional): number of rows formatted at once. Defaults to 2**14.
+        output_format (OutputFormat, optional): format of files. Defaults to "tsv".
+        sep (str, optional): separator between group and GSM in column. Defaults to "-".
+    """
+    if output_format != "tsv":
+        for pair_count, path in zip(pair_count_list, pair_count_path_list):
+            write_pair_count_table(pair_count, path, output_format, compression, sep)
+        return
+    if not pair_count_list:
+        return
+    index = pair_count_list[0].index
+    shared = not _has_line_breaks(index) and all(
+        (pair_count.index is index or pair_count.index.equals(index))
+        and len(pair_count.columns) > 0
+        for pair_count in pair_count_list
+    )
+    with ExitStack() as stack:
+        tmp_paths: list[Path] = []
+        stack.callback(lambda: [p.unlink(missing_ok=True) for p in tmp_paths])
+        sinks: list[IO[bytes]] = []
+        with ExitStack() as files:
+            for path in pair_count_path_list:
+                tmp_path = path.with_name(f".{path.name}.{secrets.token_hex(4)}.tmp")
+                raw = files.enter_context(open(tmp_path, "xb"))
+                tmp_paths.append(tmp_path)
+                sink = _open_sink(raw, compression)
+                if sink is not raw:
+                    files.enter_context(sink)
+                sinks.append(sink)
+            if shared:
+                _write_chunks(pair_count_list, sinks, chunksize)
+            else:
+                for pair_count, sink in zip(pair_count_list, sinks):
+                    text = io.TextIOWrapper(sink, encoding="utf-8", newline="")
+                    pair_count.to_csv(text, **TSV_OPTIONS)
+                    text.flush()
+                    text.detach()
+        for tmp_path, path in zip(tmp_paths, pair_count_path_list):
+            os.replace(tmp_path, path)
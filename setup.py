@@ -37,7 +37,13 @@ setup(
     url="https://github.com/136s/ncbi_counts",
     packages=find_packages(exclude=("tests", "docs")),
     python_requires=">=3.9.0",
-    install_requires=["GEOparse", "pandas", "PyYAML"],
-    extras_require={"dev": ["pytest", "build", "twine"]},
+    install_requires=["GEOparse", "pandas", "PyYAML", "requests", "tqdm"],
+    extras_require={
+        "dev": ["pytest", "pytest-benchmark", "build", "twine"],
+        "cache": ["pyarrow"],
+        "zstd": ["zstandard"],
+        "anndata": ["anndata"],
+        "hdf5": ["tables"],
+    },
     keywords=["GEO", "Gene Expression Omnibus", "Bioinformatics", "RNA-seq", "NCBI"],
 )
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+
+from contextlib import contextmanager
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import random
+import threading
+from typing import Iterator
+
+from ncbi_counts.types import GseAcc, GsmAcc, StrPath
+from ncbi_counts.utils import get_annot_url, get_count_url, parse_filename_from_url
+
+ANNOT_COLUMNS = [
+    "Symbol",
+    "Description",
+    "Synonyms",
+    "GeneType",
+    "EnsemblGeneID",
+    "Status",
+    "ChrAcc",
+    "ChrStart",
+    "ChrStop",
+    "Orientation",
+    "Length",
+    "GOFunctionID",
+    "GOProcessID",
+    "GOComponentID",
+    "GOFunction",
+    "GOProcess",
+    "GOComponent",
+]
+TISSUES = ["Cornea", "Limbus", "Sclera"]
+INFECTIONS = ["mock", "SARS-CoV-2"]
+
+
+def gene_ids(n_genes: int) -> list[int]:
+    """Generate increasing GeneIDs whose string order differs from numeric order."""
+    ids = [1, 2, 3, 9, 10, 12]
+    while len(ids) < n_genes:
+        ids.append(ids[-1] + 1 + (len(ids) * 37) % 101)
+    return ids[:n_genes]
+
+
+def gsm_attributes(
+    gse_acc: GseAcc, n_reps: int = 2, gsm_start: int = 1000
+) -> dict[GsmAcc, dict[str, list[str]]]:
+    """Generate Sample attributes for a tissue x infection design."""
+    gse_num = int(gse_acc[3:])
+    attributes: dict[GsmAcc, dict[str, list[str]]] = {}
+    i = 0
+    for tissue in TISSUES:
+        for infection in INFECTIONS:
+            for rep in range(1, n_reps + 1):
+                gsm = f"GSM{gse_num * gsm_start + i}"
+                attributes[gsm] = {
+                    "title": [f"{tissue}_{infection}_{rep}"],
+                    "geo_accession": [gsm],
+                    "characteristics_ch1": [
+                        f"tissue: {tissue.lower()}",
+                        f"infection: {infection}",
+                    ],
+                }
+                i += 1
+    return attributes
+
+
+def write_soft(
+    soft_path: StrPath,
+    gse_acc: GseAcc,
+    attributes: dict[GsmAcc, dict[str, list[str]]],
+) -> Path:
+    """Write a family SOFT file that GEOparse can parse."""
+    lines = [
+        "^DATABASE = GeoMiame",
+        "!Database_name = Gene Expression Omnibus (GEO)",
+        f"^SERIES = {gse_acc}",
+        f"!Series_title = Synthetic series {gse_acc}",
+        f"!Series_geo_accession = {gse_acc}",
+        "^PLATFORM = GPL1",
+        "!Platform_title = Synthetic platform",
+        "!Platform_geo_accession = GPL1",
+        "#ID = ",
+        "!platform_table_begin",
+        "ID",
+        "!platform_table_end",
+    ]
+    for gsm, attribs in attributes.items():
+        lines.append(f"^SAMPLE = {gsm}")
+        for attrib, values in attribs.items():
+            lines.extend(f"!Sample_{attrib} = {v}" for v in values)
+        lines.extend(["!sample_table_begin", "!sample_table_end"])
+    with gzip.open(soft_path, "wt", encoding="utf-8", newline="\n") as f:
+        f.write("\n".join(lines) + "\n")
+    return Path(soft_path)
+
+
+def write_count(
+    count_path: StrPath, gsms: list[GsmAcc], genes: list[int], seed: int = 0
+) -> Path:
+    """Write a raw count matrix with many zero cells."""
+    rng = random.Random(seed)
+    with gzip.open(count_path, "wt", encoding="utf-8", newline="\n") as f:
+        f.write("\t".join(["GeneID"] + gsms) + "\n")
+        for gene in genes:
+            counts = [0 if rng.random() < 0.4 else rng.randint(1, 5000) for _ in gsms]
+            f.write("\t".join(map(str, [gene] + counts)) + "\n")
+    return Path(count_path)
+
+
+def write_annot(annot_path: StrPath, genes: list[int], seed: int = 0) -> Path:
+    """Write a gene annotation table with some empty fields."""
+    rng = random.Random(seed)
+    with gzip.open(annot_path, "wt", encoding="utf-8", newline="\n") as f:
+        f.write("\t".join(["GeneID"] + ANNOT_COLUMNS) + "\n")
+        for gene in genes:
+            row = {
+                "Symbol": f"GENE{gene}",
+                "Description": "" if gene % 7 == 0 else f"synthetic gene {gene}",
+                "Synonyms": "",
+                "GeneType": rng.choice(["protein-coding", "ncRNA", "pseudo"]),
+                "EnsemblGeneID": f"ENSG{gene:011}",
+                "Status": "live",
+                "ChrAcc": rng.choice(["NC_000001.11", "NC_000002.12"]),
+                "ChrStart": str(gene * 100),
+                "ChrStop": str(gene * 100 + 999),
+                "Orientation": rng.choice(["plus", "minus"]),
+                "Length": str(rng.randint(200, 10000)),
+                "GOFunctionID": "",
+                "GOProcessID": "",
+                "GOComponentID": "",
+                "GOFunction": "",
+                "GOProcess": "",
+                "GOComponent": "",
+            }
+            f.write("\t".join([str(gene)] + [row[c] for c in ANNOT_COLUMNS]) + "\n")
+    return Path(annot_path)
+
+
+def write_series(
+    src_dir: StrPath,
+    gse_acc: GseAcc,
+    n_genes: int = 50,
+    n_reps: int = 2,
+    annot_ver: str = "GRCh38.p13",
+) -> dict[GsmAcc, dict[str, list[str]]]:
+    """Write SOFT, count and annotation files of a series into `src_dir`.
+
+    The file names are the ones `Series` resolves, so no network access is needed.
+    """
+    src_dir = Path(src_dir)
+    src_dir.mkdir(parents=True, exist_ok=True)
+    attributes = gsm_attributes(gse_acc, n_reps=n_reps)
+    genes = gene_ids(n_genes)
+    write_soft(src_dir.joinpath(f"{gse_acc}_family.soft.gz"), gse_acc, attributes)
+    count_url = get_count_url(gse_acc, annot_ver=annot_ver)
+    write_count(
+        src_dir.joinpath(parse_filename_from_url(count_url)),
+        list(attributes),
+        genes,
+        seed=int(gse_acc[3:]),
+    )
+    annot_url = get_annot_url(annot_ver=annot_ver)
+    write_annot(src_dir.joinpath(parse_filename_from_url(annot_url)), genes)
+    return attributes
+
+
+def write_expected_sources(
+    src_dir: StrPath, expected_dir: StrPath = "tests/data/expected"
+) -> None:
+    """Rebuild the source files of the series in `expected_dir` from its outputs.
+
+    Sample attributes follow `tests/data/sample_geo_regex.yaml`, so running it against
+    `src_dir` reproduces the expected outputs without network access.
+    """
+    src_dir = Path(src_dir)
+    src_dir.mkdir(parents=True, exist_ok=True)
+    expected_dir = Path(expected_dir)
+    group_names = {
+        "GSE164073": [("Cornea", "Cornea"), ("Limbus", "Limbus"), ("Sclera", "Sclera")],
+        "GSE63966": [
+            ("LP-C", "LP-A"),
+            ("HM3-C", "HM3-A"),
+            ("HPM3-C", "HPM3-A"),
+            ("HPM4-C", "HPM4-A"),
+        ],
+    }
+    annot_rows: list[list[str]] = []
+    for gse, names in group_names.items():
+        attributes: dict[GsmAcc, dict[str, list[str]]] = {}
+        columns: dict[GsmAcc, list[str]] = {}
+        for i, (control, treatment) in enumerate(names, start=1):
+            with open(expected_dir.joinpath("count", f"{gse}-{i}.tsv")) as f:
+                rows = [line.rstrip("\n").split("\t") for line in f]
+            annot_rows = [row[:3] for row in rows]
+            for j, column in enumerate(rows[0][3:], start=3):
+                group, gsm = column.split("-", 1)
+                if gse == "GSE164073":
+                    infection = "mock" if group == "control" else "SARS-CoV-2"
+                    title = f"{control}_{infection}_{len(attributes) + 1}"
+                    characteristics = [
+                        f"tissue: {control.lower()}",
+                        f"infection: {infection}",
+                    ]
+                else:
+                    title = f"{control if group == 'control' else treatment}_{len(attributes) + 1}"
+                    characteristics = ["cell line: synthetic"]
+                attributes[gsm] = {
+                    "title": [title],
+                    "geo_accession": [gsm],
+                    "characteristics_ch1": characteristics,
+                }
+                columns[gsm] = [row[j] for row in rows[1:]]
+        write_soft(src_dir.joinpath(f"{gse}_family.soft.gz"), gse, attributes)
+        count_path = src_dir.joinpath(parse_filename_from_url(get_count_url(gse)))
+        with gzip.open(count_path, "wt", encoding="utf-8", newline="\n") as f:
+            f.write("\t".join(["GeneID"] + list(columns)) + "\n")
+            for k, row in enumerate(annot_rows[1:]):
+                f.write("\t".join([row[0]] + [v[k] for v in columns.values()]) + "\n")
+    annot_path = src_dir.joinpath(parse_filename_from_url(get_annot_url()))
+    with gzip.open(annot_path, "wt", encoding="utf-8", newline="\n") as f:
+        f.write("\t".join(["GeneID"] + ANNOT_COLUMNS) + "\n")
+        for row in annot_rows[1:]:
+            f.write("\t".join(row + [""] * (len(ANNOT_COLUMNS) - 2)) + "\n")
+
+
+BODY = gzip.compress(random.Random(0).randbytes(2**18))
+ETAG = '"v1"'
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Serve BODY with ETag and Range support, failing as scripted in `actions`.
+
+    Each request pops an action: "ok", a status code to fail with, or "truncate" to
+    close the connection after half of the response.
+    """
+
+    protocol_version = "HTTP/1.1"
+    actions: list[str] = []
+    requests: list[dict[str, str]] = []
+    clients: set[int] = set()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.requests.append(dict(self.headers))
+        self.clients.add(self.client_address[1])
+        action = self.actions.pop(0) if self.actions else "ok"
+        if action.isdigit():
+            self.send_error(int(action))
+            return
+        if self.path == "/missing.gz":
+            self.send_error(404)
+            return
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        start = 0
+        range_header = self.headers.get("Range")
+        if range_header and self.headers.get("If-Range") == ETAG:
+            start = int(range_header.removeprefix("bytes=").rstrip("-"))
+        body = BODY[start:]
+        self.send_response(206 if start else 200)
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(len(body)))
+        if start:
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(BODY)-1}/{len(BODY)}"
+            )
+        self.end_headers()
+        if action == "truncate":
+            self.wfile.write(body[: len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@contextmanager
+def serve() -> Iterator[str]:
+    """Run a local stand-in of NCBI serving BODY at any path (except /missing.gz)."""
+    FlakyHandler.actions = []
+    FlakyHandler.requests = []
+    FlakyHandler.clients = set()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
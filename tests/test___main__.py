@@ -2,10 +2,15 @@
 
 import filecmp
 from pathlib import Path
+import subprocess
+import sys
+
+import pandas as pd
 import pytest
 
 from ncbi_counts import __main__, utils
 from ncbi_counts.types import AnnotColumns, GeoRegex, StrPath
+from tests.synthetic import write_expected_sources, write_series
 
 SAMPLE_GEO_REGEX_PATH = Path("tests/data/sample_geo_regex.yaml")
 SAMPLE_GEO_REGEX: GeoRegex = {
@@ -69,3 +74,59 @@ def test_main(sample_input: Path) -> None:
         actual_path = expected_dir.parent.joinpath(path.relative_to(expected_dir))
         assert actual_path.is_file(), f"Missing {actual_path}"
         assert filecmp.cmp(path, actual_path, shallow=False), f"Differs {actual_path}"
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_main_offline(tmp_path: Path, sparse: bool) -> None:
+    src_dir = tmp_path.joinpath("raw")
+    write_expected_sources(src_dir)
+    rows = [
+        [gse, i, group, attrib, pattern]
+        for gse, pair_regex_list in SAMPLE_GEO_REGEX.items()
+        for i, pair_regex in enumerate(pair_regex_list)
+        for group, attrib_regex in pair_regex.items()
+        for attrib, pattern in attrib_regex.items()
+    ]
+    geo_regex_path = tmp_path.joinpath("sample_geo_regex.csv")
+    pd.DataFrame(rows, columns=["gse", "pair", "group", "attrib", "pattern"]).to_csv(
+        geo_regex_path, index=False
+    )
+
+    __main__.main(
+        geo_regex_path=geo_regex_path,
+        keep_annot=["Symbol", "Description"],
+        src_dir=src_dir,
+        save_to=tmp_path.joinpath("count"),
+        to_yaml=tmp_path.joinpath("sample_gsms.yaml"),
+        sparse=sparse,
+    )
+
+    expected_dir = Path("tests/data/expected")
+    for path in expected_dir.glob("**/*.*"):
+        actual_path = tmp_path.joinpath(path.relative_to(expected_dir))
+        assert actual_path.is_file(), f"Missing {actual_path}"
+        assert filecmp.cmp(path, actual_path, shallow=False), f"Differs {actual_path}"
+
+
+def test_main_local_norm_cli(tmp_path: Path) -> None:
+    src_dir = tmp_path.joinpath("raw")
+    write_series(src_dir, "GSE1")
+    geo_regex_path = tmp_path.joinpath("geo_regex.yaml")
+    utils.save_yaml(
+        {
+            "GSE1": [
+                {
+                    "control": {"title": "Cornea_mock"},
+                    "treatment": {"title": "Cornea_SARS"},
+                }
+            ]
+        },
+        geo_regex_path,
+    )
+    save_to = tmp_path.joinpath("count")
+    args = [geo_regex_path, "-n", "tpm", "-l", "-s", src_dir, "-o", save_to]
+    subprocess.run([sys.executable, "-m", "ncbi_counts", *map(str, args)], check=True)
+
+    pair_count = pd.read_table(save_to.joinpath("GSE1-1.tsv"), index_col=0)
+    # TPM of each GSM sums to a million over all genes
+    assert pair_count.sum().round().eq(1e6).all()
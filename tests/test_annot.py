@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from ncbi_counts import annot, utils
+from tests.synthetic import gene_ids, write_annot, write_count
+
+ANNOT_URL = utils.get_annot_url()
+
+
+def test_annot_store(tmp_path: Path) -> None:
+    annot_path = write_annot(tmp_path.joinpath("annot.tsv.gz"), gene_ids(30))
+    store = annot.AnnotStore()
+    full = store.get(ANNOT_URL, annot_path)
+    symbol = store.get(ANNOT_URL, annot_path, columns=["Symbol", "Length"])
+    assert len(store) == 1
+    assert store.get(ANNOT_URL, annot_path) is full
+    assert symbol.columns.tolist() == ["Symbol", "Length"]
+    assert np.shares_memory(symbol["Length"].array._data, full["Length"].array._data)
+    assert full["GeneType"].dtype == "category"
+
+    # another annotation version evicts the least recently used table
+    store.max_bytes = store.nbytes
+    store.get(ANNOT_URL, annot_path, annot_ver="GRCh38.p14")
+    assert len(store) == 1
+
+
+def test_annot_store_path(tmp_path: Path) -> None:
+    # files of two source directories with the same version and mtime
+    for name in ["a", "b"]:
+        tmp_path.joinpath(name).mkdir()
+    annot_path = write_annot(tmp_path.joinpath("a", "annot.tsv.gz"), gene_ids(30))
+    other_path = write_annot(tmp_path.joinpath("b", "annot.tsv.gz"), gene_ids(20))
+    mtime_ns = annot_path.stat().st_mtime_ns
+    os.utime(other_path, ns=(mtime_ns, mtime_ns))
+    store = annot.AnnotStore()
+    assert len(store.get(ANNOT_URL, annot_path)) == 30
+    assert len(store.get(ANNOT_URL, other_path)) == 20
+    assert len(store) == 2
+
+
+def test_construct_pair_count_with_compact_annot(tmp_path: Path) -> None:
+    genes = gene_ids(30)
+    gsms = ["GSM1", "GSM2", "GSM3", "GSM4"]
+    annot_path = write_annot(tmp_path.joinpath("annot.tsv.gz"), genes)
+    count_path = write_count(tmp_path.joinpath("count.tsv.gz"), gsms, genes)
+    count = utils.read_count(count_path)
+    pair_gsms = {"control": ["GSM1", "GSM2"], "treatment": ["GSM4"]}
+    columns = ["Symbol", "Description", "Length", "GeneType"]
+
+    str_annot = pd.read_table(annot_path, index_col=0, dtype=str)[columns]
+    str_annot.index = str_annot.index.astype(int)
+    expected = utils.construct_pair_count(pair_gsms, count, annot=str_annot)
+    actual = utils.construct_pair_count(
+        pair_gsms,
+        count,
+        annot=annot.AnnotStore().get(ANNOT_URL, annot_path, columns=columns),
+    )
+    assert actual.to_csv(sep="\t") == expected.to_csv(sep="\t")
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+import os
+from pathlib import Path
+
+import pytest
+
+from ncbi_counts import cache, store, utils
+from ncbi_counts.core import Series
+from tests.synthetic import gene_ids, write_count, write_series
+
+pytest.importorskip("pyarrow")
+
+GSMS = ["GSM1", "GSM2", "GSM3", "GSM4"]
+
+
+def test_read_count_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    count_path = write_count(tmp_path.joinpath("count.tsv.gz"), GSMS, gene_ids(30))
+    expected = utils.read_count(count_path)
+    assert cache.read_count_cache(count_path).equals(expected)
+    assert cache.get_cache_path(count_path).is_file()
+
+    # the cache is used instead of parsing the count file
+    monkeypatch.setattr(cache, "read_count", None)
+    count = cache.read_count_cache(count_path, gsms=["GSM3", "GSM1"])
+    assert count.equals(expected[["GSM1", "GSM3"]])
+    assert count.dtypes.unique().tolist() == ["int32"]
+    monkeypatch.undo()
+
+    # the cache is rebuilt when the count file changes
+    write_count(count_path, GSMS, gene_ids(30), seed=1)
+    os.utime(count_path, ns=(0, count_path.stat().st_mtime_ns + 1))
+    assert cache.read_count_cache(count_path).equals(utils.read_count(count_path))
+
+
+@pytest.mark.parametrize("formats", [("feather", "mmap"), ("mmap", "feather")])
+def test_cleanup_count_caches(tmp_path: Path, formats: tuple[str, str]) -> None:
+    src_dir = tmp_path.joinpath("raw")
+    write_series(src_dir, "GSE1")
+    pair_regex_list = [
+        {"control": {"title": "Cornea_mock"}, "treatment": {"title": "Cornea_SARS"}}
+    ]
+    series_list = [
+        Series(
+            "GSE1",
+            pair_regex_list,
+            src_dir=src_dir,
+            save_to=None,
+            count_cache=count_cache,
+        )
+        for count_cache in formats
+    ]
+    for series in series_list:
+        series.build()
+    count_path = series_list[0].count_path
+    assert cache.get_cache_path(count_path).exists()
+    assert store.get_store_path(count_path).exists()
+
+    # caches of an earlier run in another format are removed too
+    series_list[-1].cleanup()
+    assert not cache.get_cache_path(count_path).exists()
+    assert not store.get_store_path(count_path).exists()
+    assert not store.get_store_lock_path(count_path).exists()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+import yaml
+
+from ncbi_counts import __main__, utils
+from ncbi_counts.combine import combine_series
+from ncbi_counts.core import Series
+from tests.synthetic import write_series
+
+PAIR_REGEX_LIST = [
+    {"control": {"title": "Cornea_mock"}, "treatment": {"title": "Cornea_SARS"}},
+    {"control": {"title": "Cornea_mock"}, "treatment": {"title": "Limbus_SARS"}},
+]
+
+
+def test_combine_series(tmp_path: Path) -> None:
+    src_dir = tmp_path.joinpath("raw")
+    # the annotation table is shared, so the series with all genes is written last
+    write_series(src_dir, "GSE2", n_genes=30)
+    write_series(src_dir, "GSE1", n_genes=50)
+    series_list = [
+        Series(
+            gse,
+            PAIR_REGEX_LIST.copy(),
+            keep_annot=["Symbol"],
+            src_dir=src_dir,
+            save_to=None,
+        )
+        for gse in ["GSE1", "GSE2"]
+    ]
+    combined = combine_series(series_list)
+
+    # the same as joining pair count matrices, with each GSM of a group once
+    pair_count_list = []
+    for series in series_list:
+        series.build()
+        for pair_count in series.pair_count_list:
+            pair_count_list.append(pair_count.add_prefix(f"{series.gse_acc}-"))
+    expected = pd.concat(pair_count_list, axis=1)
+    expected = expected.loc[:, ~expected.columns.duplicated()]
+    assert combined.columns[:3].tolist() == [
+        "GSE1-control-GSM1000",
+        "GSE1-control-GSM1001",
+        "GSE1-treatment-GSM1002",
+    ]
+    assert combined.index.names == ["GeneID", "Symbol"]
+    pd.testing.assert_frame_equal(combined, expected, check_dtype=False)
+    # genes missing from GSE2 are NaN, so counts are floats
+    assert combined.filter(like="GSE2").iloc[30:].isna().all(axis=None)
+    assert (combined.dtypes == np.float64).all()
+
+
+def test_main_combine(tmp_path: Path) -> None:
+    src_dir = tmp_path.joinpath("raw")
+    for gse in ["GSE2", "GSE1"]:
+        write_series(src_dir, gse)
+    geo_regex_path = tmp_path.joinpath("geo_regex.yaml")
+    utils.save_yaml(
+        {"GSE2": PAIR_REGEX_LIST, "GSE1": PAIR_REGEX_LIST[:1]}, geo_regex_path
+    )
+    save_to = tmp_path.joinpath("count")
+    series_dict = __main__.main(
+        geo_regex_path=geo_regex_path,
+        src_dir=src_dir,
+        save_to=save_to,
+        to_yaml=save_to.joinpath("gsms.yaml"),
+        combine="all",
+    )
+
+    assert sorted(p.name for p in save_to.iterdir()) == ["all.tsv", "gsms.yaml"]
+    combined = pd.read_table(save_to.joinpath("all.tsv"), index_col=0)
+    assert combined.columns.str.split("-").str[0].unique().tolist() == ["GSE2", "GSE1"]
+    # complete series keep their integer counts
+    assert (combined.dtypes == np.int64).all()
+    # count matrices are released once their columns are combined
+    assert all(series.count is None for series in series_dict.values())
+    assert list(yaml.safe_load(save_to.joinpath("gsms.yaml").read_text())) == [
+        "GSE2",
+        "GSE1",
+    ]
+
+
+def test_main_combine_skipped(tmp_path: Path, monkeypatch) -> None:
+    src_dir = tmp_path.joinpath("raw")
+    for gse in ["GSE2", "GSE1"]:
+        write_series(src_dir, gse)
+    geo_regex_path = tmp_path.joinpath("geo_regex.yaml")
+    utils.save_yaml({"GSE2": PAIR_REGEX_LIST, "GSE1": PAIR_REGEX_LIST}, geo_regex_path)
+    save_to = tmp_path.joinpath("count")
+    kwargs = dict(
+        geo_regex_path=geo_regex_path,
+        src_dir=src_dir,
+        save_to=save_to,
+        to_yaml=save_to.joinpath("gsms.yaml"),
+        incremental=True,
+    )
+    # recorded as up to date by an earlier run
+    __main__.main(**kwargs)
+    set_count = Series._set_count
+
+    def fail_gse1(series: Series):
+        if series.gse_acc == "GSE1":
+            raise ValueError("Could not load count matrix")
+        set_count(series)
+
+    monkeypatch.setattr(Series, "_set_count", fail_gse1)
+    with pytest.warns(UserWarning, match="Series GSE1 skipped"):
+        __main__.main(combine="all", **kwargs)
+
+    combined = pd.read_table(save_to.joinpath("all.tsv"), index_col=0)
+    assert combined.columns.str.startswith("GSE2-").all()
+    assert list(yaml.safe_load(save_to.joinpath("gsms.yaml").read_text())) == ["GSE2"]
+    with pytest.raises(ValueError, match="serially"):
+        __main__.main(combine="all", max_workers=2, **kwargs)
+
+
+def test_main_combine_unmatched(tmp_path: Path) -> None:
+    src_dir = tmp_path.joinpath("raw")
+    for gse in ["GSE2", "GSE1"]:
+        write_series(src_dir, gse)
+    geo_regex_path = tmp_path.joinpath("geo_regex.yaml")
+    unmatched = {"control": {"title": "Iris_mock"}, "treatment": {"title": "Iris_SARS"}}
+    utils.save_yaml({"GSE2": [unmatched], "GSE1": PAIR_REGEX_LIST}, geo_regex_path)
+    save_to = tmp_path.joinpath("count")
+    with pytest.warns(UserWarning) as record:
+        __main__.main(
+            geo_regex_path=geo_regex_path,
+            src_dir=src_dir,
+            save_to=save_to,
+            combine="all",
+        )
+
+    # reported as in pair count matrices
+    assert "No GSMs matched for control" in [str(w.message) for w in record]
+    combined = pd.read_table(save_to.joinpath("all.tsv"), index_col=0)
+    assert combined.columns.str.startswith("GSE1-").all()
+    # a series without columns does not turn counts into floats
+    assert (combined.dtypes == np.int64).all()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+from pathlib import Path
+import warnings
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from ncbi_counts import consolidate, utils
+from ncbi_counts.core import Series
+from tests.synthetic import write_series
+
+PAIR_GSMS_LIST = [
+    {"control": ["GSM2", "GSM1"], "treatment": ["GSM3", "GSM9"]},
+    {"control": ["GSM2", "GSM1"], "treatment": ["GSM4"]},
+    {"control": ["GSM8"], "treatment": ["GSM4"]},
+]
+
+
+def test_construct_series_count() -> None:
+    count = pd.DataFrame(
+        np.arange(12, dtype="int32").reshape(3, 4),
+        index=pd.Index([3, 1, 2], name="GeneID"),
+        columns=["GSM1", "GSM2", "GSM3", "GSM4"],
+    )
+    annot = pd.DataFrame(
+        {"Symbol": ["C", "A", "B", "D"]}, index=pd.Index([3, 1, 2, 4], name="GeneID")
+    )
+    for a in (None, annot):
+        with warnings.catch_warnings(record=True) as expected_warnings:
+            warnings.simplefilter("always")
+            expected = [
+                utils.construct_pair_count(pair_gsms, count, annot=a)
+                for pair_gsms in PAIR_GSMS_LIST
+            ]
+        with warnings.catch_warnings(record=True) as actual_warnings:
+            warnings.simplefilter("always")
+            series_count, pair_columns_list = consolidate.construct_series_count(
+                PAIR_GSMS_LIST, count, annot=a
+            )
+        assert [str(w.message) for w in actual_warnings] == [
+            str(w.message) for w in expected_warnings
+        ]
+        assert series_count.columns.tolist() == ["GSM1", "GSM2", "GSM3", "GSM4"]
+        # the same as joining by labels and sorting
+        expected_count = pd.concat(
+            ([] if a is None else [a]) + [count[series_count.columns]], axis=1
+        ).sort_index()
+        if a is not None:
+            expected_count = expected_count.set_index(["Symbol"], append=True)
+        pd.testing.assert_frame_equal(series_count, expected_count)
+        assert pair_columns_list[1] == {"control": [0, 1], "treatment": [3]}
+        views = consolidate.PairCountViews(series_count, pair_columns_list)
+        assert len(views) == len(expected)
+        for actual, exp in zip(views, expected):
+            pd.testing.assert_frame_equal(actual, exp)
+
+
+def test_series_consolidate(tmp_path: Path) -> None:
+    src_dir = tmp_path.joinpath("raw")
+    write_series(src_dir, "GSE1")
+    pair_regex_list = [
+        {"control": {"title": "Cornea_mock"}, "treatment": {"title": "Cornea_SARS"}},
+        {"control": {"title": "Cornea_mock"}, "treatment": {"title": "Limbus_SARS"}},
+    ]
+    kwargs = dict(keep_annot=["Symbol"], src_dir=src_dir)
+    series = Series(
+        "GSE1", pair_regex_list, save_to=tmp_path.joinpath("pairs"), **kwargs
+    )
+    series.generate_pair_matrix()
+    consolidated = Series(
+        "GSE1",
+        pair_regex_list,
+        save_to=tmp_path.joinpath("consolidated"),
+        consolidate=True,
+        **kwargs,
+    )
+    consolidated.generate_pair_matrix()
+
+    for expected, actual in zip(series.pair_count_list, consolidated.pair_count_list):
+        pd.testing.assert_frame_equal(actual, expected)
+    # control GSMs are shared by the two pairs
+    n_columns = sum(len(pair_count.columns) for pair_count in series.pair_count_list)
+    assert len(consolidated.series_count.columns) < n_columns
+    assert consolidated.series_count_path.name == "GSE1.tsv"
+    written = pd.read_table(consolidated.series_count_path, index_col=[0, 1])
+    assert written.columns.tolist() == consolidated.series_count.columns.tolist()
+    with open(consolidated.manifest_path, encoding="utf-8") as f:
+        manifest = yaml.safe_load(f)
+    assert manifest == consolidated.pair_count_list.to_manifest("GSE1.tsv")
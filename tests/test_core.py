@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+from pathlib import Path
+
+import pytest
+import yaml
+
+from ncbi_counts import __main__, utils
+from ncbi_counts.core import Series
+from tests.synthetic import write_series
+
+PAIR_REGEX_LIST = [
+    {"control": {"title": "Cornea_mock"}, "treatment": {"title": "Cornea_SARS"}},
+    {"control": {"title": "Limbus_mock"}, "treatment": {"title": "Limbus_SARS"}},
+]
+
+
+def test_series_stages(tmp_path: Path) -> None:
+    src_dir = tmp_path.joinpath("raw")
+    save_to = tmp_path.joinpath("count")
+    series = Series("GSE1", PAIR_REGEX_LIST.copy(), src_dir=src_dir, save_to=save_to)
+    # Nothing is downloaded, read or created until a stage runs
+    assert not src_dir.exists() and not save_to.exists()
+    assert series.completed_stages == []
+
+    write_series(src_dir, "GSE1")
+    series.match()
+    assert series.completed_stages == ["metadata", "match"]
+    assert len(series.pair_gsms_list) == 2
+
+    series.generate_pair_matrix()
+    assert series.completed_stages == ["metadata", "match", "counts", "build", "write"]
+    assert all(path.is_file() for path in series.pair_count_path_list)
+    # Stages run once
+    series.build()
+    series.generate_pair_matrix()
+    assert len(series.pair_count_list) == 2
+    assert [e.stage for e in series.stage_events].count("save") == 1
+
+
+def test_main_plan(tmp_path: Path, capsys: pytest.CaptureFixture) -> None:
+    src_dir = tmp_path.joinpath("raw")
+    write_series(src_dir, "GSE1")
+    geo_regex_path = tmp_path.joinpath("geo_regex.yaml")
+    utils.save_yaml({"GSE1": PAIR_REGEX_LIST, "GSE2": PAIR_REGEX_LIST}, geo_regex_path)
+    kwargs = dict(
+        geo_regex_path=geo_regex_path,
+        keep_annot=["Symbol"],
+        src_dir=src_dir,
+        save_to=tmp_path.joinpath("count"),
+        metadata_cache=True,
+        plan=True,
+    )
+
+    series_dict = __main__.main(**kwargs)
+    plan = yaml.safe_load(capsys.readouterr().out)
+    assert not tmp_path.joinpath("count").exists()
+    assert all(series.completed_stages == [] for series in series_dict.values())
+    assert plan["series"]["GSE1"]["pairs"] == 2
+    sources = plan["series"]["GSE1"]["sources"]
+    assert {name: source["status"] for name, source in sources.items()} == {
+        "soft": "present",
+        "count": "present",
+        "annot": "present",
+    }
+    assert plan["series"]["GSE2"]["sources"]["soft"]["status"] == "download"
+    assert plan["downloads"] == [
+        plan["series"]["GSE2"]["sources"]["soft"]["url"],
+        plan["series"]["GSE2"]["sources"]["count"]["url"],
+    ]
+
+    # Sample metadata cache makes SOFT file unnecessary
+    Series("GSE1", PAIR_REGEX_LIST.copy(), src_dir=src_dir, metadata_cache=True).match()
+    __main__.main(**kwargs)
+    plan = yaml.safe_load(capsys.readouterr().out)
+    assert plan["series"]["GSE1"]["sources"]["soft"]["status"] == "cached"
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+from ncbi_counts import fetch
+from tests.synthetic import BODY, ETAG, FlakyHandler, serve
+
+
+@pytest.fixture
+def server() -> Iterator[str]:
+    with serve() as url:
+        yield url
+
+
+def test_fetch_resume(server: str, tmp_path: Path) -> None:
+    FlakyHandler.actions = ["503", "truncate", "ok"]
+    path = tmp_path.joinpath("file.gz")
+    state_dir = tmp_path.joinpath("state")
+    fetch.fetch(server + "/file.gz", path, state_dir=state_dir, silent=True, backoff=0)
+    assert path.read_bytes() == BODY
+    assert len(FlakyHandler.requests) == 3
+    assert FlakyHandler.requests[2]["Range"].startswith("bytes=")
+    assert FlakyHandler.requests[2]["Range"] != "bytes=0-"
+    assert FlakyHandler.requests[2]["If-Range"] == ETAG
+    assert not state_dir.joinpath("file.gz" + fetch.PART_SUFFIX).exists()
+
+    # Unchanged file is revalidated, not downloaded again
+    fetch.fetch(server + "/file.gz", path, state_dir=state_dir, force=True, silent=True)
+    assert FlakyHandler.requests[3]["If-None-Match"] == ETAG
+    assert path.read_bytes() == BODY
+
+    fetch.remove_state(path, state_dir)
+    assert not any(state_dir.iterdir())
+
+
+def test_fetch_error(server: str, tmp_path: Path) -> None:
+    path = tmp_path.joinpath("missing.gz")
+    with pytest.raises(fetch.DownloadError):
+        fetch.fetch(server + "/missing.gz", path, silent=True, backoff=0)
+    assert len(FlakyHandler.requests) == 1  # 404 is not retried
+    assert not path.exists()
+
+    FlakyHandler.actions = ["500"] * 3
+    path = tmp_path.joinpath("file.gz")
+    with pytest.raises(fetch.DownloadError):
+        fetch.fetch(server + "/file.gz", path, silent=True, retries=2, backoff=0)
+    assert not path.exists()
+
+
+def test_is_gzip_intact(tmp_path: Path) -> None:
+    path = tmp_path.joinpath("file.gz")
+    path.write_bytes(BODY)
+    assert fetch.is_gzip_intact(path)
+    path.write_bytes(BODY[:-8])
+    assert not fetch.is_gzip_intact(path)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+from dataclasses import asdict
+import json
+from pathlib import Path
+
+import pytest
+
+from ncbi_counts import __main__, instrument, utils
+from tests.synthetic import BODY, serve, write_series
+
+GEO_REGEX = {
+    "GSE1": [
+        {"control": {"title": "Cornea_mock"}, "treatment": {"title": "Cornea_SARS"}},
+        {"control": {"title": "Limbus_mock"}, "treatment": {"title": "Limbus_SARS"}},
+    ],
+}
+
+
+def test_stage() -> None:
+    events: list[instrument.StageEvent] = []
+    with instrument.stage("outer", emit=events.append, gse_acc="GSE1") as event:
+        event.rows = 3
+        with instrument.stage("inner"):
+            pass
+    with pytest.raises(ValueError):
+        with instrument.stage("failed", emit=events.append):
+            raise ValueError("boom")
+    # no stage outside of stages
+    with instrument.stage("ignored"):
+        pass
+
+    assert [e.stage for e in events] == ["inner", "outer", "failed"]
+    inner, outer, failed = events
+    assert outer.rows == 3 and outer.gse_acc == "GSE1"
+    assert outer.start <= inner.start and inner.duration <= outer.duration
+    assert failed.error == "ValueError: boom"
+
+
+def test_download_stage(tmp_path: Path) -> None:
+    events: list[instrument.StageEvent] = []
+    path = tmp_path.joinpath("file.gz")
+    with serve() as url, instrument.stage("gse_info", emit=events.append):
+        utils.download(url + "/file.gz", path, silent=True)
+        # already downloaded
+        utils.download(url + "/file.gz", path, silent=True)
+    assert [e.stage for e in events] == ["download", "gse_info"]
+    assert events[0].bytes_downloaded == len(BODY)
+
+
+def test_main_profile(tmp_path: Path) -> None:
+    src_dir = tmp_path.joinpath("raw")
+    write_series(src_dir, "GSE1")
+    geo_regex_path = tmp_path.joinpath("geo_regex.yaml")
+    utils.save_yaml(GEO_REGEX, geo_regex_path)
+    events: list[instrument.StageEvent] = []
+    __main__.main(
+        geo_regex_path=geo_regex_path,
+        keep_annot=["Symbol"],
+        src_dir=src_dir,
+        save_to=tmp_path.joinpath("count"),
+        hooks=[events.append],
+        profile=tmp_path.joinpath("profile.jsonl"),
+        trace=tmp_path.joinpath("trace.json"),
+    )
+
+    stages = ["gse_info", "match", "count", "annot", "pair_count", "save"]
+    assert [e.stage for e in events] == ["load_input"] + stages
+    by_stage = {e.stage: e for e in events}
+    assert by_stage["count"].bytes_read > 0
+    assert (by_stage["count"].rows, by_stage["count"].columns) == (50, 8)
+    assert by_stage["match"].columns == 2
+    assert by_stage["save"].bytes_written > 0
+    assert all(e.gse_acc == "GSE1" for e in events[1:])
+
+    with open(tmp_path.joinpath("profile.jsonl"), encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    assert lines == [asdict(e) for e in events]
+    with open(tmp_path.joinpath("trace.json"), encoding="utf-8") as f:
+        trace = json.load(f)
+    assert {e["name"] for e in trace["traceEvents"]} == {"load_input"} | set(stages)
+    assert all(e["ph"] == "X" and e["dur"] >= 0 for e in trace["traceEvents"])
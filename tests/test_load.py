@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+from pathlib import Path
+
+import pytest
+
+from ncbi_counts import __main__, load
+from ncbi_counts.instrument import StageEvent
+from tests.synthetic import write_series
+
+CSV_TEXT = """gse,pair,group,attrib,pattern
+GSE2,0,control,title,Cornea
+GSE2,0,control,characteristics_ch1,mock
+GSE2,0,treatment,title,Cornea
+GSE2,1,control,title,"Limbus, left"
+GSE2,1,treatment,title,Limbus
+GSE1,0,control,title,^HM3-C$
+GSE1,0,treatment,title,^HM3-A$
+"""
+
+
+def test_iter_csv(tmp_path: Path) -> None:
+    path = tmp_path.joinpath("regex.csv")
+    path.write_text(CSV_TEXT, encoding="utf-8")
+    entries = list(load.iter_input(path))
+    assert [gse for gse, _ in entries] == ["GSE2", "GSE1"]
+    assert dict(entries) == {
+        "GSE2": [
+            {
+                "control": {"title": "Cornea", "characteristics_ch1": "mock"},
+                "treatment": {"title": "Cornea"},
+            },
+            {"control": {"title": "Limbus, left"}, "treatment": {"title": "Limbus"}},
+        ],
+        "GSE1": [{"control": {"title": "^HM3-C$"}, "treatment": {"title": "^HM3-A$"}}],
+    }
+    assert entries[0][1][1]["control"] == {"title": "Limbus, left"}
+
+    path.write_text(CSV_TEXT + "GSE2,2,control,title,Sclera\n", encoding="utf-8")
+    entries = load.iter_input(path)
+    assert next(entries)[0] == "GSE2"
+    with pytest.raises(load.InputError, match=r"regex.csv:9: row 8: Rows of GSE2"):
+        next(entries)
+
+    path.write_text(CSV_TEXT.replace(",mock", ""), encoding="utf-8")
+    with pytest.raises(load.InputError, match=r"regex.csv:3: row 2: Expected 5"):
+        load.load_input(path)
+
+
+def test_iter_yaml(tmp_path: Path) -> None:
+    path = tmp_path.joinpath("regex.yaml")
+    path.write_text(
+        """GSE1:
+- control: {title: Cornea}
+  treatment: {title: Cornea}
+---
+GSE2:
+- control: {title: Limbus}
+  treatment: {title: 1}
+""",
+        encoding="utf-8",
+    )
+    entries = load.iter_input(path)
+    # the first document is available before the second one is parsed
+    assert next(entries) == (
+        "GSE1",
+        [{"control": {"title": "Cornea"}, "treatment": {"title": "Cornea"}}],
+    )
+    with pytest.raises(load.InputError, match=r"regex.yaml:7: Regular expression"):
+        next(entries)
+
+    path.write_text("GSE1:\n- control: {title: A}\n---\nGSE1: []\n", encoding="utf-8")
+    with pytest.raises(load.InputError, match=r"regex.yaml:4: Duplicate GSE1"):
+        load.load_input(path)
+    path.write_text("GSE1:\n- control: {title: [A\n", encoding="utf-8")
+    with pytest.raises(load.InputError, match="regex.yaml"):
+        load.load_input(path)
+
+
+def test_main_stream(tmp_path: Path) -> None:
+    src_dir = tmp_path.joinpath("raw")
+    write_series(src_dir, "GSE1")
+    path = tmp_path.joinpath("regex.yaml")
+    path.write_text(
+        """GSE1:
+- control: {title: Cornea_mock}
+  treatment: {title: Cornea_SARS}
+---
+GSE2: []
+""",
+        encoding="utf-8",
+    )
+    events: list[StageEvent] = []
+    with pytest.raises(load.InputError, match=r"regex.yaml:5: GSE2 must be"):
+        __main__.main(
+            geo_regex_path=path,
+            src_dir=src_dir,
+            save_to=tmp_path.joinpath("count"),
+            hooks=[events.append],
+        )
+
+    # the first series is saved before the second one is read
+    assert tmp_path.joinpath("count", "GSE1-1.tsv").is_file()
+    loads = [e for e in events if e.stage == "load_input"]
+    assert [(e.gse_acc, e.rows) for e in loads] == [("GSE1", 1), (None, None)]
+    assert loads[1].error.startswith("InputError")
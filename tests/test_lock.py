@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+from ncbi_counts import fetch, lock, utils
+from tests.synthetic import BODY, FlakyHandler, serve
+
+pytestmark = pytest.mark.skipif(lock.fcntl is None, reason="files are not locked")
+
+
+@pytest.fixture
+def server() -> Iterator[str]:
+    with serve() as url:
+        yield url
+
+
+def test_fetch_once(server: str, tmp_path: Path) -> None:
+    path = tmp_path.joinpath("file.gz")
+    state_dir = tmp_path.joinpath("state")
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        paths = list(
+            executor.map(
+                lambda _: fetch.fetch(
+                    server + "/file.gz", path, state_dir=state_dir, silent=True
+                ),
+                range(4),
+            )
+        )
+    assert paths == [path] * 4
+    assert path.read_bytes() == BODY
+    assert len(FlakyHandler.requests) == 1
+
+
+def test_lease(server: str, tmp_path: Path) -> None:
+    path = tmp_path.joinpath("file.gz")
+    derived = tmp_path.joinpath("file.gz.cache")
+    with utils.lease(server + "/file.gz", path, silent=True) as leased:
+        assert leased == path
+        derived.mkdir()
+        # in use, so kept
+        assert not utils.remove_download(path, [derived])
+        assert path.read_bytes() == BODY
+    assert utils.remove_download(path, [derived])
+    assert not path.exists() and not derived.exists()
+    assert not any(utils.get_download_state_dir(path).iterdir())
+
+    # removed files are downloaded again
+    with utils.lease(server + "/file.gz", path, silent=True) as leased:
+        assert leased.read_bytes() == BODY
+    assert len(FlakyHandler.requests) == 2
+
+    with pytest.warns(UserWarning, match="Cannot download"), utils.lease(
+        server + "/missing.gz", tmp_path.joinpath("missing.gz"), silent=True
+    ) as leased:
+        assert leased is None
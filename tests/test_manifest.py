@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+import copy
+from pathlib import Path
+import shutil
+
+from ncbi_counts import __main__, manifest, utils
+from ncbi_counts.types import GeoRegex
+from tests.synthetic import write_count, write_series
+
+GEO_REGEX: GeoRegex = {
+    "GSE1": [
+        {"control": {"title": "Cornea_mock"}, "treatment": {"title": "Cornea_SARS"}}
+    ],
+    "GSE2": [
+        {"control": {"title": "Limbus_mock"}, "treatment": {"title": "Limbus_SARS"}}
+    ],
+}
+
+
+def test_incremental(tmp_path: Path) -> None:
+    src_dir = tmp_path.joinpath("raw")
+    save_to = tmp_path.joinpath("count")
+    attributes = {gse: write_series(src_dir, gse) for gse in GEO_REGEX}
+    geo_regex = copy.deepcopy(GEO_REGEX)
+    geo_regex_path = tmp_path.joinpath("geo_regex.yaml")
+    utils.save_yaml(geo_regex, geo_regex_path)
+    kwargs = dict(
+        geo_regex_path=geo_regex_path,
+        keep_annot=["Symbol"],
+        src_dir=src_dir,
+        save_to=save_to,
+        to_yaml=tmp_path.joinpath("sample_gsms.yaml"),
+        incremental=True,
+    )
+
+    # Series are recorded only with incremental
+    series_dict = __main__.main(**{**kwargs, "incremental": False})
+    assert list(series_dict) == ["GSE1", "GSE2"]
+    assert not save_to.joinpath(manifest.RUN_MANIFEST_NAME).exists()
+    assert list(__main__.main(**kwargs)) == ["GSE1", "GSE2"]
+    assert save_to.joinpath(manifest.RUN_MANIFEST_NAME).is_file()
+    sample_gsms = tmp_path.joinpath("sample_gsms.yaml").read_text()
+
+    # Nothing changed
+    assert __main__.main(**kwargs) == {}
+    assert tmp_path.joinpath("sample_gsms.yaml").read_text() == sample_gsms
+
+    # Changed input, changed source, and removed output
+    geo_regex["GSE1"][0]["control"]["title"] = "Cornea_mock_1"
+    utils.save_yaml(geo_regex, geo_regex_path)
+    assert list(__main__.main(**kwargs)) == ["GSE1"]
+    count_path = manifest.get_source_paths("GSE2", src_dir)[1]
+    write_count(count_path, list(attributes["GSE2"]), [1, 2], seed=1)
+    assert list(__main__.main(**kwargs)) == ["GSE2"]
+    save_to.joinpath("GSE2-1.tsv").unlink()
+    assert list(__main__.main(**kwargs)) == ["GSE2"]
+
+    assert __main__.main(**{**kwargs, "str_sep": "_"}).keys() == {"GSE1", "GSE2"}
+
+    # Removed sources are not a change
+    shutil.rmtree(src_dir)
+    assert __main__.main(**{**kwargs, "str_sep": "_"}) == {}
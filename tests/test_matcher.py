@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+import warnings
+
+import pytest
+
+from ncbi_counts import utils
+from ncbi_counts.matcher import SampleTable
+from ncbi_counts.types import PairGsms, PairRegex
+from tests.synthetic import gsm_attributes
+
+METADATA = gsm_attributes("GSE1")
+# an attribute with only empty values, and a GSM without characteristics
+METADATA["GSM1000"]["description"] = [""]
+del METADATA["GSM1003"]["characteristics_ch1"]
+
+PAIR_REGEX_LIST: list[PairRegex] = [
+    {
+        "control": {"title": "Cornea", "characteristics_ch1": "mock"},
+        "treatment": {"title": "Cornea", "characteristics_ch1": "SARS-CoV-2"},
+    },
+    {
+        "control": {"title": "^Limbus_mock_[12]$"},
+        "treatment": {"title": "Limbus", "description": "."},
+    },
+    {"control": {"geo_accession": "GSM100[0-2]$"}, "treatment": {}},
+]
+
+
+def reference_match_pair(pair_regex: PairRegex) -> PairGsms:
+    pair_gsms: PairGsms = {}
+    for group, attrib_regex in pair_regex.items():
+        gsms = [g for g, m in METADATA.items() if utils.is_matched(attrib_regex, m)]
+        if gsms:
+            pair_gsms[group] = gsms
+        else:
+            warnings.warn(f"No GSMs matched for {group}")
+    return pair_gsms
+
+
+@pytest.mark.parametrize("pair_regex", PAIR_REGEX_LIST)
+def test_match_pair(pair_regex: PairRegex) -> None:
+    with warnings.catch_warnings(record=True) as expected_warnings:
+        warnings.simplefilter("always")
+        expected = reference_match_pair(pair_regex)
+    with warnings.catch_warnings(record=True) as actual_warnings:
+        warnings.simplefilter("always")
+        actual = SampleTable.from_metadata(METADATA).match_pair(pair_regex)
+    assert actual == expected
+    assert [str(w.message) for w in actual_warnings] == [
+        str(w.message) for w in expected_warnings
+    ]
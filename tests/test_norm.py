@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ncbi_counts import norm, utils
+from ncbi_counts.core import Series
+from ncbi_counts.sparse import to_sparse_count
+from tests.synthetic import write_series
+
+
+def reference(count: pd.DataFrame, length: pd.Series) -> dict[str, pd.DataFrame]:
+    # NCBI's formulas, in float64
+    rpk = count.astype("float64").div(length.astype("float64"), axis=0)
+    return {
+        "fpkm": rpk * 1e9 / count.sum(),
+        "tpm": rpk * 1e6 / rpk.sum(),
+    }
+
+
+@pytest.fixture
+def sources(tmp_path: Path) -> tuple[Path, pd.DataFrame, pd.Series]:
+    src_dir = tmp_path.joinpath("raw")
+    write_series(src_dir, "GSE1", n_genes=200)
+    count = utils.read_count(next(src_dir.glob("GSE1_raw_counts_*")))
+    annot = pd.read_table(next(src_dir.glob("Human.*.annot.tsv.gz")), index_col=0)
+    return src_dir, count, annot["Length"]
+
+
+NCBI_DIR = Path("tests/data/norm")
+
+
+def test_normalize_counts_ncbi() -> None:
+    # raw counts and files normalized as NCBI does (rounded to 2 decimals)
+    count = utils.read_count(NCBI_DIR.joinpath("GSE1_raw_counts_GRCh38.p13_NCBI.tsv"))
+    length = pd.read_table(NCBI_DIR.joinpath("lengths.tsv"), index_col=0)["Length"]
+    normalized = norm.normalize_counts(count, length)
+    sparse = norm.normalize_counts(to_sparse_count(count), length)
+    for norm_type, actual in normalized.items():
+        ncbi = utils.read_count(
+            NCBI_DIR.joinpath(
+                f"GSE1_norm_counts_{norm_type.upper()}_GRCh38.p13_NCBI.tsv"
+            ),
+            norm_type=norm_type,
+        )
+        np.testing.assert_allclose(
+            actual, ncbi, rtol=norm.NORM_RTOL, atol=norm.NORM_ATOL
+        )
+        # sparse columns give the same values as dense ones
+        assert (sparse[norm_type].dtypes == pd.SparseDtype("float32", 0)).all()
+        pd.testing.assert_frame_equal(sparse[norm_type].sparse.to_dense(), actual)
+
+
+def test_normalize_counts(sources: tuple[Path, pd.DataFrame, pd.Series]) -> None:
+    _, count, length = sources
+    expected = reference(count, length)
+    normalized = norm.normalize_counts(count, length)
+    sparse = norm.normalize_counts(to_sparse_count(count), length, ["tpm"])
+    assert list(normalized) == ["fpkm", "tpm"]
+    for norm_type, actual in normalized.items():
+        assert (actual.dtypes == "float32").all()
+        np.testing.assert_allclose(actual, expected[norm_type], rtol=1e-6)
+        # files of NCBI are rounded to 2 decimals
+        np.testing.assert_allclose(
+            actual,
+            expected[norm_type].round(2),
+            rtol=norm.NORM_RTOL,
+            atol=norm.NORM_ATOL,
+        )
+    pd.testing.assert_frame_equal(sparse["tpm"].sparse.to_dense(), normalized["tpm"])
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_series_local_norm(
+    sources: tuple[Path, pd.DataFrame, pd.Series], sparse: bool
+) -> None:
+    src_dir, count, length = sources
+    series = Series(
+        "GSE1",
+        [{"control": {"title": "Cornea_mock"}, "treatment": {"title": "Cornea_SARS"}}],
+        count_norm_type="tpm",
+        local_norm=True,
+        src_dir=src_dir,
+        save_to=None,
+        sparse=sparse,
+    )
+    # only the raw counts are needed, which are present
+    assert series.plan()["sources"]["count"]["status"] == "present"
+    series.build()
+
+    pair_count = series.pair_count_list[0]
+    if sparse:
+        pair_count = pair_count.sparse.to_dense()
+    gsms = [col.split("-", 1)[1] for col in pair_count.columns]
+    expected = reference(count, length)["tpm"][gsms]
+    np.testing.assert_allclose(pair_count, expected, rtol=1e-6)
+
+
+def test_series_normalize(sources: tuple[Path, pd.DataFrame, pd.Series]) -> None:
+    src_dir, count, length = sources
+    pair_regex_list = [
+        {"control": {"title": "Cornea_mock"}, "treatment": {"title": "Cornea_SARS"}}
+    ]
+    series = Series("GSE1", pair_regex_list, src_dir=src_dir, save_to=None)
+    normalized = series.normalize()
+
+    assert list(normalized) == ["fpkm", "tpm"]
+    expected = reference(count, length)
+    for norm_type, actual in normalized.items():
+        np.testing.assert_allclose(
+            actual, expected[norm_type][actual.columns], rtol=1e-6
+        )
+    assert list(series.normalize(["tpm"])) == ["tpm"]
+    with pytest.raises(ValueError, match="normalized by NCBI"):
+        Series(
+            "GSE1",
+            pair_regex_list,
+            count_norm_type="tpm",
+            src_dir=src_dir,
+            save_to=None,
+        ).normalize()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+import filecmp
+from pathlib import Path
+import warnings
+
+from ncbi_counts import parallel
+from ncbi_counts.types import GeoRegex
+from tests.synthetic import write_series
+
+GEO_REGEX: GeoRegex = {
+    "GSE1": [
+        {
+            "control": {"title": "Cornea", "characteristics_ch1": "mock"},
+            "treatment": {"title": "Cornea", "characteristics_ch1": "SARS-CoV-2"},
+        },
+        {
+            "control": {"title": "Limbus", "characteristics_ch1": "mock"},
+            "treatment": {"title": "Limbus", "characteristics_ch1": "CoV-3"},
+        },
+    ],
+    "GSE2": [
+        {"control": {"title": "Sclera_mock"}, "treatment": {"title": "Sclera_SARS"}},
+    ],
+}
+
+
+def run(tmp_path: Path, max_workers: int | None) -> tuple[list, list[str]]:
+    src_dir = tmp_path.joinpath("raw")
+    for gse in GEO_REGEX:
+        write_series(src_dir, gse)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        results = list(
+            parallel.iter_series(
+                GEO_REGEX,
+                keep_annot=["Symbol", "Description"],
+                src_dir=src_dir,
+                save_to=tmp_path.joinpath("count"),
+                silent=False,
+                max_workers=max_workers,
+            )
+        )
+    return results, [str(w.message) for w in caught]
+
+
+def test_iter_series_parallel(tmp_path: Path) -> None:
+    serial, serial_warnings = run(tmp_path.joinpath("serial"), None)
+    para, para_warnings = run(tmp_path.joinpath("parallel"), 2)
+
+    assert [s.gse_acc for s, _ in para] == list(GEO_REGEX)
+    assert [s.pair_gsms_list for s, _ in para] == [s.pair_gsms_list for s, _ in serial]
+    assert para_warnings == serial_warnings
+    assert "No GSMs matched for treatment" in para_warnings
+    for (s, _), (p, _) in zip(serial, para):
+        assert len(p.pair_count_path_list) == len(s.pair_count_path_list) > 0
+        # matrices saved by workers are not sent back
+        assert p.count is None and len(p.pair_count_list) == 0
+        for s_path, p_path in zip(s.pair_count_path_list, p.pair_count_path_list):
+            assert s_path.name == p_path.name
+            assert filecmp.cmp(s_path, p_path, shallow=False)
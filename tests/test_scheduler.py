@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+
+from pathlib import Path
+import time
+
+from ncbi_counts import scheduler
+from tests.synthetic import BODY, FlakyHandler, serve
+
+
+def test_token_bucket() -> None:
+    bucket = scheduler.TokenBucket(rate=50)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # the first token is available at once
+    assert time.monotonic() - start >= 5 / 50 * 0.9
+
+
+def test_fetch_scheduler(tmp_path: Path) -> None:
+    names = [f"GSE{i}_family.soft.gz" for i in range(6)]
+    with serve() as url, scheduler.FetchScheduler(
+        rate=100, max_per_host=2
+    ) as fetch_scheduler:
+        FlakyHandler.actions = ["503"]
+        futures = [
+            fetch_scheduler.submit(f"{url}/{name}", tmp_path.joinpath(name))
+            for name in names
+        ]
+        # the same URL is downloaded once
+        assert fetch_scheduler.submit(f"{url}/{names[0]}", Path()) is futures[0]
+        missing = fetch_scheduler.submit(
+            f"{url}/missing.gz", tmp_path.joinpath("missing.gz")
+        )
+        assert [future.result() for future in futures] == [
+            tmp_path.joinpath(name) for name in names
+        ]
+        assert missing.result() is None
+    assert all(tmp_path.joinpath(name).read_bytes() == BODY for name in names)
+    assert len(FlakyHandler.requests) == len(names) + 2
+    # connections are kept alive and shared, at most 2 at once (+2 closed by errors)
+    assert len(FlakyHandler.clients) <= 2 + 2
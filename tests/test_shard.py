@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+import filecmp
+from pathlib import Path
+import subprocess
+import sys
+
+import pytest
+import yaml
+
+from ncbi_counts import __main__, parser, utils
+from ncbi_counts.manifest import RUN_MANIFEST_NAME
+from ncbi_counts.shard import Shard, assign_shards, merge_shards
+from tests.synthetic import write_series
+
+PAIR_REGEX = {
+    "control": {"title": "Cornea_mock"},
+    "treatment": {"title": "Cornea_SARS"},
+}
+
+
+def test_shard_parse() -> None:
+    assert Shard.parse("2/4") == Shard(2, 4)
+    assert str(Shard(2, 4)) == "2/4"
+    for text in ["0/4", "5/4", "2", "a/b"]:
+        with pytest.raises(ValueError):
+            Shard.parse(text)
+
+
+def test_parse_merge_args(tmp_path: Path) -> None:
+    # an input file may be named "merge"
+    assert parser.parse_args(["merge"]).input == Path("merge")
+    args = parser.parse_merge_args(["in.yaml", "gsms.1.yaml", "gsms.2.yaml"])
+    assert args.shard_yaml == [Path("gsms.1.yaml"), Path("gsms.2.yaml")]
+
+    geo_regex_path = tmp_path.joinpath("geo_regex.yaml")
+    utils.save_yaml({"GSE1": [PAIR_REGEX], "GSE2": [PAIR_REGEX]}, geo_regex_path)
+    utils.save_yaml({"GSE2": []}, tmp_path.joinpath("gsms.1.yaml"))
+    utils.save_yaml({"GSE1": []}, tmp_path.joinpath("gsms.2.yaml"))
+    yaml_paths = [tmp_path.joinpath(f"gsms.{i}.yaml") for i in [1, 2]]
+    args = [geo_regex_path, *yaml_paths, "-y", tmp_path.joinpath("gsms.yaml")]
+    args += ["-o", tmp_path]
+    subprocess.run(
+        [sys.executable, "-m", "ncbi_counts.merge", *map(str, args)], check=True
+    )
+    gsms_yaml = yaml.safe_load(tmp_path.joinpath("gsms.yaml").read_text())
+    assert gsms_yaml == {"GSE1": [], "GSE2": []}
+
+
+def test_assign_shards() -> None:
+    regex_dict = {f"GSE{i}": [PAIR_REGEX] * n for i, n in enumerate([1, 5, 2, 3, 1, 2])}
+    assigned = assign_shards(regex_dict, 3)
+    assert list(assigned) == list(regex_dict)
+    assert set(assigned.values()) <= {1, 2, 3}
+    # a series stays in its shard whatever else is in the input file
+    assert assign_shards({"GSE3": regex_dict["GSE3"]}, 3)["GSE3"] == assigned["GSE3"]
+
+    assigned = assign_shards(regex_dict, 2, weighted=True)
+    loads = [0, 0]
+    for gse, i in assigned.items():
+        loads[i - 1] += len(regex_dict[gse])
+    assert loads == [7, 7]
+
+
+def test_main_shard(tmp_path: Path) -> None:
+    src_dir = tmp_path.joinpath("raw")
+    regex_dict = {}
+    for gse in ["GSE5", "GSE1", "GSE4", "GSE2", "GSE3"]:
+        write_series(src_dir, gse)
+        regex_dict[gse] = [PAIR_REGEX]
+    geo_regex_path = tmp_path.joinpath("geo_regex.yaml")
+    utils.save_yaml(regex_dict, geo_regex_path)
+    kwargs = dict(
+        geo_regex_path=geo_regex_path,
+        keep_annot=["Symbol"],
+        src_dir=src_dir,
+        incremental=True,
+    )
+
+    __main__.main(
+        save_to=tmp_path.joinpath("one"),
+        to_yaml=tmp_path.joinpath("one", "gsms.yaml"),
+        **kwargs,
+    )
+    yaml_paths = []
+    for i in [1, 2, 3]:
+        yaml_paths.append(tmp_path.joinpath(f"gsms.{i}.yaml"))
+        __main__.main(
+            save_to=tmp_path.joinpath("sharded"),
+            to_yaml=yaml_paths[-1],
+            shard=Shard(i, 3),
+            weighted=True,
+            **kwargs,
+        )
+    samples_dict = merge_shards(
+        geo_regex_path,
+        yaml_paths,
+        to_yaml=tmp_path.joinpath("sharded", "gsms.yaml"),
+        save_to=tmp_path.joinpath("sharded"),
+    )
+
+    assert list(samples_dict) == list(regex_dict)
+    one_paths = sorted(p.name for p in tmp_path.joinpath("one").iterdir())
+    assert RUN_MANIFEST_NAME in one_paths
+    assert sorted(p.name for p in tmp_path.joinpath("sharded").iterdir()) == one_paths
+    for name in one_paths:
+        assert filecmp.cmp(
+            tmp_path.joinpath("one", name),
+            tmp_path.joinpath("sharded", name),
+            shallow=False,
+        ), f"Differs {name}"
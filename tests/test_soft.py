@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+import gzip
+from pathlib import Path
+
+from GEOparse import get_GEO
+
+from ncbi_counts import soft
+from tests.synthetic import gsm_attributes, write_soft
+
+SAMPLE_WITH_TABLE = """^SAMPLE = GSM9
+!Sample_title = with = equal sign
+!Sample_geo_accession = GSM9
+!Sample_description =
+!Sample_data_processing = counts!per_million
+#ID_REF =
+#VALUE = normalized count
+!sample_table_begin
+ID_REF\tVALUE
+1\t0.5
+!sample_table_end
+"""
+
+
+def test_parse_sample_metadata(tmp_path: Path) -> None:
+    soft_path = write_soft(
+        tmp_path.joinpath("GSE1_family.soft.gz"), "GSE1", gsm_attributes("GSE1")
+    )
+    with gzip.open(soft_path, "at", encoding="utf-8") as f:
+        f.write(SAMPLE_WITH_TABLE)
+    expected = {
+        name: gsm.metadata
+        for name, gsm in get_GEO(filepath=str(soft_path), silent=True).gsms.items()
+    }
+    actual = soft.parse_sample_metadata(soft_path)
+    assert actual == expected
+    assert list(actual) == list(expected)
+    assert actual["GSM9"]["title"] == ["with = equal sign"]
+
+
+def test_metadata_cache(tmp_path: Path) -> None:
+    soft_path = write_soft(
+        tmp_path.joinpath("GSE1_family.soft.gz"), "GSE1", gsm_attributes("GSE1")
+    )
+    assert soft.read_metadata_cache(soft_path) is None
+    gsm_metadata = soft.parse_sample_metadata(soft_path)
+    cache_path = soft.write_metadata_cache(gsm_metadata, soft_path)
+    assert cache_path == soft.get_metadata_cache_path(soft_path)
+    assert soft.read_metadata_cache(soft_path) == gsm_metadata
+
+    # SOFT file changed since cached
+    with gzip.open(soft_path, "at", encoding="utf-8") as f:
+        f.write(SAMPLE_WITH_TABLE)
+    assert soft.read_metadata_cache(soft_path) is None
+
+    # SOFT file removed (e.g. by cleanup)
+    soft_path.unlink()
+    assert soft.read_metadata_cache(soft_path) == gsm_metadata
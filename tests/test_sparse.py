@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from ncbi_counts import sparse, utils, writer
+from tests.synthetic import gene_ids, write_count
+
+GSMS = ["GSM1", "GSM2", "GSM3", "GSM4"]
+
+
+def test_read_sparse_count(tmp_path: Path) -> None:
+    count_path = write_count(tmp_path.joinpath("count.tsv.gz"), GSMS, gene_ids(50))
+    dense = utils.read_count(count_path, gsms=["GSM3", "GSM1"])
+    count = sparse.read_sparse_count(count_path, gsms=["GSM3", "GSM1"], chunksize=7)
+    assert count.dtypes.tolist() == [pd.SparseDtype("int32", 0)] * 2
+    assert count.index.dtype == "int64"
+    assert count.sparse.density < 1
+    pd.testing.assert_frame_equal(count.sparse.to_dense(), dense)
+
+
+def test_write_sparse(tmp_path: Path) -> None:
+    count_path = write_count(tmp_path.joinpath("count.tsv.gz"), GSMS, gene_ids(50))
+    dense = utils.read_count(count_path)
+    annot = pd.DataFrame(
+        {"Symbol": [f"GENE{gene}" for gene in dense.index] + ["EXTRA"]},
+        index=pd.Index(dense.index.tolist() + [10**6], name="GeneID"),
+    )
+    pair_gsms = {"control": ["GSM1", "GSM3"], "treatment": ["GSM2"]}
+    for count in (dense, sparse.to_sparse_count(dense)):
+        pair_count = utils.construct_pair_count(pair_gsms, count, annot=annot)
+        expected = pair_count.astype("float64").fillna(0).to_numpy()
+
+        data, indices, indptr = sparse.to_csc(pair_count)
+        actual = np.zeros(pair_count.shape)
+        for j in range(pair_count.shape[1]):
+            actual[indices[indptr[j] : indptr[j + 1]], j] = data[
+                indptr[j] : indptr[j + 1]
+            ]
+        np.testing.assert_array_equal(actual, expected)
+        assert len(data) == np.count_nonzero(expected)
+
+        paths = [tmp_path.joinpath("GSE1-1.mtx"), tmp_path.joinpath("GSE1-1.npz")]
+        for path in paths:
+            writer.write_pair_count_table(pair_count, path, path.suffix[1:])
+        genes_path, samples_path = sparse.get_sidecar_paths(paths[0])
+        assert pd.read_table(genes_path)["GeneID"].tolist() == annot.index.tolist()
+        assert pd.read_table(samples_path)["column"].tolist() == [
+            "control-GSM1",
+            "control-GSM3",
+            "treatment-GSM2",
+        ]
+
+        lines = paths[0].read_text().splitlines()
+        assert lines[0].startswith("%%MatrixMarket matrix coordinate")
+        assert lines[1] == f"{len(annot)} 3 {len(data)}"
+        rows, cols, values = np.loadtxt(lines[2:], ndmin=2).T
+        assert (values == expected[rows.astype(int) - 1, cols.astype(int) - 1]).all()
+
+        with np.load(paths[1]) as npz:
+            assert npz["format"] == b"csc"
+            assert npz["shape"].tolist() == list(pair_count.shape)
+            np.testing.assert_array_equal(npz["indptr"], indptr)
+            np.testing.assert_array_equal(npz["data"], data)
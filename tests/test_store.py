@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from ncbi_counts import store, utils
+from tests.synthetic import gene_ids, write_count
+
+GSMS = ["GSM1", "GSM2", "GSM3", "GSM4", "GSM5"]
+
+
+def test_count_store(tmp_path: Path) -> None:
+    count_path = write_count(tmp_path.joinpath("count.tsv.gz"), GSMS, gene_ids(50))
+    expected = utils.read_count(count_path)
+    count_store = store.CountStore.build(count_path, chunksize=7)
+    assert count_store.values.shape == (50, 5)
+    assert count_store.values.flags.f_contiguous
+    assert count_store.to_dataframe().equals(expected)
+
+    # contiguous GSMs are a view of the memory-mapped array
+    view = count_store.take(["GSM2", "GSM3"])
+    assert np.shares_memory(view.to_numpy(), count_store.values)
+    assert view.equals(expected[["GSM2", "GSM3"]])
+    gathered = count_store.take(["GSM5", "GSM1"])
+    assert gathered.equals(expected[["GSM5", "GSM1"]])
+
+
+def test_read_count_store(tmp_path: Path) -> None:
+    count_path = write_count(tmp_path.joinpath("count.tsv.gz"), GSMS, gene_ids(50))
+    count = store.read_count_store(count_path, gsms=["GSM4", "GSM9"])
+    assert count.equals(utils.read_count(count_path)[["GSM4"]])
+    assert store.get_store_path(count_path).joinpath(store.VALUES_FILENAME).is_file()
+    assert store.open_count_store(count_path).source == store.source_fingerprint(
+        count_path
+    )
+
+
+def test_open_count_store_concurrently(tmp_path: Path, monkeypatch) -> None:
+    count_path = write_count(tmp_path.joinpath("count.tsv.gz"), GSMS, gene_ids(50))
+    builds = []
+    build = store.CountStore.build
+
+    def counted_build(*args, **kwargs):
+        builds.append(args)
+        return build(*args, **kwargs)
+
+    monkeypatch.setattr(store.CountStore, "build", counted_build)
+    # locks of separate file descriptions exclude each other even in one process
+    with ThreadPoolExecutor(4) as pool:
+        stores = list(pool.map(lambda _: store.open_count_store(count_path), range(8)))
+    assert len(builds) == 1
+    expected = utils.read_count(count_path)
+    assert all(s.to_dataframe().equals(expected) for s in stores)
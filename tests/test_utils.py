@@ -1,8 +1,12 @@
 #!/usr/bin/env python
 
+import warnings
+
+import pandas as pd
 import pytest
 
 from ncbi_counts import utils
+from tests.synthetic import gene_ids, write_count
 
 params_is_matched = [
     ({"title": "Cornea", "characteristics_ch1": "mock"}, True),
@@ -22,3 +26,74 @@ def test_is_matched(attrib_regex, expected):
         ],
     }
     assert utils.is_matched(attrib_regex, gsm_metadata) is expected
+
+
+def test_read_count(tmp_path):
+    genes = gene_ids(30)
+    gsms = ["GSM1", "GSM2", "GSM3", "GSM4"]
+    count_path = write_count(tmp_path.joinpath("count.tsv.gz"), gsms, genes)
+    count = utils.read_count(count_path)
+    assert count.index.dtype == "int64"
+    assert count.dtypes.unique().tolist() == ["int32"]
+
+    # cells read as text (index as integer) must be written in the same way
+    str_count = pd.read_table(count_path, index_col=0, dtype=str)
+    str_count.index = str_count.index.astype(int)
+    pair_gsms = {"control": ["GSM3", "GSM1"], "treatment": ["GSM2"]}
+    expected = utils.construct_pair_count(pair_gsms, str_count)
+    actual = utils.construct_pair_count(pair_gsms, count)
+    assert actual.index.tolist() == sorted(genes)
+    assert actual.to_csv(sep="\t") == expected.to_csv(sep="\t")
+
+
+def test_read_count_gsms(tmp_path):
+    gsms = ["GSM1", "GSM2", "GSM3", "GSM4"]
+    count_path = write_count(tmp_path.joinpath("count.tsv.gz"), gsms, gene_ids(30))
+    # GSMs not in the file are skipped, and reported by construct_pair_count
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        count = utils.read_count(count_path, gsms=["GSM4", "GSM2", "GSM9"])
+    assert count.columns.tolist() == ["GSM2", "GSM4"]
+    assert count.equals(utils.read_count(count_path)[["GSM2", "GSM4"]])
+
+
+def test_construct_pair_count(tmp_path):
+    genes = gene_ids(30)
+    gsms = ["GSM1", "GSM2", "GSM3", "GSM4"]
+    count = utils.read_count(
+        write_count(tmp_path.joinpath("count.tsv.gz"), gsms, genes)
+    )
+    # unsorted rows, and an annotation with a gene not in count matrix
+    count = count.iloc[::-1]
+    annot = pd.DataFrame(
+        {"Symbol": [f"GENE{gene}" for gene in genes] + ["EXTRA"]},
+        index=pd.Index(genes + [10**6], name="GeneID"),
+    ).astype("category")
+    pair_gsms_list = [
+        {"control": ["GSM3", "GSM1"], "treatment": ["GSM2", "GSM9"]},
+        {"control": ["GSM9"], "treatment": ["GSM4"]},
+    ]
+    for a in (None, annot):
+        count_index = utils.PairCountIndex.from_count(count, annot=a)
+        for pair_gsms in pair_gsms_list:
+            with pytest.warns(UserWarning, match="GSMs matched"):
+                actual = utils.construct_pair_count(
+                    pair_gsms, count, annot=a, count_index=count_index
+                )
+            # joined by labels and sorted
+            expected = pd.concat(
+                ([] if a is None else [a])
+                + [
+                    count[sorted(set(gsms) & set(count.columns))].add_prefix(
+                        group + "-"
+                    )
+                    for group, gsms in pair_gsms.items()
+                ],
+                axis=1,
+            ).sort_index()
+            if a is not None:
+                expected = expected.set_index(["Symbol"], append=True)
+            pd.testing.assert_frame_equal(actual, expected)
+    with pytest.raises(ValueError, match="No GSMs matched for any group"):
+        with pytest.warns(UserWarning, match="No GSMs matched for control"):
+            utils.construct_pair_count({"control": ["GSM9"]}, count)
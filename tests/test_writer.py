@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+import gzip
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ncbi_counts import __main__, parser, writer
+
+
+def pair_counts(symbols: list) -> list[pd.DataFrame]:
+    rng = np.random.default_rng(0)
+    n = len(symbols)
+    index = pd.MultiIndex.from_arrays(
+        [
+            np.arange(n) * 3 + 1,
+            pd.Categorical(symbols),
+            pd.array(rng.choice([10, 200, None], n), dtype="Int64"),
+        ],
+        names=["GeneID", "Symbol", "Length"],
+    )
+    raw = rng.integers(0, 100, (n, 2)).astype("int32")
+    tpm = np.where(rng.random((n, 1)) < 0.2, np.nan, rng.random((n, 1)))
+    return [
+        pd.DataFrame(raw, index=index, columns=["control-GSM1", "treatment-GSM2"]),
+        pd.DataFrame(tpm.astype("float32"), index=index, columns=["control-GSM3"]),
+    ]
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+@pytest.mark.parametrize(
+    "symbols",
+    [
+        ["A1BG", 'with "quote"', "with\ttab", None] * 10,
+        ["A1BG", "with\nnewline"],  # cannot be split into lines
+    ],
+)
+def test_write_pair_counts(tmp_path: Path, symbols, compression) -> None:
+    pair_count_list = pair_counts(symbols)
+    suffix = writer.COMPRESSION_SUFFIXES[compression]
+    paths = [tmp_path.joinpath(f"GSE1-{i}.tsv{suffix}") for i in range(2)]
+    writer.write_pair_counts(pair_count_list, paths, compression, chunksize=7)
+    for pair_count, path in zip(pair_count_list, paths):
+        data = path.read_bytes()
+        if compression == "gzip":
+            data = gzip.decompress(data)
+        assert data.decode() == pair_count.to_csv(sep="\t", lineterminator="\n")
+    assert sorted(tmp_path.iterdir()) == paths
+
+
+def test_write_pair_counts_atomic(tmp_path: Path) -> None:
+    path = tmp_path.joinpath("GSE1-1.tsv")
+    path.write_text("old")
+    with pytest.raises(ValueError):
+        writer.write_pair_counts(pair_counts(["A1BG"])[:1], [path], "bz2")
+    assert path.read_text() == "old"
+    assert list(tmp_path.iterdir()) == [path]
+
+
+@pytest.mark.parametrize("output_format", ["parquet", "feather"])
+def test_write_pair_count_table(tmp_path: Path, output_format) -> None:
+    pytest.importorskip("pyarrow")
+    pair_count = pair_counts(["A1BG", None, "A2M"])[0]
+    path = tmp_path.joinpath(
+        "GSE1-1" + writer.get_pair_count_suffix(output_format, "zstd")
+    )
+    writer.write_pair_counts([pair_count], [path], "zstd", output_format=output_format)
+    read = getattr(pd, f"read_{output_format}")
+    actual = read(path)
+    assert actual.index.names == pair_count.index.names
+    assert isinstance(actual.index.levels[1].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(actual, pair_count, check_index_type=False)
+    assert read(path, columns=["treatment-GSM2"]).columns.tolist() == ["treatment-GSM2"]
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_write_h5ad(tmp_path: Path) -> None:
+    anndata = pytest.importorskip("anndata")
+    pair_count = pair_counts(["A1BG", None, "A2M"])[0]
+    paths = [tmp_path.joinpath(f"GSE1-{i}.h5ad") for i in range(3)]
+    consolidated = pair_count.set_axis(["GSM1", "GSM2"], axis=1)
+    # a pair without GSMs keeps its annotation
+    writer.write_pair_counts(
+        [pair_count, consolidated, pair_count.iloc[:, :0]],
+        paths,
+        "gzip",
+        output_format="h5ad",
+    )
+
+    adata = anndata.read_h5ad(paths[0])
+    np.testing.assert_array_equal(adata.X, pair_count.to_numpy().T)
+    assert adata.obs["group"].tolist() == ["control", "treatment"]
+    assert adata.obs["gsm"].tolist() == ["GSM1", "GSM2"]
+    assert adata.var.index.tolist() == ["1", "4", "7"]
+    assert adata.var["Symbol"].tolist()[::2] == ["A1BG", "A2M"]
+    adata = anndata.read_h5ad(paths[1])
+    assert "group" not in adata.obs
+    assert adata.obs["gsm"].tolist() == ["GSM1", "GSM2"]
+    adata = anndata.read_h5ad(paths[2])
+    assert adata.shape == (0, 3)
+    assert adata.var["Symbol"].tolist()[::2] == ["A1BG", "A2M"]
+
+
+def test_write_hdf5(tmp_path: Path) -> None:
+    pytest.importorskip("tables")
+    pair_count = pair_counts(["A1BG", None, "A2M"])[0]
+    path = tmp_path.joinpath("GSE1-1.h5")
+    writer.write_pair_counts([pair_count], [path], output_format="hdf5")
+    actual = pd.read_hdf(path, writer.HDF5_KEY)
+    assert actual.columns.tolist() == [*pair_count.index.names, *pair_count.columns]
+    pd.testing.assert_frame_equal(
+        actual[pair_count.columns], pair_count.reset_index(drop=True)
+    )
+    assert actual["Symbol"].tolist()[::2] == ["A1BG", "A2M"]
+    # GeneID and annotation can be queried
+    selected = pd.read_hdf(path, writer.HDF5_KEY, where="GeneID > 1")
+    assert selected["GeneID"].tolist() == [4, 7]
+
+
+def test_get_pair_count_suffix() -> None:
+    assert writer.get_pair_count_suffix() == ".tsv"
+    assert writer.get_pair_count_suffix("tsv", "gzip") == ".tsv.gz"
+    assert writer.get_pair_count_suffix("hdf5") == ".h5"
+    with pytest.raises(ValueError):
+        writer.get_pair_count_suffix("feather", "gzip")
+
+
+def test_check_output_format(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    writer.check_output_format("tsv", "gzip")
+    with pytest.raises(ValueError):
+        writer.check_output_format("feather", "gzip")
+    monkeypatch.setattr(writer, "zstd", None)
+    with pytest.raises(ImportError, match="zstandard"):
+        writer.check_output_format("tsv", "zstd")
+    with pytest.raises(SystemExit):
+        parser.parse_args(["geo_regex.yaml", "-z", "zstd"])
+
+    # reported before any series is downloaded
+    src_dir = tmp_path.joinpath("raw")
+    with pytest.raises(ImportError, match="zstandard"):
+        __main__.main(
+            tmp_path.joinpath("geo_regex.yaml"),
+            src_dir=src_dir,
+            save_to=tmp_path.joinpath("count"),
+            compression="zstd",
+        )
+    assert not src_dir.exists()